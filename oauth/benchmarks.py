@@ -0,0 +1,26 @@
+""" Startup benchmarks for the provider clients.
+
+  python manage.py benchmark startup
+"""
+from statistics import median
+
+from stuff7.utils.benchmark import import_times
+
+# What a worker imports before serving its first request
+startup_code = "import django; django.setup(); import stuff7.urls, stuff7.routing"
+
+def startup(repeat=5):
+  """ Importing the URLs and ASGI routes in a new interpreter,
+  us is the median time (-X importtime) spent importing them
+  leaving out channels' own HTTP handler """
+  runs = [import_times(startup_code) for _ in range(repeat)]
+  seconds = median(times["stuff7.urls"] + times["oauth.routing"] for times in runs)/1e6
+  return {
+    "ops": round(1/seconds, 2),
+    "us": round(seconds*1e6, 3),
+    "modules": len(runs[0]),
+  }
+
+benchmarks = {
+  "startup": startup,
+}
@@ -0,0 +1,93 @@
+import os
+from time import time
+from threading import Thread, Event, Lock
+
+from django.db import transaction, close_old_connections
+
+from oauth.models import OAuthCredentials
+
+class CredentialsRefresher:
+  """ Renews the client credentials of an OAuth client before they expire.
+  Every process runs its own background thread but the renewal happens
+  with the credentials row locked, whoever gets the lock first fetches a
+  new token and everyone else just reads it. Requests keep using the
+  current token in the meantime so they never wait for a renewal. """
+
+  def __init__(self, client, margin=5*60, interval=60):
+    """ Constructs a new credentials refresher
+
+    :param OAuthClient client: Client whose credentials are renewed
+    :param float margin: Seconds before expiring when the token is renewed
+    :param float interval: Maximum seconds between checks, also used
+    to wait before trying again after a failure """
+    self.client = client
+    self.margin = margin
+    self.interval = interval
+    self._lock = Lock()
+    self._stopped = Event()
+    self._thread = None
+    self._pid = None
+
+  @property
+  def running(self):
+    return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+  def start(self):
+    """ Starting the background thread if it isn't running in this process.
+    Cheap enough to call on every request. """
+    if self.running:
+      return
+    with self._lock:
+      if self.running:
+        return
+      self._pid = os.getpid()
+      self._stopped.clear()
+      self._thread = Thread(target=self.run, daemon=True, name=f"{self.client.provider}-credentials")
+      self._thread.start()
+
+  def stop(self):
+    self._stopped.set()
+
+  def expiring(self, credentials):
+    """ Whether some credentials have to be renewed already.
+
+    :param dict credentials: Token object
+
+    :return bool: True if missing or about to expire """
+    return not credentials or credentials["expires_at"] - self.margin <= time()
+
+  def wait(self):
+    """ Seconds until the current credentials have to be renewed """
+    credentials = self.client.credentials
+    if not credentials:
+      return 0
+    return max(0, min(credentials["expires_at"] - self.margin - time(), self.interval))
+
+  def run(self):
+    while not self._stopped.wait(self.wait()):
+      if not self.expiring(self.client.credentials):
+        continue
+      try:
+        self.refresh()
+      except Exception:
+        # Keep the current token and try again later
+        self._stopped.wait(self.interval)
+      finally:
+        close_old_connections()
+
+  def refresh(self):
+    """ Renewing the client credentials unless another worker already did.
+
+    :return dict: Current credentials """
+    with transaction.atomic():
+      credentials = OAuthCredentials.objects.select_for_update().filter(pk=self.client.provider).first()
+      if credentials is not None and not self.expiring({ "expires_at": credentials.expires_at }):
+        token = self.client.credentials_dict(credentials)
+      else:
+        token = self.client.fetch_credentials()
+        OAuthCredentials.objects.update_or_create(
+          id=self.client.provider,
+          defaults=self.client.credentials_fields(token),
+        )
+    self.client.credentials = token
+    return token
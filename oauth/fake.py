@@ -0,0 +1,337 @@
+""" Local stand-in for the Twitch and Mixer APIs.
+
+  python -m oauth.fake --port 8100 --latency 0.05 --jitter 0.1 --error-rate 0.01 --quota 800
+
+Point stuff7 at it with TWITCH_API_URL, TWITCH_TOKEN_URL and MIXER_API_URL.
+"""
+import json
+import argparse
+from math import ceil
+from random import Random
+from time import sleep, time
+from zlib import crc32
+from collections import deque
+from threading import Thread, Lock
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class FakeProvider(ThreadingHTTPServer):
+  """ Local stand-in for the provider APIs used by the OAuth clients.
+  Every login is an existing user unless it starts with "unknown",
+  every channel is live unless it starts with "offline" and everybody
+  follows everybody unless the follower starts with "lonely". Listing
+  a channel's followers gives follower0, follower1... up to followers.
+  With a quota it enforces a rate limit like Helix does, responding
+  with 429 Too Many Requests once the quota is spent. With an error
+  rate that fraction of the API requests fails with 500. """
+  daemon_threads = True
+
+  def __init__(self, address=("127.0.0.1", 0), latency=0, quota=None, period=60,
+    jitter=0, error_rate=0, seed=None, followers=0, history=1000):
+    """ Constructs a new stand-in provider
+
+    :param tuple address: Host and port to listen on, port 0 picks a free one
+    :param float latency: Seconds to wait before every response
+    :param int quota: Requests allowed every period, None for no limit
+    :param float period: Seconds until the quota is restored
+    :param float jitter: Maximum random seconds added to the latency
+    :param float error_rate: Fraction of API requests failing with 500
+    :param int seed: Seed for the jitter and the errors
+    :param int followers: Followers listed for every channel
+    :param int history: Paths of the latest requests kept in paths """
+    super().__init__(address, FakeHelixHandler)
+    self.latency = latency
+    self.jitter = jitter
+    self.error_rate = error_rate
+    self.random = Random(seed)
+    self.random_lock = Lock()
+    self.errors = 0
+    self.quota = quota
+    self.period = period
+    self.remaining = quota
+    self.reset = time() + period
+    self.limited = 0
+    self.quota_lock = Lock()
+    # Counters and the latest paths only, a long load test
+    # would fill the memory keeping every request
+    self.requests = 0
+    self.connections = 0
+    self.paths = deque(maxlen=history)
+    self.stats_lock = Lock()
+    self.followers = followers
+    self.epoch = datetime(2018, 3, 1, 12, tzinfo=timezone.utc)
+
+  @property
+  def url(self):
+    host, port = self.server_address[:2]
+    return f"http://{host}:{port}"
+
+  def start(self):
+    """ Serving requests in a background thread """
+    Thread(target=self.serve_forever, daemon=True).start()
+    return self
+
+  def stop(self):
+    self.shutdown()
+    self.server_close()
+
+  def record(self, path=None):
+    """ Counting a request and keeping its path, a new connection without a path """
+    with self.stats_lock:
+      if path is None:
+        self.connections += 1
+        return
+      self.requests += 1
+      self.paths.append(path)
+
+  def spend(self):
+    """ Spending a request from the quota.
+
+    :return dict: Rate limit headers, None if the quota is spent """
+    if self.quota is None:
+      return {}
+    with self.quota_lock:
+      if time() >= self.reset:
+        self.remaining = self.quota
+        self.reset = time() + self.period
+      if self.remaining <= 0:
+        self.limited += 1
+        return None
+      self.remaining -= 1
+      return self.ratelimit_headers()
+
+  def delay(self):
+    """ Seconds to wait before a response """
+    if not self.jitter:
+      return self.latency
+    with self.random_lock:
+      return self.latency + self.random.uniform(0, self.jitter)
+
+  def failing(self):
+    """ Whether the current request has to fail """
+    if not self.error_rate:
+      return False
+    with self.random_lock:
+      failed = self.random.random() < self.error_rate
+      self.errors += failed
+      return failed
+
+  def ratelimit_headers(self):
+    return {
+      "Ratelimit-Limit": str(self.quota),
+      "Ratelimit-Remaining": str(self.remaining),
+      "Ratelimit-Reset": str(ceil(self.reset)),
+    }
+
+  def user(self, login):
+    """ User for a login or id, None if it doesn't exist.
+    Ids are the login's bytes as a number so they can be told
+    apart without remembering every login ever requested. """
+    login = login.lower()
+    if login.isdigit():
+      login = self.login(login)
+    if login is None or login.startswith("unknown"):
+      return None
+    user_id = str(int.from_bytes(login.encode(), "big"))
+    return {
+      "id": user_id,
+      "login": login,
+      "display_name": login.capitalize(),
+      "profile_image_url": f"https://example.com/{login}.png",
+    }
+
+  def login(self, user_id):
+    """ Login a user id was made from, None if it isn't one """
+    number = int(user_id)
+    try:
+      login = number.to_bytes((number.bit_length() + 7)//8, "big").decode()
+    except UnicodeDecodeError:
+      return None
+    return login if login.isprintable() and login == login.lower() else None
+
+  def date(self, *keys):
+    """ Stable date for a set of keys """
+    seconds = crc32(":".join(keys).encode()) % (3*365*24*60*60)
+    return (self.epoch + timedelta(seconds=seconds)).isoformat().replace("+00:00", "Z")
+
+  def channel(self, name):
+    """ Mixer channel for a name or id, None if it doesn't exist """
+    user = self.user(str(name))
+    return user and {
+      "id": int(user["id"]),
+      "userId": int(user["id"]),
+      "token": user["display_name"],
+      "online": not user["login"].startswith("offline"),
+      "createdAt": self.date("joined", user["login"]),
+    }
+
+class FakeHelixHandler(BaseHTTPRequestHandler):
+  """ Twitch Helix users, streams and users/follows endpoints,
+  Mixer channels, channels/{id}/follow and channels/{id}/broadcast
+  endpoints plus the client credentials token endpoint. """
+  protocol_version = "HTTP/1.1"
+  # Headers and body are written separately, without this every
+  # keep-alive response waits for the client's delayed ACK
+  disable_nagle_algorithm = True
+
+  def setup(self):
+    super().setup()
+    self.server.record()
+
+  def do_GET(self):
+    self.server.record(self.path)
+    resource, _, query = self.path.lstrip("/").partition("?")
+    params = parse_qs(query)
+    routes = {
+      "users": self.users,
+      "streams": self.streams,
+      "users/follows": self.follows,
+    }
+    headers = self.server.spend()
+    if headers is None:
+      return self.reply(429, {"error": "Too Many Requests", "status": 429}, self.server.ratelimit_headers())
+    if self.server.failing():
+      return self.reply(500, {"error": "Internal Server Error", "status": 500}, headers)
+    if resource.startswith("channels/"):
+      return self.reply(*self.channels(resource.split("/")[1:], params), headers)
+    if resource not in routes:
+      return self.reply(404, {"error": "Not Found", "status": 404}, headers)
+    if resource == "users/follows" and "from_id" not in params:
+      return self.reply(200, self.follower_page(params), headers)
+    self.reply(200, {"data": routes[resource](params)}, headers)
+
+  def do_POST(self):
+    self.server.record(self.path)
+    self.rfile.read(int(self.headers.get("Content-Length", 0)))
+    self.reply(200, {
+      "access_token": "fake-access-token",
+      "expires_in": 60*60,
+      "expires_at": time() + 60*60,
+      "scope": [],
+      "token_type": "bearer",
+    })
+
+  def users(self, params):
+    users = (self.server.user(login) for login in (*params.get("id", ()), *params.get("login", ())))
+    return [user for user in users if user]
+
+  def streams(self, params):
+    users = (self.server.user(login) for login in params.get("user_login", ()))
+    return [{
+      "user_id": user["id"],
+      "user_login": user["login"],
+      "user_name": user["display_name"],
+      "started_at": self.server.date("stream", user["login"]),
+    } for user in users if user and not user["login"].startswith("offline")]
+
+  def follows(self, params):
+    follower = self.server.user(params["from_id"][0])
+    channel = self.server.user(params["to_id"][0])
+    if not (follower and channel) or follower["login"].startswith("lonely"):
+      return []
+    return [{
+      "from_id": follower["id"],
+      "from_name": follower["display_name"],
+      "to_id": channel["id"],
+      "to_name": channel["display_name"],
+      "followed_at": self.server.date("follow", follower["login"], channel["login"]),
+    }]
+
+  def follower_page(self, params):
+    """ Page of a channel's followers, the cursor is the offset of the next page """
+    channel = self.server.user(params["to_id"][0])
+    total = self.server.followers if channel else 0
+    start = int(params.get("after", ["0"])[0])
+    end = min(start + int(params.get("first", ["20"])[0]), total)
+    followers = (self.server.user(f"follower{i}") for i in range(start, end))
+    return {
+      "total": total,
+      "data": [{
+        "from_id": follower["id"],
+        "from_name": follower["display_name"],
+        "to_id": channel["id"],
+        "to_name": channel["display_name"],
+        "followed_at": self.server.date("follow", follower["login"], channel["login"]),
+      } for follower in followers],
+      "pagination": { "cursor": str(end) } if end < total else {},
+    }
+
+  def channels(self, parts, params):
+    """ Mixer channel endpoints
+
+    :return tuple: Status and response """
+    not_found = (404, { "statusCode": 404, "error": "Not Found", "message": "Channel not found." })
+    channel = self.server.channel(parts[0])
+    if channel is None:
+      return not_found
+    if parts[1:] == []:
+      return 200, channel
+    if parts[1:] == ["follow"]:
+      # where=username:eq:{follower}
+      follower = self.server.channel(params.get("where", [""])[0].rpartition(":")[2])
+      if follower is None or follower["token"].lower().startswith("lonely"):
+        return 200, []
+      return 200, [{
+        "id": follower["userId"],
+        "username": follower["token"],
+        "followed": { "createdAt": self.server.date("follow", follower["token"].lower(), channel["token"].lower()) },
+      }]
+    if parts[1:] == ["broadcast"]:
+      if not channel["online"]:
+        return not_found
+      return 200, {
+        "online": True,
+        "channelId": channel["id"],
+        "startedAt": self.server.date("stream", channel["token"].lower()),
+      }
+    return not_found
+
+  def reply(self, status, data, headers=None):
+    delay = self.server.delay()
+    if delay:
+      sleep(delay)
+    body = json.dumps(data).encode()
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(body)))
+    for header, value in (headers or {}).items():
+      self.send_header(header, value)
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=8100)
+  parser.add_argument("--latency", type=float, default=0, help="Seconds to wait before every response")
+  parser.add_argument("--jitter", type=float, default=0, help="Maximum random seconds added to the latency")
+  parser.add_argument("--error-rate", type=float, default=0, help="Fraction of API requests failing with 500")
+  parser.add_argument("--quota", type=int, default=None, help="Requests allowed every period")
+  parser.add_argument("--period", type=float, default=60, help="Seconds until the quota is restored")
+  parser.add_argument("--seed", type=int, default=None)
+  parser.add_argument("--followers", type=int, default=0, help="Followers listed for every channel")
+  args = parser.parse_args()
+  provider = FakeProvider(
+    (args.host, args.port),
+    latency=args.latency,
+    quota=args.quota,
+    period=args.period,
+    jitter=args.jitter,
+    error_rate=args.error_rate,
+    seed=args.seed,
+    followers=args.followers,
+  )
+  print(f"TWITCH_API_URL={provider.url}")
+  print(f"TWITCH_TOKEN_URL={provider.url}/oauth2/token")
+  print(f"MIXER_API_URL={provider.url}", flush=True)
+  try:
+    provider.serve_forever()
+  except KeyboardInterrupt:
+    provider.server_close()
+
+if __name__ == "__main__":
+  main()
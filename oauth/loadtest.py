@@ -0,0 +1,291 @@
+""" Load test comparing sync gunicorn workers with the async Text APIs.
+
+Runs a stand-in provider locally, starts each server pointing at it and
+fires concurrent uptime requests for distinct channels (so the response
+cache doesn't hide the upstream latency).
+
+  python -m oauth.loadtest --workers 4 --concurrency 200 --requests 2000
+
+With --url it replays a mix of chat bot commands against a running
+server instead (see python -m oauth.fake to run it without Twitch).
+
+  python -m oauth.loadtest --url http://localhost:8000 --providers twitch,mixer
+"""
+import os
+import sys
+import json
+import socket
+import asyncio
+import argparse
+import subprocess
+from time import sleep, perf_counter
+from random import Random
+from urllib.parse import urlencode
+from collections import defaultdict, Counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import httpx
+
+from oauth.fake import FakeProvider
+
+root = Path(__file__).resolve().parent.parent
+scripts = Path(sys.executable).parent
+
+def free_port():
+  with socket.socket() as s:
+    s.bind(("127.0.0.1", 0))
+    return s.getsockname()[1]
+
+def wait_for(port, timeout=30):
+  """ Waiting until a server accepts connections """
+  for _ in range(int(timeout/0.1)):
+    with socket.socket() as s:
+      if s.connect_ex(("127.0.0.1", port)) == 0:
+        return
+    sleep(0.1)
+  raise TimeoutError(f"Nothing listening on port {port}")
+
+# Names the error a Text API answered with (see TextAPI.error_header),
+# error answers are 200 text responses like every other answer
+error_header = "X-TextAPI-Error"
+
+def percentile(values, p):
+  values = sorted(values)
+  return values[min(len(values)-1, int(len(values)*p/100))] if values else None
+
+async def load(url, paths, concurrency, label=None):
+  """ Requesting every path with at most concurrency requests in flight.
+
+  :param str url: Server url
+  :param list paths: Paths to request
+  :param int concurrency: Maximum number of concurrent requests
+  :param Callable[[str], str] label: Groups the paths (e.g. by command)
+  to also report the results of every group
+
+  :return dict: Throughput, latency percentiles (ms) of the answers
+  and the errors by kind, error answers (not live, rate limited...)
+  and failed requests count as errors """
+  latencies = defaultdict(list)
+  errors = defaultdict(Counter)
+  queue = iter(paths)
+  pool_limits = httpx.PoolLimits(soft_limit=concurrency, hard_limit=concurrency)
+
+  async with httpx.AsyncClient(base_url=url, timeout=60, pool_limits=pool_limits) as client:
+    async def worker():
+      for path in queue:
+        group = label(path) if label else None
+        start = perf_counter()
+        try:
+          response = await client.get(path)
+          response.raise_for_status()
+        except httpx.HTTPError as e:
+          errors[group][type(e).__name__] += 1
+          continue
+        if error_header in response.headers:
+          errors[group][response.headers[error_header]] += 1
+        else:
+          latencies[group].append((perf_counter() - start)*1000)
+
+    start = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = perf_counter() - start
+
+  results = summary(
+    [latency for group in latencies.values() for latency in group],
+    sum(errors.values(), Counter()),
+    elapsed,
+  )
+  if label:
+    results["commands"] = {
+      group: summary(latencies[group], errors[group], elapsed)
+      for group in sorted(set(latencies) | set(errors))
+    }
+  return results
+
+def summary(latencies, errors, elapsed):
+  """ Throughput and latency percentiles (ms) of some requests
+
+  :param list latencies: Milliseconds taken by every answer
+  :param Counter errors: Number of errors by kind
+  :param float elapsed: Seconds taken by every request """
+  return {
+    "requests": len(latencies) + sum(errors.values()),
+    "errors": sum(errors.values()),
+    "error_kinds": dict(sorted(errors.items())),
+    "seconds": round(elapsed, 3),
+    "throughput": round(len(latencies)/elapsed, 2),
+    "p50": round(percentile(latencies, 50) or 0, 2),
+    "p90": round(percentile(latencies, 90) or 0, 2),
+    "p99": round(percentile(latencies, 99) or 0, 2),
+  }
+
+# Relative frequency of every command, Twitch doesn't offer account dates
+commands = {
+  "twitch": { "uptime": 40, "followage": 35, "followdate": 10, "starttime": 15 },
+  "mixer": { "uptime": 35, "followage": 30, "followdate": 10, "starttime": 10, "joined": 5, "accountage": 10 },
+}
+messages = (
+  "{channel} has been streaming for <{hours} hour{hours(s)}> and <{minutes} minute{minutes(s)}>",
+  "{follower} sigue a {channel} desde hace <{years} año{years(s)}>, <{months} mes{months(es)}> y <{days} día{days(s)}>",
+  "[{hours:02d}:{minutes:02d}:{seconds:02d}]",
+  "{channel} went live on {date}",
+)
+timezones = ("", "", "", "pst_us", "-5", "Europe/Madrid", "tokyo", "bst_gb", "mexico", "ist_in")
+locales = ("", "", "", "es", "pt-BR", "de", "ja", "fr")
+formats = ("", "", "short", "medium", "long")
+
+def bot_commands(requests, providers=("twitch",), channels=200, seed=0):
+  """ Paths for a realistic mix of chat bot commands.
+  A few popular channels get most of the traffic, followers are mostly
+  different users, some channels are offline, some followers don't
+  follow and some names don't exist. About a third of the commands
+  customize the message, timezone, locale or date format.
+
+  :param int requests: Number of paths
+  :param tuple providers: Providers to spread the commands over
+  :param int channels: Number of distinct channels
+  :param int seed: Seed for the mix, the same seed gives the same paths
+
+  :return list: Paths """
+  random = Random(seed)
+  names = [
+    f"offline{rank}" if rank % 10 == 9 else f"unknown{rank}" if rank % 50 == 49 else f"channel{rank}"
+    for rank in range(channels)
+  ]
+  # Zipf-like popularity
+  popularity = [1/(rank + 1) for rank in range(channels)]
+  paths = []
+  for _ in range(requests):
+    provider = random.choice(providers)
+    resource = random.choices(*zip(*commands[provider].items()))[0]
+    channel = random.choices(names, popularity)[0]
+    params = {}
+    if resource.startswith("follow"):
+      follower = random.randrange(requests*10)
+      params["from"] = f"lonely{follower}" if random.random() < 0.05 else f"viewer{follower}"
+    if random.random() < 0.3:
+      params["msg"] = random.choice(messages)
+    if resource in ("followdate", "starttime", "joined"):
+      params.update({
+        key: value for key, value in (
+          ("tz", random.choice(timezones)),
+          ("locale", random.choice(locales)),
+          ("format", random.choice(formats)),
+        ) if value
+      })
+    query = f"?{urlencode(params)}" if params else ""
+    paths.append(f"/api/{provider}/{channel}/{resource}{query}")
+  return paths
+
+def command(path):
+  """ Provider and command of a Text API path """
+  _, _, provider, _, resource = path.split("?")[0].split("/")
+  return f"{provider}/{resource}"
+
+def replay(url, requests=2000, concurrency=50, providers=("twitch",), seed=0):
+  """ Replaying chat bot commands against a running server.
+
+  :param str url: Server url
+  :param int requests: Total requests
+  :param int concurrency: Concurrent requests
+  :param tuple providers: Providers to spread the commands over
+  :param int seed: Seed for the mix of commands
+
+  :return dict: Results overall and for every command """
+  paths = bot_commands(requests, providers, seed=seed)
+  return {
+    "settings": {
+      "url": url,
+      "requests": requests,
+      "concurrency": concurrency,
+      "providers": list(providers),
+      "seed": seed,
+    },
+    "results": asyncio.run(load(url, paths, concurrency, label=command)),
+  }
+
+def serve(command, port, env):
+  """ Starting a server process and waiting until it's ready """
+  process = subprocess.Popen(command, cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  try:
+    wait_for(port)
+  except TimeoutError:
+    process.kill()
+    raise
+  return process
+
+def compare(workers=4, concurrency=200, requests=2000, latency=0.1):
+  """ Running the same load against gunicorn and daphne.
+
+  :param int workers: Sync gunicorn workers
+  :param int concurrency: Concurrent requests
+  :param int requests: Total requests per server
+  :param float latency: Seconds the stand-in provider takes per response
+
+  :return dict: Results for each server """
+  provider = FakeProvider(latency=latency).start()
+  # Servers use a throwaway database, the developer's one is never touched
+  database = TemporaryDirectory()
+  env = {
+    **os.environ,
+    "DEBUG": "True",
+    "SQLITE_PATH": str(Path(database.name) / "db.sqlite3"),
+    # The rate limiter is per process without a shared cache, it would
+    # refuse requests long before gunicorn's workers together do
+    "TWITCH_RATE_LIMIT": "0",
+    "TWITCH_API_URL": provider.url,
+    "TWITCH_TOKEN_URL": f"{provider.url}/oauth2/token",
+  }
+
+  servers = {
+    "gunicorn": lambda port: [
+      scripts / "gunicorn", "stuff7.wsgi", "--preload",
+      "-w", str(workers), "-b", f"127.0.0.1:{port}",
+    ],
+    "daphne": lambda port: [
+      scripts / "daphne", "-b", "127.0.0.1", "-p", str(port), "stuff7.asgi:application",
+    ],
+  }
+  results = {
+    "settings": {
+      "workers": workers,
+      "concurrency": concurrency,
+      "requests": requests,
+      "latency": latency,
+    },
+  }
+  try:
+    subprocess.run([sys.executable, "manage.py", "migrate", "-v", "0"], cwd=root, env=env, check=True)
+    for name, command in servers.items():
+      port = free_port()
+      process = serve(command(port), port, env)
+      try:
+        paths = [f"/api/twitch/{name}{i}/uptime" for i in range(requests)]
+        results[name] = asyncio.run(load(f"http://localhost:{port}", paths, concurrency))
+      finally:
+        process.terminate()
+        process.wait()
+  finally:
+    provider.stop()
+    database.cleanup()
+  return results
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--workers", type=int, default=4)
+  parser.add_argument("--concurrency", type=int, default=200)
+  parser.add_argument("--requests", type=int, default=2000)
+  parser.add_argument("--latency", type=float, default=0.1)
+  parser.add_argument("--url", help="Replay bot commands against this running server")
+  parser.add_argument("--providers", default="twitch", help="Comma separated providers to replay commands for")
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+  if args.url:
+    results = replay(args.url, args.requests, args.concurrency, tuple(args.providers.split(",")), args.seed)
+  else:
+    results = compare(args.workers, args.concurrency, args.requests, args.latency)
+  print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,87 @@
+import json
+import platform
+import subprocess
+from importlib import import_module
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stuff7.utils.benchmark import diff
+
+# Modules with a benchmarks registry
+modules = (
+  "stuff7.utils.collections.benchmarks",
+  "stuff7.utils.parsers.benchmarks",
+  "oauth.textapis.benchmarks",
+  "oauth.benchmarks",
+  "user.benchmarks",
+)
+
+def registry():
+  """ Every benchmark by name """
+  benchmarks = {}
+  for module in modules:
+    benchmarks.update(import_module(module).benchmarks)
+  return benchmarks
+
+def revision():
+  """ Current commit if running from a git checkout """
+  try:
+    return subprocess.run(
+      ["git", "rev-parse", "--short", "HEAD"],
+      capture_output=True, text=True, check=True,
+    ).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+class Command(BaseCommand):
+  help = (
+    "Runs the parser, Text API, startup and user benchmarks and prints the results as JSON. "
+    "Save the output on a commit and pass it to --compare on another one "
+    "to get the speedup of every benchmark."
+  )
+  # The URL checks would import the provider clients before the
+  # end to end benchmarks point them at a local stand-in provider
+  requires_system_checks = False
+
+  def add_arguments(self, parser):
+    parser.add_argument("names", nargs="*", help="Benchmarks to run, all of them by default")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+    parser.add_argument("--output", help="Also write the results to this file")
+    parser.add_argument("--compare", help="Results of a previous run to compare against")
+
+  def handle(self, *args, **options):
+    benchmarks, names = registry(), options["names"]
+    if options["list"]:
+      for name, benchmark in benchmarks.items():
+        self.stdout.write(f"{name}: {(benchmark.__doc__ or '').strip()}")
+      return
+
+    unknown = set(names) - set(benchmarks)
+    if unknown:
+      raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    baseline = None
+    if options["compare"]:
+      with open(options["compare"]) as f:
+        baseline = json.load(f)
+
+    results = {
+      "revision": revision(),
+      "python": platform.python_version(),
+      "results": {},
+    }
+    for name in names or benchmarks:
+      self.stderr.write(f"Running {name}...")
+      results["results"][name] = benchmarks[name]()
+
+    if baseline is not None:
+      results["compare"] = {
+        "revision": baseline.get("revision"),
+        "results": diff(baseline["results"], results["results"]),
+      }
+
+    output = json.dumps(results, indent=2)
+    if options["output"]:
+      with open(options["output"], "w") as f:
+        f.write(output)
+    self.stdout.write(output)
@@ -0,0 +1,23 @@
+import atexit
+
+from stuff7.settings import METRICS
+from stuff7.utils.metrics import Registry
+
+registry = Registry(METRICS["DIR"], flush_interval=METRICS["FLUSH_INTERVAL"])
+atexit.register(registry.flush)
+
+request_seconds = registry.histogram(
+  "textapi_request_seconds",
+  "Seconds spent answering Text API requests by phase (upstream, db, format and total)",
+  ("provider", "resource", "phase"),
+)
+errors = registry.counter(
+  "textapi_errors_total",
+  "Text API requests answered with an error message",
+  ("provider", "resource", "error"),
+)
+upstream_responses = registry.counter(
+  "textapi_upstream_responses_total",
+  "Responses received from the providers by status code",
+  ("provider", "status"),
+)
@@ -0,0 +1,94 @@
+import re
+from functools import wraps, lru_cache
+
+from django.urls import resolve, get_resolver, Resolver404, URLResolver
+from django.urls.resolvers import RoutePattern, RegexPattern
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.exception import response_for_exception
+
+from stuff7.settings import PROFILING
+from stuff7.profiling import profiling_mode
+
+def fast_path(view):
+  """ Marks a view to be served by FastPathMiddleware,
+  only for anonymous read-only views that don't need the session. """
+  @wraps(view)
+  def fast_path_view(*args, **kwargs):
+    return view(*args, **kwargs)
+  fast_path_view.fast_path = True
+  return fast_path_view
+
+def literal(pattern):
+  """ Plain text every path matching a URL pattern starts with
+
+  :param pattern: Route or regex pattern
+
+  :return tuple: The text and whether it's the whole pattern """
+  if isinstance(pattern, RoutePattern):
+    route = str(pattern)
+    return route.partition("<")[0], "<" not in route
+  if isinstance(pattern, RegexPattern):
+    regex = str(pattern).lstrip("^")
+    text = re.match(r"[\w/-]*", regex).group()
+    return text, text == regex
+  return "", False
+
+@lru_cache(maxsize=None)
+def fast_path_prefixes(resolver):
+  """ Plain text every fast path view's path starts with
+
+  :param URLResolver resolver: Resolver of the urls to look into
+
+  :return tuple: Path prefixes without the leading slash """
+  prefixes = []
+  for pattern in resolver.url_patterns:
+    prefix, whole = literal(pattern.pattern)
+    if isinstance(pattern, URLResolver):
+      nested = fast_path_prefixes(pattern)
+      if whole:
+        prefixes.extend(prefix + nested_prefix for nested_prefix in nested)
+      elif nested:
+        prefixes.append(prefix)
+    elif getattr(pattern.callback, "fast_path", False):
+      prefixes.append(prefix)
+  return tuple(prefixes)
+
+class FastPathMiddleware:
+  """ Serves views marked with fast_path (the Text APIs) right away,
+  skipping every middleware after this one: sessions, authentication,
+  CommonMiddleware, CSRF, messages and clickjacking. Keep it right after
+  SecurityMiddleware. The host is still checked against ALLOWED_HOSTS.
+  Only paths starting like a fast path view are resolved here, everything
+  else goes down the stack untouched. Profiled requests go through the
+  whole stack so the profiler can run. """
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    match = self.match(request)
+    if match is None:
+      return self.get_response(request)
+    request.resolver_match = match
+    request.user = AnonymousUser()
+    try:
+      # Done by CommonMiddleware otherwise, raises DisallowedHost
+      request.get_host()
+      return match.func(request, *match.args, **match.kwargs)
+    except Exception as e:
+      return response_for_exception(request, e)
+
+  def match(self, request):
+    """ URL match of a fast path view for the request if any """
+    if request.method not in ("GET", "HEAD"):
+      return None
+    if PROFILING["ENABLED"] and profiling_mode(request):
+      return None
+    urlconf = getattr(request, "urlconf", None)
+    if not request.path_info[1:].startswith(fast_path_prefixes(get_resolver(urlconf))):
+      return None
+    try:
+      match = resolve(request.path_info, urlconf)
+    except Resolver404:
+      return None
+    return match if getattr(match.func, "fast_path", False) else None
@@ -1,5 +1,6 @@
-from oauth.views import OAuthClient
-from oauth.textapis import TextAPI
+from oauth.views import OAuthClient, AsyncOAuthClient
+from oauth.textapis import TextAPI, AsyncTextAPI, cached, acached
+from oauth.textapis import Follow, ChannelDate, Channel, parse_date
 
 class MixerOAuthClient(OAuthClient, TextAPI):
   """ Offers access to multiple resources from the Mixer API
@@ -22,43 +23,94 @@ class MixerOAuthClient(OAuthClient, TextAPI):
       "thumbnail":data["avatarUrl"],
     }
 
+  @cached("users")
   def get_channel(self, channel):
     """ Fetching channel info.
 
     :param str|int channel: Channel's name or id
 
-    :return dict: Channel info if found """
-    channel_info = self.pubfetch(f"channels/{channel}")
+    :return Channel: Channel info if found """
+    return self.channel(channel, self.pubfetch(f"channels/{channel}"))
+
+  def channel(self, channel, channel_info):
+    """ Channel record for a channels response
+
+    :param str|int channel: Requested channel's name or id
+    :param dict channel_info: Response for the channel
+
+    :return Channel: Channel info if found """
     if "error" in channel_info:
       raise TextAPI.UserDoesNotExist(keyword=channel)
-    return channel_info
+    return Channel(channel_info["id"], channel_info["token"], parse_date(channel_info["createdAt"]))
 
   def account_creation(self, channel):
     """ Fetching channel creation date """
     channel_info = self.get_channel(channel)
-    return channel_info["createdAt"], channel_info["token"]
+    return ChannelDate(channel_info.created, channel_info.name)
 
+  @cached("follows")
   def followage(self, follower, channel):
-    """ Fetching follow info """
+    """ Fetching follow info, the follower is only looked up
+    (to tell unknown users apart) when they're not following """
     channel_info = self.get_channel(channel)
     try:
-      data = self.pubfetch(f"channels/{channel_info['id']}/follow?where=username:eq:{follower}")[0]
+      data = self.pubfetch(f"channels/{channel_info.id}/follow?where=username:eq:{follower}")[0]
     except IndexError:
-      follower_info = self.get_channel(follower)
-      raise TextAPI.NotFollowing(channel=channel_info["token"], follower=follower_info["token"])
+      raise TextAPI.NotFollowing(channel=channel_info.name, follower=self.get_channel(follower).name)
 
-    return data["username"], channel_info["token"], data["followed"]["createdAt"]
+    return Follow(data["username"], channel_info.name, parse_date(data["followed"]["createdAt"]))
 
+  @cached("streams")
   def uptime(self, channel):
     """ Fetching current stream info if any """
     channel_info = self.get_channel(channel)
     try:
-      data = self.pubfetch(f"channels/{channel_info['id']}/broadcast")
-      return data["startedAt"], channel_info["token"]
+      data = self.pubfetch(f"channels/{channel_info.id}/broadcast")
+      return ChannelDate(parse_date(data["startedAt"]), channel_info.name)
     except KeyError:
-      raise TextAPI.NotLive(channel=channel_info["token"])
+      raise TextAPI.NotLive(channel=channel_info.name)
+
+class AsyncMixerOAuthClient(AsyncOAuthClient, AsyncTextAPI, MixerOAuthClient):
+  """ MixerOAuthClient for coroutines, shares the cache with it. """
+
+  @acached("users")
+  async def get_channel(self, channel):
+    """ Fetching channel info. """
+    return self.channel(channel, await self.pubfetch(f"channels/{channel}"))
+
+  async def account_creation(self, channel):
+    """ Fetching channel creation date """
+    channel_info = await self.get_channel(channel)
+    return ChannelDate(channel_info.created, channel_info.name)
+
+  @acached("follows")
+  async def followage(self, follower, channel):
+    """ Fetching follow info, the follower is only looked up
+    (to tell unknown users apart) when they're not following """
+    channel_info = await self.get_channel(channel)
+    try:
+      data = (await self.pubfetch(f"channels/{channel_info.id}/follow?where=username:eq:{follower}"))[0]
+    except IndexError:
+      raise TextAPI.NotFollowing(channel=channel_info.name, follower=(await self.get_channel(follower)).name)
+
+    return Follow(data["username"], channel_info.name, parse_date(data["followed"]["createdAt"]))
+
+  @acached("streams")
+  async def uptime(self, channel):
+    """ Fetching current stream info if any """
+    channel_info = await self.get_channel(channel)
+    try:
+      data = await self.pubfetch(f"channels/{channel_info.id}/broadcast")
+      return ChannelDate(parse_date(data["startedAt"]), channel_info.name)
+    except KeyError:
+      raise TextAPI.NotLive(channel=channel_info.name)
 
 mixer = MixerOAuthClient(
   include_client_id=True,
   include_client_secret=True,
 )
+
+amixer = AsyncMixerOAuthClient(
+  include_client_id=True,
+  include_client_secret=True,
+)
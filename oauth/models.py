@@ -18,6 +18,8 @@ class OAuthUser(models.Model):
       self.user = user
 
     super(OAuthUser, self).save(*args, **kwargs)
+    # The user profile shows the linked OAuth users
+    User.objects.only(*User.profile_fields).get(pk=self.user_id).update_profile_hash()
 
   def __str__(self):
     return (
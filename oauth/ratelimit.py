@@ -0,0 +1,158 @@
+import asyncio
+from time import time, sleep
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Priority of the upstream requests made in the current thread/task
+priority = ContextVar("priority", default=INTERACTIVE)
+
+@contextmanager
+def background():
+  """ Making every upstream request inside the block a background one,
+  they leave part of the budget to interactive requests. """
+  token = priority.set(BACKGROUND)
+  try:
+    yield
+  finally:
+    priority.reset(token)
+
+class RateLimited(Exception):
+  """ The upstream budget ran out and won't be back soon enough """
+  def __init__(self, provider, reset):
+    super().__init__(f"{provider} rate limit exceeded until {reset}")
+    self.provider = provider
+    self.reset = reset
+
+class RateLimiter:
+  """ Token bucket for the requests made to a provider.
+  The bucket lives in a Django cache so it's shared by every worker
+  using the same cache. Every response carrying rate limit headers
+  (Ratelimit-Limit, Ratelimit-Remaining and Ratelimit-Reset) replaces
+  the local estimate with the provider's own count. Background requests
+  can't take the last reserve fraction of the bucket, so interactive ones
+  (e.g. chat commands) still get through when busy. """
+  limit_header = "Ratelimit-Limit"
+  remaining_header = "Ratelimit-Remaining"
+  reset_header = "Ratelimit-Reset"
+
+  def __init__(self, name, limit, period=60, reserve=0.2, timeout=5, alias="default"):
+    """ Constructs a new rate limiter
+
+    :param str name: Provider name, identifies the bucket
+    :param int limit: Requests allowed every period until told otherwise
+    :param float period: Seconds until an empty bucket is full again
+    :param float reserve: Fraction of the bucket kept for interactive requests
+    :param float timeout: Maximum seconds to wait for the bucket to refill
+    :param str alias: Django cache holding the bucket """
+    self.name = name
+    self.limit = limit
+    self.period = period
+    self.reserve = reserve
+    self.timeout = timeout
+    self.alias = alias
+
+  @property
+  def cache(self):
+    from django.core.cache import caches
+    return caches[self.alias]
+
+  def key(self, *parts):
+    return ":".join(("ratelimit", self.name, *map(str, parts)))
+
+  def window(self):
+    """ Current bucket limit and the time it's full again,
+    a new window starts when the previous one is over.
+    Every worker agrees on the new window: it's added under a key
+    derived from the one it follows and read back, whoever adds it first wins.
+
+    :return tuple: Limit and reset timestamp """
+    now = time()
+    limit, reset = self.cache.get(self.key("window"), (self.limit, 0))
+    if reset > now:
+      return limit, reset
+    while reset <= now:
+      successor = self.key("window", "after", reset)
+      self.cache.add(successor, (limit, now + self.period), self.period*2)
+      limit, reset = self.cache.get(successor, (limit, now + self.period))
+    self.cache.set(self.key("window"), (limit, reset), self.period*2)
+    self.cache.add(self.key("spent", reset), 0, self.period*2)
+    return limit, reset
+
+  def take(self, level=None):
+    """ Taking a token from the bucket if there's one left.
+    The bucket counts the requests spent in the window rather than the
+    ones left, counters in some caches (e.g. memcached) can't go below 0.
+
+    :param str level: Request priority, the current one by default
+
+    :return float: 0 if the token was taken or
+    seconds until the bucket is refilled """
+    limit, reset = self.window()
+    available = limit if (level or priority.get()) == INTERACTIVE else limit - int(limit*self.reserve)
+    key = self.key("spent", reset)
+    try:
+      spent = self.cache.incr(key)
+    except ValueError:
+      # Evicted from the cache, start over with a full bucket
+      self.cache.add(key, 0, self.period*2)
+      spent = self.cache.incr(key)
+    if spent <= available:
+      return 0
+    with suppress(ValueError):
+      self.cache.decr(key)
+    return max(reset - time(), 0.001)
+
+  def acquire(self, level=None, timeout=None):
+    """ Waiting until a request is allowed.
+
+    :param str level: Request priority, the current one by default
+    :param float timeout: Maximum seconds to wait, RateLimited is raised
+    when the bucket won't be refilled in time """
+    timeout = self.timeout if timeout is None else timeout
+    deadline = time() + timeout
+    while True:
+      wait = self.take(level)
+      if not wait: return
+      if time() + wait > deadline:
+        raise RateLimited(self.name, time() + wait)
+      sleep(wait)
+
+  async def aacquire(self, level=None, timeout=None):
+    """ Same as acquire for coroutines """
+    timeout = self.timeout if timeout is None else timeout
+    deadline = time() + timeout
+    while True:
+      wait = self.take(level)
+      if not wait: return
+      if time() + wait > deadline:
+        raise RateLimited(self.name, time() + wait)
+      await asyncio.sleep(wait)
+
+  def update(self, headers):
+    """ Replacing the bucket with the provider's count.
+
+    :param Mapping headers: Response headers """
+    try:
+      remaining = int(headers[self.remaining_header])
+      reset = float(headers[self.reset_header])
+      limit = int(headers.get(self.limit_header, self.limit))
+    except (KeyError, ValueError):
+      return
+    ttl = max(reset - time(), 0) + self.period
+    self.cache.set(self.key("window"), (limit, reset), ttl)
+    self.cache.set(self.key("spent", reset), max(limit - remaining, 0), ttl)
+
+  def budget(self):
+    """ Current state of the bucket.
+
+    :return dict: Limit, remaining requests and when it's full again """
+    limit, reset = self.window()
+    return {
+      "limit": limit,
+      "remaining": max(limit - self.cache.get(self.key("spent", reset), 0), 0),
+      "reset": reset,
+      "reserve": int(limit*self.reserve),
+    }
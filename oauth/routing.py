@@ -0,0 +1,7 @@
+from .twitch.views import atwitch
+from .mixer.views import amixer
+
+urlpatterns = [
+  *atwitch.urlpatterns,
+  *amixer.urlpatterns,
+]
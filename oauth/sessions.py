@@ -0,0 +1,226 @@
+import os
+import asyncio
+from time import time
+from threading import Lock
+from weakref import WeakKeyDictionary
+from contextlib import contextmanager
+from queue import LifoQueue, Empty
+
+class SessionPool:
+  """ Thread-safe pool of long-lived OAuth 2 sessions.
+  Every session keeps its own keep-alive connections to the provider
+  so consecutive requests skip the TCP and TLS handshakes. Sessions are
+  handed out to one thread at a time and are never shared between
+  processes, a forked worker starts with a fresh pool. """
+  # Responses that are worth retrying on idempotent requests
+  retry_statuses = (500, 502, 503, 504)
+
+  def __init__(self, client_id, size=10, timeout=(3.05, 10), retries=3, backoff=0.3, resend=True):
+    """ Constructs a new session pool
+
+    :param str client_id: OAuth 2 client id used by every session
+    :param int size: Maximum number of sessions alive at once
+    :param float|tuple timeout: Connect and read timeouts in seconds
+    :param int retries: How many times a failed request is retried
+    :param float backoff: Backoff factor between retries in seconds
+    :param bool resend: Whether requests that reached the provider
+    (server errors, read timeouts) are retried, otherwise only failed
+    connections are and the caller retries the rest (e.g. to count
+    every attempt against a rate limit) """
+    self.client_id = client_id
+    self.size = size
+    self.timeout = timeout
+    self.retries = retries
+    self.backoff = backoff
+    self.resend = resend
+    self._lock = Lock()
+    self._reset()
+
+  def _reset(self):
+    """ Dropping all sessions, used after a fork. """
+    self._pid = os.getpid()
+    self._sessions = LifoQueue()
+    self._created = 0
+
+  def _create(self):
+    """ Creating a session with retries and a connection pool mounted. """
+    # Slow to import, they wait until the first session is needed
+    from requests.adapters import HTTPAdapter
+    from requests_oauthlib import OAuth2Session
+    from urllib3.util.retry import Retry
+    session = OAuth2Session(self.client_id)
+    adapter = HTTPAdapter(max_retries=Retry(
+      total=self.retries,
+      read=self.retries if self.resend else 0,
+      backoff_factor=self.backoff,
+      status_forcelist=self.retry_statuses if self.resend else (),
+      raise_on_status=False,
+    ))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+  def _checkout(self):
+    """ Taking the most recently used session from the pool.
+    A new one is created while the pool isn't full, otherwise
+    it waits until another thread gives one back. """
+    with self._lock:
+      if self._pid != os.getpid():
+        self._reset()
+      try:
+        return self._sessions.get_nowait()
+      except Empty:
+        if self._created < self.size:
+          self._created += 1
+          return self._create()
+    return self._sessions.get()
+
+  @contextmanager
+  def session(self, token=None, token_updater=None):
+    """ Borrowing a session from the pool.
+
+    :param dict token: Token used to authenticate the requests if any
+    :param Callable[[token], None] token_updater: What to do
+    if the token gets updated
+
+    :yield OAuth2Session: A session exclusive to the current thread """
+    session = self._checkout()
+    session.token = token or {}
+    session.token_updater = token_updater
+    try:
+      yield session
+    finally:
+      session.token = {}
+      session.token_updater = None
+      self._sessions.put(session)
+
+  def get(self, url, token=None, token_updater=None, **kwargs):
+    """ Sending a GET request through a pooled session.
+
+    :param str url: Full url to request
+    :param dict token: Token used to authenticate the request if any
+    :param Callable[[token], None] token_updater: What to do
+    if the token gets updated
+
+    :return Response: Response for the request """
+    kwargs.setdefault("timeout", self.timeout)
+    with self.session(token, token_updater) as session:
+      return session.get(url, withhold_token=not token, **kwargs)
+
+class Attempts:
+  """ Seconds to wait before every attempt of a rate limited request.
+  The first attempt goes right away, server errors are retried backing
+  off like the pools do and a throttled request (429) gets a single
+  extra attempt since the rate limiter already waited for the budget. """
+  def __init__(self, retries, backoff, statuses=SessionPool.retry_statuses):
+    """ Constructs new attempts
+
+    :param int retries: How many times a server error is retried
+    :param float backoff: Backoff factor between retries in seconds
+    :param tuple statuses: Server errors worth retrying """
+    self.retries = retries
+    self.backoff = backoff
+    self.statuses = statuses
+    self.failed = 0
+    self.throttled = False
+    self.delay = 0
+
+  def __iter__(self):
+    while self.delay is not None:
+      delay, self.delay = self.delay, None
+      yield delay
+
+  def retry(self, status):
+    """ Telling the attempts how the last one went.
+
+    :param int status: Response status code
+
+    :return bool: False if the response is final, when it's True and
+    no attempt follows the request ran out of them """
+    if status == 429:
+      self.delay = None if self.throttled else 0
+      self.throttled = True
+      return True
+    if status in self.statuses and self.failed < self.retries:
+      self.delay = self.backoff * 2**self.failed
+      self.failed += 1
+      return True
+    return False
+
+class AsyncSessionPool:
+  """ Keep-alive connections for coroutines.
+  A single async client multiplexes every in-flight request of an event
+  loop over at most size connections, each loop gets its own client. """
+  retry_statuses = SessionPool.retry_statuses
+
+  def __init__(self, client_id, size=100, timeout=10, retries=3, backoff=0.3, resend=True):
+    """ Constructs a new async session pool
+
+    :param str client_id: OAuth 2 client id sent along every request
+    :param int size: Maximum number of connections alive at once
+    :param float timeout: Timeout for each operation in seconds
+    :param int retries: How many times a failed request is retried
+    :param float backoff: Backoff factor between retries in seconds
+    :param bool resend: Same as SessionPool's """
+    self.client_id = client_id
+    self.size = size
+    self.timeout = timeout
+    self.retries = retries
+    self.backoff = backoff
+    self.resend = resend
+    self._clients = WeakKeyDictionary()
+
+  @property
+  def client(self):
+    """ Async client bound to the running event loop. """
+    loop = asyncio.get_event_loop()
+    try:
+      return self._clients[loop]
+    except KeyError:
+      # Slow to import, it waits until the first async request
+      import httpx
+      client = self._clients[loop] = httpx.AsyncClient(
+        timeout=self.timeout,
+        pool_limits=httpx.PoolLimits(soft_limit=self.size, hard_limit=self.size),
+      )
+      return client
+
+  def retry_errors(self):
+    """ Errors worth retrying on idempotent requests """
+    import httpx
+    if not self.resend:
+      return (httpx.ConnectTimeout,)
+    return (httpx.NetworkError, httpx.ConnectTimeout, httpx.ReadTimeout)
+
+  def authorization(self, token):
+    """ Authorization header for a token.
+
+    :param dict token: Token object for authentication
+
+    :return str: Header value """
+    if token.get("expires_at") and token["expires_at"] < time():
+      from oauthlib.oauth2 import TokenExpiredError
+      raise TokenExpiredError()
+    return f"Bearer {token['access_token']}"
+
+  async def get(self, url, token=None, headers=None):
+    """ Sending a GET request through a pooled connection.
+
+    :param str url: Full url to request
+    :param dict token: Token used to authenticate the request if any
+    :param dict headers: Extra request headers
+
+    :return httpx.Response: Response for the request """
+    headers = dict(headers or {})
+    if token:
+      headers["Authorization"] = self.authorization(token)
+    retry_errors = self.retry_errors()
+    for attempt in range(self.retries + 1):
+      retry = attempt < self.retries
+      try:
+        response = await self.client.get(url, headers=headers)
+        if not (retry and self.resend) or response.status_code not in self.retry_statuses:
+          return response
+      except retry_errors:
+        if not retry: raise
+      await asyncio.sleep(self.backoff * 2**attempt)
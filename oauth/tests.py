@@ -1,14 +1,45 @@
 import json
+import asyncio
+from time import time, sleep
+from datetime import datetime, timezone
+from threading import Thread, Barrier
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from types import ModuleType
+from collections import Counter
+from unittest.mock import patch
+from tempfile import NamedTemporaryFile
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
-from django.test import TestCase, RequestFactory
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import HttpCommunicator
+from django.test import TestCase, TransactionTestCase, RequestFactory, SimpleTestCase, Client, override_settings
+from django.http import HttpResponse
+from django.urls import path, include, resolve, get_resolver
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command, CommandError
 from django.contrib.auth.models import AnonymousUser
 
 from django.contrib.sessions.middleware import SessionMiddleware
 from django.contrib.auth import logout
 
-from .twitch.views import twitch
-from .mixer.views import mixer
-from .models import OAuthUser
+from .twitch.views import twitch, TwitchOAuthClient, AsyncTwitchOAuthClient
+from .mixer.views import mixer, MixerOAuthClient
+from .textapis import TextAPI, cache, Follow, ChannelDate, parse_date
+from .models import OAuthUser, OAuthCredentials
+from .views import OAuthClient
+from .middleware import fast_path, fast_path_prefixes
+from stuff7.settings import PROFILING
+from stuff7.utils.benchmark import import_times
+from .fake import FakeProvider
+from .benchmarks import startup_code
+from .loadtest import bot_commands, command, summary
+from . import metrics
+from .ratelimit import RateLimiter, RateLimited, background
+from .sessions import Attempts
 
 class OAuthUserTestCase(TestCase):
   def setUp(self):
@@ -97,6 +128,807 @@ class OAuthUserTestCase(TestCase):
     self.assertTrue(request.user.is_anonymous,
       msg="logout successful")
 
+class LocalProviderTestCase(SimpleTestCase):
+  """ Runs a stand-in provider in a local HTTP server, a FakeProvider built
+  with the fake options unless a handler is given, and points a
+  provider_class client (LocalTwitchClient by default) to it """
+  handler = None
+  provider_class = None
+  fake = {}
+
+  def setUp(self):
+    if self.handler is None:
+      self.server = FakeProvider(**self.fake).start()
+    else:
+      self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler)
+      self.server.url = f"http://127.0.0.1:{self.server.server_port}"
+      self.server.connections = set()
+      self.server.requests = []
+      self.server.paths = []
+      self.server.failures = 0
+      Thread(target=self.server.serve_forever, daemon=True).start()
+    self.provider = (self.provider_class or LocalTwitchClient)(self.server.url)
+    cache.clear()
+
+  def tearDown(self):
+    self.stop()
+    cache.clear()
+
+  def stop(self):
+    if self.handler is None:
+      self.server.stop()
+    else:
+      self.server.shutdown()
+      self.server.server_close()
+
+  def restart(self, **fake):
+    """ Replacing the FakeProvider with one built with other options """
+    self.stop()
+    self.server = FakeProvider(**fake).start()
+    self.provider = (self.provider_class or LocalTwitchClient)(self.server.url)
+
+class SessionPoolTestCase(LocalProviderTestCase):
+  def setUp(self):
+    self.handler = ProviderHandler
+    self.provider_class = PoolClient
+    super().setUp()
+
+  def test_connection_reused(self):
+    for _ in range(5):
+      self.assertEqual(self.provider.pubfetch("users"), {"path": "/users"})
+    self.provider.fetchjson("users", fresh(token1))
+    self.provider.usecreds("streams")
+    self.assertEqual(len(self.server.requests), 7)
+    self.assertEqual(len(self.server.connections), 1,
+      msg="every request goes through the same keep-alive connection")
+
+  def test_token_sent_only_when_given(self):
+    self.provider.fetchjson("users", fresh(token1))
+    self.provider.pubfetch("users")
+    self.assertEqual(self.server.requests[0]["Authorization"], "Bearer access1")
+    self.assertIsNone(self.server.requests[1]["Authorization"],
+      msg="token from a previous checkout does not leak into public requests")
+
+  def test_concurrent_requests_bounded_by_pool(self):
+    with ThreadPoolExecutor(8) as executor:
+      responses = list(executor.map(self.provider.pubfetch, ["users"]*40))
+    self.assertEqual(len(responses), 40)
+    self.assertLessEqual(len(self.server.connections), self.provider.pool.size,
+      msg="never opens more connections than sessions in the pool")
+
+  def test_retry_on_server_error(self):
+    self.server.failures = 2
+    self.assertEqual(self.provider.pubfetch("users"), {"path": "/users"})
+    self.assertEqual(len(self.server.requests), 3,
+      msg="failed requests are retried")
+
+class TwitchTestCase(LocalProviderTestCase):
+  def setUp(self):
+    self.handler = HelixHandler
+    self.provider_class = LocalTwitchClient
+    super().setUp()
+
+  def test_followage_batches_users(self):
+    follow = self.provider.followage("someFollower", "SomeChannel")
+    self.assertEqual(follow, Follow("SomeFollower", "SomeChannel", datetime(2018, 3, 1, 12, tzinfo=timezone.utc)))
+    self.assertEqual(self.server.paths, [
+      "/users?login=someFollower&login=SomeChannel",
+      "/users/follows?from_id=1&to_id=2&first=1",
+    ], msg="both users are resolved in a single request")
+
+  def test_get_users_shares_cache(self):
+    self.provider.get_user("someFollower")
+    users = self.provider.get_users("somefollower", "2", "someChannel")
+    self.assertEqual(users, [("1", "SomeFollower"), ("2", "SomeChannel"), ("2", "SomeChannel")])
+    self.assertEqual(self.server.paths, [
+      "/users?login=someFollower",
+      "/users?id=2&login=someChannel",
+    ], msg="cached users are not requested again")
+    self.provider.get_user("somechannel")
+    self.assertEqual(len(self.server.paths), 2,
+      msg="users fetched in a batch are cached by name and id")
+
+  def test_get_users_not_found(self):
+    with self.assertRaises(TextAPI.UserDoesNotExist) as e:
+      self.provider.get_users("someChannel", "nobody")
+    self.assertEqual(e.exception.keyword, "nobody")
+    with self.assertRaises(TextAPI.UserDoesNotExist):
+      self.provider.get_user("nobody")
+    self.assertEqual(len(self.server.paths), 1,
+      msg="missing users are cached too")
+
+  def test_gather(self):
+    self.assertEqual(self.provider.gather(lambda: 1, lambda: 2), [1, 2])
+    with self.assertRaises(ZeroDivisionError):
+      self.provider.gather(lambda: 1, lambda: 1/0)
+
+class BatchTextAPITestCase(LocalProviderTestCase):
+  def setUp(self):
+    super().setUp()
+    self.factory = RequestFactory()
+    views = { pattern.name: pattern.callback for pattern in self.provider.urlpatterns }
+    self.uptime = views["twitch-uptime-batch"]
+    self.starttime = views["twitch-starttime-batch"]
+
+  def response(self, view, query):
+    return view(self.factory.get(f"/api/twitch/batch?{query}")).content.decode()
+
+  def test_uptime(self):
+    lines = self.response(self.uptime, "channels=someone,offline,unknown,Someone,someone").split("\n")
+    self.assertEqual(len(lines), 4, msg="repeated channels are answered once")
+    self.assertIn("Someone has been live for", lines[3])
+    self.assertIn("Someone has been live for", lines[0])
+    self.assertEqual(lines[1], "Offline is not live")
+    self.assertEqual(lines[2], "No users found with the name or id \"unknown\"")
+    self.assertEqual([path.partition("?")[0] for path in self.server.paths], ["/streams", "/users"],
+      msg="streams and missing users are requested once for every channel")
+
+  def test_upstream_calls(self):
+    channels = [f"channel{i}" for i in range(250)]
+    self.provider.uptimes(*channels)
+    self.assertEqual(len(self.server.paths), 3, msg="up to 100 channels per request")
+    self.assertIn("first=100", self.server.paths[0])
+    self.response(self.uptime, f"channels={','.join(channels[:100])}")
+    self.response(self.starttime, f"channels={','.join(channels[100:200])}")
+    self.assertEqual(len(self.server.paths), 3, msg="batched streams are cached")
+    self.provider.uptime("channel7")
+    self.assertEqual(len(self.server.paths), 3, msg="cache is shared with uptime")
+
+  def test_json(self):
+    response = json.loads(self.response(self.starttime, "channels=someone,offline&output=json"))
+    self.assertEqual([item["channel"] for item in response], ["someone", "offline"])
+    self.assertIn("Someone started their current stream on", response[0]["response"])
+    self.assertEqual(response[1]["response"], "Offline is not live")
+
+  def test_no_channels(self):
+    self.assertEqual(self.response(self.uptime, "channels=,"), "You need to specify some channels.")
+
+  def test_too_many_channels(self):
+    channels = ",".join(f"channel{i}" for i in range(101))
+    response = self.uptime(self.factory.get(f"/api/twitch/batch?channels={channels}"))
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(response.content.decode(), "You can't specify more than 100 channels.")
+    self.assertEqual(len(self.server.paths), 0, msg="nothing is fetched")
+
+class FollowersExportTestCase(LocalProviderTestCase):
+  fake = { "followers": 250 }
+
+  def setUp(self):
+    super().setUp()
+    urls = ModuleType("urls")
+    urls.urlpatterns = [path("api/", include(self.provider.urlpatterns))]
+    self.urls = override_settings(ROOT_URLCONF=urls)
+    self.urls.enable()
+
+  def tearDown(self):
+    self.urls.disable()
+    super().tearDown()
+
+  def export(self, query=""):
+    return self.client.get(f"/api/twitch/someone/followers{query}")
+
+  def content(self, response):
+    return b"".join(response.streaming_content).decode()
+
+  def follows(self):
+    return [path for path in self.server.paths if path.startswith("/users/follows")]
+
+  def test_csv(self):
+    response = self.export("?msg={follower} follows {channel}")
+    self.assertTrue(response.streaming)
+    self.assertEqual(response["Content-Disposition"], 'attachment; filename="Someone-followers.csv"')
+    lines = self.content(response).splitlines()
+    self.assertEqual(len(lines), 251, msg="header and every follower")
+    self.assertEqual(lines[0], "follower,followed_at,response")
+    date = parse_date(self.server.date("follow", "follower0", "someone")).isoformat()
+    self.assertEqual(lines[1], f"Follower0,{date},Follower0 follows Someone")
+    self.assertEqual(self.follows(), [
+      f"/users/follows?to_id={self.server.user('someone')['id']}&first=100",
+      f"/users/follows?to_id={self.server.user('someone')['id']}&first=100&after=100",
+      f"/users/follows?to_id={self.server.user('someone')['id']}&first=100&after=200",
+    ], msg="pages are walked with the cursor")
+
+  def test_ndjson(self):
+    lines = self.content(self.export("?output=ndjson")).splitlines()
+    self.assertEqual(len(lines), 250)
+    follow = json.loads(lines[-1])
+    self.assertEqual(follow["follower"], "Follower249")
+    self.assertEqual(parse_date(follow["followed_at"]), parse_date(self.server.date("follow", "follower249", "someone")))
+    self.assertIn("Follower249 has been following Someone for", follow["response"],
+      msg="same default message as followage")
+
+  def test_prefetch(self):
+    content = iter(self.export().streaming_content)
+    next(content), next(content)
+    self.assertLessEqual(len(self.follows()), 2,
+      msg="only the page after the one being written is requested")
+    list(content)
+    self.assertEqual(len(self.follows()), 3)
+
+  def test_errors(self):
+    response = self.client.get("/api/twitch/unknown/followers")
+    self.assertEqual(response.content.decode(), "No users found with the name or id \"unknown\"")
+    first_page = self.provider.follower_page
+    def follower_page(channel_id, cursor=None):
+      if cursor: raise RateLimited("twitch", 0)
+      return first_page(channel_id)
+    with patch.object(self.provider, "follower_page", follower_page):
+      lines = self.content(self.export("?output=ndjson")).splitlines()
+    self.assertEqual(len(lines), 101)
+    self.assertEqual(json.loads(lines[-1]), { "error": "Too many requests to Twitch servers. Try again in a minute." })
+
+class FastPathMiddlewareTestCase(LocalProviderTestCase):
+  def setUp(self):
+    super().setUp()
+    self.requests = []
+    urls = ModuleType("urls")
+    urls.urlpatterns = [
+      path("api/", include(self.provider.urlpatterns)),
+      path("probe", fast_path(self.probe)),
+    ]
+    self.urls = override_settings(ROOT_URLCONF=urls)
+    self.urls.enable()
+    # SimpleTestCase fails on any database query, session and user loads included
+    self.client.cookies["sessionid"] = "somesession"
+
+  def tearDown(self):
+    self.urls.disable()
+    super().tearDown()
+
+  def probe(self, request):
+    self.requests.append(request)
+    return HttpResponse("probe")
+
+  def test_textapis(self):
+    views = { pattern.name: pattern.callback for pattern in self.provider.urlpatterns }
+    self.assertTrue(getattr(views["twitch-uptime"], "fast_path", False))
+    self.assertTrue(getattr(views["twitch-uptime-batch"], "fast_path", False))
+    self.assertFalse(getattr(views["twitch-oauth-check"], "fast_path", False))
+    response = self.client.get("/api/twitch/someone/uptime")
+    self.assertIn("Someone has been live for", response.content.decode())
+    self.assertIn("Someone has been live for", self.client.get("/api/twitch/uptime?channels=someone").content.decode())
+    self.assertFalse(response.has_header(TextAPI.error_header))
+    response = self.client.get("/api/twitch/offline/uptime")
+    self.assertEqual(response.content.decode(), "Offline is not live")
+    self.assertEqual(response[TextAPI.error_header], "NotLive")
+
+  def test_skipped_middleware(self):
+    response = self.client.get("/probe")
+    self.assertEqual(response.content, b"probe")
+    self.assertEqual(response["X-Content-Type-Options"], "nosniff", msg="security middleware still runs")
+    self.assertFalse(response.has_header("X-Frame-Options"))
+    request, = self.requests
+    self.assertFalse(hasattr(request, "session"))
+    self.assertFalse(request.user.is_authenticated)
+    self.assertEqual(request.resolver_match.route, "probe")
+
+  def test_prefixes(self):
+    self.assertEqual(set(fast_path_prefixes(get_resolver(self.urls.options["ROOT_URLCONF"]))),
+      {"api/twitch/", "api/twitch/uptime", "api/twitch/starttime", "probe"})
+    with patch("oauth.middleware.resolve", wraps=resolve) as resolving:
+      self.client.get("/api/other")
+      self.client.get("/elsewhere")
+      self.assertEqual(resolving.call_count, 0, msg="other paths are only resolved by the handler")
+      self.client.get("/probe")
+      self.assertEqual(resolving.call_count, 1)
+
+  def test_allowed_hosts(self):
+    self.assertEqual(self.client.get("/probe", HTTP_HOST="elsewhere.com").status_code, 400)
+    self.assertEqual(self.requests, [])
+
+  def test_full_stack(self):
+    self.client.post("/probe")
+    with patch.dict(PROFILING, ENABLED=True):
+      self.client.get("/probe?__profile=1")
+    self.client.get("/probe", HTTP_X_PROFILE="1")
+    self.assertEqual([hasattr(request, "session") for request in self.requests], [True, True, False],
+      msg="only read-only requests without profiling take the fast path")
+
+class StartupTestCase(SimpleTestCase):
+  def test_imports(self):
+    # Fails if the database was touched while importing
+    modules = import_times(f"{startup_code}; from django.db import connection; assert connection.connection is None")
+    self.assertIn("oauth.routing", modules)
+    for module in ("babel", "dateutil", "httpx", "oauthlib", "requests_oauthlib", "stuff7.utils.parsers"):
+      self.assertNotIn(module, modules, msg=f"{module} is imported on first use")
+
+class FakeProviderTestCase(LocalProviderTestCase):
+  def setUp(self):
+    self.provider_class = LocalMixerClient
+    super().setUp()
+
+  def test_mixer(self):
+    date = lambda *keys: parse_date(self.server.date(*keys))
+    follow = self.provider.followage("someFollower", "someone")
+    self.assertEqual(follow, Follow("Somefollower", "Someone", date("follow", "somefollower", "someone")))
+    self.assertEqual(len(self.server.paths), 2, msg="the follower isn't looked up when following")
+    self.assertEqual(self.provider.uptime("someone"), ChannelDate(date("stream", "someone"), "Someone"))
+    self.assertEqual(self.provider.account_creation("someone"), ChannelDate(date("joined", "someone"), "Someone"))
+    with self.assertRaises(TextAPI.NotLive):
+      self.provider.uptime("offline")
+    with self.assertRaises(TextAPI.NotFollowing):
+      self.provider.followage("lonely", "someone")
+    self.assertEqual(self.server.paths[-1], "/channels/lonely")
+    with self.assertRaises(TextAPI.UserDoesNotExist):
+      self.provider.account_creation("unknown")
+
+  def test_errors(self):
+    self.restart(error_rate=0.5, seed=7)
+    for _ in range(20):
+      self.provider.pubfetch("channels/someone")
+    self.assertGreater(self.server.errors, 0)
+    self.assertGreater(self.server.requests, 20,
+      msg="failed requests are retried")
+
+  def test_rate_limited_retries(self):
+    self.restart(error_rate=0.5, seed=7)
+    twitch = LocalTwitchClient(self.server.url)
+    twitch.pool.backoff = 0
+    with patch.object(twitch.limiter, "acquire", wraps=twitch.limiter.acquire) as acquire:
+      for _ in range(20):
+        twitch.send(twitch.endpoint("streams?user_login=someone"))
+    self.assertGreater(self.server.errors, 0)
+    self.assertEqual(acquire.call_count, self.server.requests,
+      msg="every attempt takes a token")
+
+  def test_attempts(self):
+    attempts = Attempts(retries=2, backoff=1)
+    delays = []
+    for delay, status in zip(attempts, (500, 429, 503, 500)):
+      delays.append(delay)
+      retried = attempts.retry(status)
+    self.assertEqual(delays, [0, 1, 0, 2])
+    self.assertFalse(retried, msg="the last server error is the response")
+    attempts = Attempts(retries=2, backoff=1)
+    self.assertEqual([delay for delay in attempts if attempts.retry(429)], [0, 0],
+      msg="throttled requests are sent once more")
+
+  def test_bounded_history(self):
+    self.restart(history=2)
+    for name in ("a", "b", "c"):
+      self.provider.pubfetch(f"channels/{name}")
+    self.assertEqual(list(self.server.paths), ["/channels/b", "/channels/c"])
+    self.assertEqual(self.server.requests, 3)
+    self.assertEqual(self.server.connections, 1, msg="keep-alive connections are counted once")
+
+  def test_user_ids(self):
+    user = self.server.user("Someone")
+    self.assertEqual(FakeProvider().user(user["id"]), user,
+      msg="ids are resolved without remembering the logins")
+    self.assertIsNone(self.server.user("1"))
+    self.assertIsNone(self.server.user(str(int.from_bytes(b"unknown", "big"))))
+
+class LoadGeneratorTestCase(SimpleTestCase):
+  def test_bot_commands(self):
+    paths = bot_commands(2000, ("twitch", "mixer"))
+    self.assertEqual(paths, bot_commands(2000, ("twitch", "mixer")), msg="same seed same mix")
+    self.assertNotEqual(paths, bot_commands(2000, ("twitch", "mixer"), seed=1))
+    commands = {command(path) for path in paths}
+    self.assertIn("mixer/joined", commands)
+    self.assertNotIn("twitch/joined", commands, msg="Twitch doesn't offer account dates")
+    self.assertTrue(all(path.startswith(("/api/twitch/", "/api/mixer/")) for path in paths))
+    self.assertTrue(all("from=" in path for path in paths if "/follow" in path))
+    customized = [path for path in paths if "msg=" in path or "tz=" in path or "locale=" in path]
+    self.assertTrue(0.2 < len(customized)/len(paths) < 0.6)
+    channels = [path.split("/")[3] for path in paths]
+    self.assertGreater(channels.count("channel0"), channels.count("channel100"),
+      msg="popular channels get more traffic")
+
+  def test_summary(self):
+    results = summary([10, 20, 30], Counter(NotLive=2, ConnectError=1), 2)
+    self.assertEqual(results["requests"], 6)
+    self.assertEqual(results["errors"], 3)
+    self.assertEqual(results["error_kinds"], {"ConnectError": 1, "NotLive": 2})
+
+class MetricsTestCase(LocalProviderTestCase):
+  def setUp(self):
+    super().setUp()
+    # Only this process, other test runs may have left their values
+    self.directory = patch.object(metrics.registry, "directory", None)
+    self.directory.start()
+    metrics.registry.clear()
+
+  def tearDown(self):
+    self.directory.stop()
+    metrics.registry.clear()
+    super().tearDown()
+
+  def test_textapi_metrics(self):
+    request = RequestFactory().get("/")
+    self.provider._uptime(request, channel="someone")
+    self.provider._uptime(request, channel="offline")
+    rendered = metrics.registry.render()
+    for phase in ("upstream", "db", "format", "total"):
+      self.assertIn(f'textapi_request_seconds_count{{provider="twitch",resource="uptime",phase="{phase}"}} 2', rendered)
+    self.assertIn('textapi_errors_total{provider="twitch",resource="uptime",error="NotLive"} 1', rendered)
+    self.assertIn('textapi_upstream_responses_total{provider="twitch",status="200"} 3', rendered)
+    upstream = metrics.registry.collect()["textapi_request_seconds"]['["twitch", "uptime", "upstream"]']
+    self.assertGreater(upstream[-2], 0, msg="time spent in upstream requests is recorded")
+
+  def test_endpoint(self):
+    self.assertEqual(Client().get("/metrics").status_code, 200)
+    self.assertIn("# TYPE textapi_request_seconds histogram", Client().get("/metrics").content.decode())
+    self.assertEqual(Client(REMOTE_ADDR="10.0.0.1").get("/metrics").status_code, 404)
+
+class BenchmarkCommandTestCase(SimpleTestCase):
+  def benchmark(self, *args):
+    stdout = StringIO()
+    call_command("benchmark", *args, stdout=stdout, stderr=StringIO())
+    return json.loads(stdout.getvalue())
+
+  def test_compare(self):
+    with NamedTemporaryFile("r") as output:
+      before = self.benchmark("safeformat", "timezone_offset", "--output", output.name)
+      self.assertEqual(json.load(output), before)
+    self.assertEqual(set(before["results"]), {"safeformat", "timezone_offset"})
+    self.assertIn("us", before["results"]["timezone_offset"])
+    with NamedTemporaryFile("w") as baseline:
+      json.dump(before, baseline)
+      baseline.flush()
+      after = self.benchmark("timezone_offset", "--compare", baseline.name)
+    compared = after["compare"]["results"]
+    self.assertEqual(list(compared), ["timezone_offset"])
+    self.assertEqual(compared["timezone_offset"]["before"], before["results"]["timezone_offset"]["us"])
+    self.assertEqual(compared["timezone_offset"]["after"], after["results"]["timezone_offset"]["us"])
+
+  def test_unknown(self):
+    with self.assertRaises(CommandError):
+      self.benchmark("nope")
+
+class RateLimiterTestCase(SimpleTestCase):
+  def setUp(self):
+    caches["default"].clear()
+
+  def tearDown(self):
+    caches["default"].clear()
+
+  def test_budget(self):
+    limiter = RateLimiter("test", 5, timeout=0)
+    for _ in range(5):
+      limiter.acquire()
+    self.assertEqual(limiter.budget()["remaining"], 0)
+    with self.assertRaises(RateLimited):
+      limiter.acquire()
+    self.assertEqual(RateLimiter("test", 5).budget()["remaining"], 0,
+      msg="the bucket is shared through the cache")
+
+  def test_background_reserve(self):
+    limiter = RateLimiter("test", 10, reserve=0.2, timeout=0)
+    with background():
+      for _ in range(8):
+        limiter.acquire()
+      with self.assertRaises(RateLimited):
+        limiter.acquire()
+    limiter.acquire()
+    limiter.acquire()
+    with self.assertRaises(RateLimited):
+      limiter.acquire()
+
+  def test_update(self):
+    limiter = RateLimiter("test", 800)
+    reset = time() + 30
+    limiter.update({ "Ratelimit-Limit": "10", "Ratelimit-Remaining": "1", "Ratelimit-Reset": str(reset) })
+    self.assertEqual(limiter.budget(), { "limit": 10, "remaining": 1, "reset": reset, "reserve": 2 })
+    limiter.update({})
+    self.assertEqual(limiter.budget()["remaining"], 1, msg="responses without headers are ignored")
+
+  def test_clamped_counters(self):
+    with override_settings(CACHES={
+      "default": { "BACKEND": "django.core.cache.backends.locmem.LocMemCache" },
+      "clamped": { "BACKEND": "oauth.tests.ClampedCache", "LOCATION": "clamped" },
+    }):
+      limiter = RateLimiter("test", 2, timeout=0, alias="clamped")
+      limiter.acquire()
+      limiter.acquire()
+      with self.assertRaises(RateLimited, msg="an empty bucket is empty on memcached too"):
+        limiter.acquire()
+      self.assertEqual(limiter.budget()["remaining"], 0)
+
+  def test_window_race(self):
+    limiter = RateLimiter("test", 5, period=30, timeout=0)
+    stale = (5, time() - 1)
+    caches["default"].set(limiter.key("window"), stale)
+    limit, reset = limiter.window()
+    limiter.acquire()
+    # Another worker read the stale window before the new one was stored
+    caches["default"].set(limiter.key("window"), stale)
+    sleep(0.01)
+    self.assertEqual(limiter.window(), (limit, reset), msg="workers agree on the new window")
+    self.assertEqual(limiter.budget()["remaining"], 4, msg="and share its bucket")
+
+  def test_waits_for_refill(self):
+    clock = Clock(time())
+    with patch("oauth.ratelimit.time", clock.time), patch("oauth.ratelimit.sleep", clock.sleep):
+      limiter = RateLimiter("test", 1, period=60, timeout=90)
+      limiter.acquire()
+      limiter.acquire()
+      self.assertEqual(clock.sleeps, [60], msg="the second request waits for the next window")
+      with self.assertRaises(RateLimited):
+        limiter.acquire(timeout=30)
+      self.assertEqual(clock.sleeps, [60], msg="nobody waits longer than the timeout")
+
+class ClampedCache(LocMemCache):
+  """ Counters never going below 0 like memcached's """
+  def decr(self, key, delta=1, version=None):
+    value = super().decr(key, delta, version)
+    if value < 0:
+      value = super().incr(key, -value, version)
+    return value
+
+class RateLimitedProviderTestCase(LocalProviderTestCase):
+  fake = { "quota": 3 }
+
+  def setUp(self):
+    caches["default"].clear()
+    super().setUp()
+    self.provider.limiter.timeout = 0
+
+  def tearDown(self):
+    super().tearDown()
+    caches["default"].clear()
+
+  def test_quota_from_headers(self):
+    for i in range(3):
+      self.provider.uptime(f"channel{i}")
+    self.assertEqual(self.provider.limiter.budget()["remaining"], 0)
+    with self.assertRaises(RateLimited):
+      self.provider.uptime("channel3")
+    self.assertEqual(self.server.requests, 3)
+    self.assertEqual(self.server.limited, 0, msg="the provider never had to refuse a request")
+
+  def test_textapi_message(self):
+    self.provider.limiter.update(self.server.ratelimit_headers())
+    self.server.remaining = 0
+    self.provider.limiter.update(self.server.ratelimit_headers())
+    response = self.provider._uptime(RequestFactory().get("/"), channel="channel0").content.decode()
+    self.assertEqual(response, "Too many requests to Twitch servers. Try again in a minute.")
+
+  def test_too_many_requests(self):
+    self.server.remaining = 0
+    with self.assertRaises(RateLimited):
+      self.provider.uptime("channel0")
+    self.assertEqual(self.server.limited, 1, msg="the budget is updated from the 429 response")
+
+  def test_ratelimit_view(self):
+    self.provider.uptime("channel0")
+    budget = json.loads(self.provider.ratelimit(RequestFactory().get("/")).content)
+    self.assertEqual((budget["limit"], budget["remaining"]), (3, 2))
+
+class AsyncTextAPITestCase(LocalProviderTestCase, TransactionTestCase):
+  def setUp(self):
+    self.provider_class = LocalAsyncTwitchClient
+    super().setUp()
+    self.application = URLRouter([path("api/", URLRouter(self.provider.urlpatterns))])
+
+  def response(self, endpoint):
+    communicator = HttpCommunicator(self.application, "GET", f"/api/twitch/{endpoint}")
+    response = async_to_sync(communicator.get_response)()
+    self.assertEqual(response["status"], 200)
+    self.assertIn((b"Content-Type", b"text/plain; charset=UTF-8"), response["headers"])
+    return response["body"].decode()
+
+  def test_textapis(self):
+    self.provider.credentials = fresh(token2)
+    self.assertIn("Somechannel has been live for", self.response("somechannel/uptime"))
+    self.assertIn("Somechannel started their current stream on", self.response("somechannel/starttime"))
+    self.assertIn("Someone has been following Somechannel for", self.response("somechannel/followage?from=someone"))
+    self.assertEqual(self.response("somechannel/followage"), "You need to specify a follower.")
+    self.assertEqual(self.response("offlinechannel/uptime"), "Offlinechannel is not live")
+    self.assertEqual(self.response("somechannel/followage?from=lonely"), "Lonely is not following Somechannel")
+    self.assertEqual(self.response("unknown/uptime"), "No users found with the name or id \"unknown\"")
+    self.assertIn("does not give access", self.response("somechannel/joined"))
+
+  def test_error_header(self):
+    self.provider.credentials = fresh(token2)
+    communicator = HttpCommunicator(self.application, "GET", "/api/twitch/offlinechannel/uptime")
+    response = async_to_sync(communicator.get_response)()
+    self.assertIn((TextAPI.error_header.encode(), b"NotLive"), response["headers"])
+    communicator = HttpCommunicator(self.application, "GET", "/api/twitch/somechannel/uptime")
+    response = async_to_sync(communicator.get_response)()
+    self.assertNotIn(TextAPI.error_header.encode(), dict(response["headers"]))
+
+  def test_credentials_loaded_from_database(self):
+    credentials = { k: v for k, v in fresh(token2).items() if k != "refresh_token" }
+    OAuthCredentials(id="twitch", **self.provider.stringify(credentials)).save()
+    self.assertIn("has been live", self.response("somechannel/uptime"))
+    self.assertEqual(self.provider.credentials["access_token"], "access2")
+
+  def test_requests_dont_block(self):
+    self.provider.credentials = fresh(token2)
+    # Upstream responses wait until every request arrived,
+    # which only happens if they're awaited concurrently
+    arrived = Barrier(20, timeout=5)
+    def delay():
+      arrived.wait()
+      return 0
+    async def responses():
+      communicators = [
+        HttpCommunicator(self.application, "GET", f"/api/twitch/channel{i}/uptime")
+        for i in range(20)
+      ]
+      return await asyncio.gather(*(c.get_response(timeout=10) for c in communicators))
+    with patch.object(self.server, "delay", delay):
+      responses = async_to_sync(responses)()
+    self.assertTrue(all(b"has been live" in r["body"] for r in responses),
+      msg="20 upstream requests are awaited concurrently in a single thread")
+    self.assertFalse(arrived.broken)
+
+class CredentialsRefresherTestCase(LocalProviderTestCase, TransactionTestCase):
+  def setUp(self):
+    self.provider_class = LocalCredentialsClient
+    super().setUp()
+    self.provider.credentials = expired(token2)
+
+  def tearDown(self):
+    self.provider.refresher.stop()
+    super().tearDown()
+
+  def store(self, token):
+    OAuthCredentials(id="twitch", **self.provider.credentials_fields(token)).save()
+
+  def test_refresh(self):
+    self.store(expired(token2))
+    self.provider.refresher.refresh()
+    self.assertEqual(self.provider.credentials["access_token"], "fake-access-token")
+    self.assertEqual(OAuthCredentials.objects.get(pk="twitch").access_token, "fake-access-token")
+    self.assertEqual(list(self.server.paths), ["/oauth2/token"])
+
+  def test_refreshed_by_another_worker(self):
+    self.store(fresh(token1))
+    self.provider.refresher.refresh()
+    self.assertEqual(self.provider.credentials["access_token"], "access1")
+    self.assertEqual(self.server.requests, 0, msg="Token isn't requested again.")
+
+  def test_credentials_updater(self):
+    self.store(expired(token2))
+    self.provider.credentials_updater(fresh(token1))
+    self.assertEqual(OAuthCredentials.objects.get(pk="twitch").access_token, "access1")
+    self.assertEqual(self.provider.credentials["access_token"], "access1")
+
+  def test_expired_on_request(self):
+    self.provider.refresh_credentials = False
+    self.assertEqual(self.provider.uptime("somechannel")[1], "Somechannel")
+    self.assertEqual(self.server.paths[0], "/oauth2/token")
+    self.assertEqual(self.provider.credentials["access_token"], "fake-access-token")
+
+  def test_first_use(self):
+    self.provider = LocalCredentialsClient(self.server.url)
+    self.assertIsNone(self.provider.credentials, msg="nothing is loaded on startup")
+    self.store(fresh(token1))
+    self.provider.uptime("somechannel")
+    self.assertEqual(self.provider.credentials["access_token"], "access1")
+    self.assertNotIn("/oauth2/token", self.server.paths, msg="stored credentials are used")
+
+  def test_background_refresh(self):
+    refresher = self.provider.refresher
+    clock = Clock(time())
+    self.provider.credentials = fresh(token2)
+    self.provider.credentials["expires_at"] = clock.now + refresher.margin + 30
+    with patch.object(refresher, "start") as start:
+      self.provider.uptime("somechannel")
+    start.assert_called_once()
+    self.assertEqual(self.provider.credentials["access_token"], "access2",
+      msg="Requests use the current token until it's about to expire.")
+    self.assertEqual(list(self.server.paths), ["/streams?user_login=somechannel"])
+    # The background thread's loop, stopped once the token was renewed
+    waits = []
+    def wait(seconds):
+      waits.append(seconds)
+      clock.sleep(seconds)
+      return self.provider.credentials["access_token"] != "access2"
+    with patch("oauth.credentials.time", clock.time), patch.object(refresher, "_stopped") as stopped:
+      stopped.wait.side_effect = wait
+      refresher.run()
+    self.assertEqual(waits, [30, refresher.interval],
+      msg="it sleeps until the token is about to expire and then checks every interval")
+    self.assertEqual(list(self.server.paths)[1:], ["/oauth2/token"])
+    self.assertEqual(self.provider.credentials["access_token"], "fake-access-token")
+    self.assertEqual(OAuthCredentials.objects.get(pk="twitch").access_token, "fake-access-token")
+
+class ProviderHandler(BaseHTTPRequestHandler):
+  """ Stand-in provider answering every request with its own path. """
+  protocol_version = "HTTP/1.1"
+
+  def do_GET(self):
+    self.server.connections.add(self.client_address)
+    self.server.requests.append(self.headers)
+    self.server.paths.append(self.path)
+    if self.server.failures:
+      self.server.failures -= 1
+      self.reply(503, {})
+    else:
+      self.reply(200, self.respond())
+
+  def respond(self):
+    return {"path": self.path}
+
+  def reply(self, status, data):
+    body = json.dumps(data).encode()
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+class HelixHandler(ProviderHandler):
+  """ Stand-in Twitch Helix API that knows two users """
+  users = [
+    { "id": "1", "login": "somefollower", "display_name": "SomeFollower" },
+    { "id": "2", "login": "somechannel", "display_name": "SomeChannel" },
+  ]
+
+  def respond(self):
+    resource, _, query = self.path[1:].partition("?")
+    params = parse_qs(query.lower())
+    if resource == "users":
+      return {"data": [
+        user for user in self.users
+        if user["id"] in params.get("id", ()) or user["login"] in params.get("login", ())
+      ]}
+    if resource == "users/follows":
+      return {"data": [{
+        "from_name": "SomeFollower",
+        "to_name": "SomeChannel",
+        "followed_at": "2018-03-01T12:00:00Z",
+      }]}
+    return {"data": []}
+
+class LocalTwitchClient(TwitchOAuthClient):
+  def __init__(self, api):
+    self.api = api
+    super().__init__()
+    self.credentials = fresh(token2)
+
+class LocalAsyncTwitchClient(AsyncTwitchOAuthClient):
+  def __init__(self, api):
+    self.api = api
+    super().__init__()
+
+class LocalMixerClient(MixerOAuthClient):
+  def __init__(self, api):
+    self.api = api
+    super().__init__()
+
+class LocalCredentialsClient(TwitchOAuthClient):
+  def __init__(self, api):
+    self.api = api
+    self.token_url = f"{api}/oauth2/token"
+    super().__init__()
+
+class PoolClient(OAuthClient):
+  provider = "test"
+  pool_size = 4
+  backoff = 0
+
+  def __init__(self, api):
+    self.api = api
+    super().__init__()
+    self.credentials = fresh(token2)
+
+class Clock:
+  """ Time that only goes forward when slept """
+  def __init__(self, now=0):
+    self.now = now
+    self.sleeps = []
+
+  def time(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.sleeps.append(seconds)
+    self.now += seconds
+
+def fresh(token):
+  """ Token that won't expire during the test """
+  return { **token, "expires_at": time() + 3600 }
+
+def expired(token):
+  """ Token that expired a minute ago """
+  return { **token, "expires_at": time() - 60 }
+
 token1 = {
   "access_token": "access1",
   "expires_in": 123,
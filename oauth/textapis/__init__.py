@@ -1 +1,3 @@
 from .textapis import *
+from .cache import *
+from .records import *
@@ -0,0 +1,144 @@
+""" Microbenchmarks for the Text API pipeline.
+
+  python manage.py benchmark followage_msg formatdate
+"""
+import os
+from types import ModuleType
+from itertools import cycle, count
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from babel.core import UnknownLocaleError
+from babel.dates import format_datetime
+
+from django.conf import settings
+from django.urls import path, include
+from django.test import Client, override_settings
+
+from stuff7.utils.benchmark import compare, measure, test_environment
+from stuff7.utils.parsers import TimeDeltaParser
+from .textapis import TextAPI
+from .dates import get_date_formatter
+from .records import parse_date
+from oauth.fake import FakeProvider
+
+now = datetime.now(timezone.utc)
+date = now - timedelta(days=777, hours=15, minutes=24, seconds=33)
+
+def followage_msg():
+  """ Parsing TextAPI.followage_msg from scratch vs compiled """
+  scratch = TimeDeltaParser(cache_size=0)
+  compiled = TimeDeltaParser()
+  return compare(
+    lambda: scratch.parse(TextAPI.followage_msg, now, date),
+    lambda: compiled.parse(TextAPI.followage_msg, now, date),
+  )
+
+def formatdate():
+  """ Formatting dates with babel on every call vs cached formatters
+  over the mix of locales requested the most """
+  locales = ("en", "es", "pt-BR", "de", "ja")
+  def legacy(locales=cycle(locales)):
+    locale = next(locales)
+    try:
+      return format_datetime(date, format="full", locale=locale)
+    except (UnknownLocaleError, ValueError):
+      return format_datetime(date, format="full", locale="en")
+  def cached(locales=cycle(locales)):
+    return get_date_formatter(next(locales), "full").format(date)
+  return compare(legacy, cached)
+
+def date_decode():
+  """ Decoding the provider dates of a request, with dateutil (what every
+  request used to do) vs the ISO 8601 path run once per cache miss """
+  from dateutil.parser import parse
+  # Twitch and Mixer dates
+  dates = cycle(("2018-03-01T12:00:00Z", "2016-07-06T21:53:25.000Z"))
+  return compare(lambda: parse(next(dates)), lambda: parse_date(next(dates)))
+
+def formatdate_locales():
+  """ TextAPI._formatdate over a mix of locales, timezones and formats """
+  textapi = TextAPI()
+  params = cycle((
+    { "locale": "en", "tz": "america/mexico_city", "format": "full" },
+    { "locale": "es", "tz": "-5", "format": "long" },
+    { "locale": "pt-BR", "tz": "pst_us", "format": "medium" },
+    { "locale": "de", "tz": "bst_gb", "format": "short" },
+    { "locale": "ja", "tz": "tokyo", "format": "full" },
+  ))
+  return measure(lambda: textapi._formatdate(TextAPI.joined_msg, next(params), date, channel="SomeChannel"))
+
+@contextmanager
+def local_textapis(**options):
+  """ Text API endpoints served through the Django test client against
+  a local stand-in provider, with a throwaway test database so the
+  stored credentials are never touched.
+
+  :param options: FakeProvider options
+
+  :yield Client: Django test client """
+  provider = FakeProvider(**options).start()
+  environ = {
+    "TWITCH_API_URL": provider.url,
+    "TWITCH_TOKEN_URL": f"{provider.url}/oauth2/token",
+  }
+  previous = { key: os.environ.get(key) for key in environ }
+  os.environ.update(environ)
+  try:
+    with test_environment():
+      from oauth.twitch.views import TwitchOAuthClient
+      twitch = TwitchOAuthClient(
+        include_client_id=True,
+        include_client_secret=True,
+      )
+      urls = ModuleType("urls")
+      urls.urlpatterns = [path("api/", include(twitch.urlpatterns))]
+      with override_settings(ROOT_URLCONF=urls):
+        yield Client()
+      twitch.refresher.stop()
+  finally:
+    for key, value in previous.items():
+      if value is None: os.environ.pop(key)
+      else: os.environ[key] = value
+    provider.stop()
+
+def textapi_request(resource, query=""):
+  """ Full requests to a Text API endpoint, every request is for
+  a different channel so the response cache doesn't hide the pipeline """
+  def benchmark():
+    with local_textapis() as client:
+      channels = count()
+      return measure(lambda: client.get(f"/api/twitch/channel{next(channels)}/{resource}{query}"))
+  benchmark.__doc__ = f"GET /api/twitch/<channel>/{resource}{query}"
+  return benchmark
+
+def textapi_middleware():
+  """ Cached GET /api/twitch/<channel>/uptime through the whole middleware
+  stack vs FastPathMiddleware, ops is requests per second per worker """
+  full_stack = [m for m in settings.MIDDLEWARE if m != "oauth.middleware.FastPathMiddleware"]
+  url = "/api/twitch/somechannel/uptime"
+  with local_textapis() as client:
+    baseline = Client()
+    # Clients load the middleware on their first request
+    with override_settings(MIDDLEWARE=full_stack):
+      baseline.get(url)
+    client.get(url)
+    return compare(lambda: baseline.get(url), lambda: client.get(url))
+
+def followers_export():
+  """ Streaming GET /api/twitch/<channel>/followers for 1000 followers
+  with 10ms upstream latency, the next page is fetched while the current
+  one is formatted """
+  with local_textapis(latency=0.01, followers=1000) as client:
+    return measure(lambda: b"".join(client.get("/api/twitch/somechannel/followers").streaming_content), repeat=3)
+
+benchmarks = {
+  "followage_msg": followage_msg,
+  "formatdate": formatdate,
+  "formatdate_locales": formatdate_locales,
+  "date_decode": date_decode,
+  "followage_request": textapi_request("followage", "?from=SomeFollower"),
+  "uptime_request": textapi_request("uptime"),
+  "textapi_middleware": textapi_middleware,
+  "followers_export": followers_export,
+}
@@ -0,0 +1,296 @@
+import asyncio
+from time import monotonic
+from functools import wraps
+from threading import Lock, Event
+from collections import OrderedDict, Counter
+
+from stuff7.settings import TEXTAPI_CACHE
+from .textapis import TextAPI
+
+class LocalBackend:
+  """ In-process storage evicting the least recently used entries. """
+  def __init__(self, max_entries=1024, **options):
+    self.max_entries = max_entries
+    self._entries = OrderedDict()
+    self._lock = Lock()
+
+  def get(self, key):
+    """ Getting an entry if it hasn't expired.
+
+    :param str key: Entry key
+
+    :return tuple: Whether the entry was found and its value """
+    with self._lock:
+      try:
+        expires, value = self._entries[key]
+      except KeyError:
+        return False, None
+      if expires <= monotonic():
+        del self._entries[key]
+        return False, None
+      self._entries.move_to_end(key)
+      return True, value
+
+  def set(self, key, value, ttl):
+    """ Storing an entry, evicting old entries when full.
+
+    :param str key: Entry key
+    :param value: Anything to store
+    :param float ttl: Seconds until the entry expires """
+    with self._lock:
+      self._entries[key] = monotonic() + ttl, value
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+class DjangoBackend:
+  """ Storage shared between workers through a Django cache.
+  Eviction is left to the configured cache backend. """
+  missing = object()
+  # Increased whenever the cached values change shape (e.g. provider
+  # records) so workers never read entries stored by older ones
+  version = 2
+
+  def __init__(self, alias="default", **options):
+    from django.core.cache import caches
+    self.cache = caches[alias]
+
+  def get(self, key):
+    value = self.cache.get(key, self.missing, version=self.version)
+    return value is not self.missing, value
+
+  def set(self, key, value, ttl):
+    self.cache.set(key, value, ttl, version=self.version)
+
+  def clear(self):
+    self.cache.clear()
+
+class Flight:
+  """ An upstream request other threads can wait for. """
+  def __init__(self):
+    self.done = Event()
+    self.entry = None
+
+class ResponseCache:
+  """ Caches provider responses with a different lifetime per resource.
+  Concurrent misses for the same key are collapsed into a single call
+  to the provider, everyone else waits for its result. Errors raised
+  by the provider when something doesn't exist (not live, not following...)
+  are cached as well but never for longer than error_ttl. """
+  backends = {
+    "local": LocalBackend,
+    "django": DjangoBackend,
+  }
+  # Seconds each kind of resource stays in the cache
+  ttls = {
+    "users": 6*60*60,
+    "streams": 30,
+    "follows": 5*60,
+  }
+  error_ttl = 60
+  # Errors worth caching, anything else is retried on the next request
+  errors = (TextAPI.NotLive, TextAPI.NotFollowing, TextAPI.UserDoesNotExist)
+
+  def __init__(self, backend="local", ttls=None, **options):
+    """ Constructs a new response cache
+
+    :param str backend: Name of the storage backend (local or django)
+    :param dict ttls: Lifetime in seconds for each kind of resource
+    :param dict options: Options for the storage backend """
+    self.backend = self.backends[backend](**options)
+    self.ttls = { **self.ttls, **(ttls or {}) }
+    self.hits = Counter()
+    self.misses = Counter()
+    self.collapsed = Counter()
+    self._flights = {}
+    self._aflights = {}
+    self._lock = Lock()
+
+  def fetch(self, resource, key, fetch):
+    """ Getting a resource from the cache or the provider.
+
+    :param str resource: Kind of resource, defines the lifetime
+    :param str key: Key identifying the response
+    :param Callable[[], any] fetch: Requests the resource to the provider
+
+    :return: The cached or freshly fetched response """
+    found, entry = self.get(resource, key)
+    if found:
+      return self.unpack(entry)
+
+    key = self.key(resource, key)
+    with self._lock:
+      flight = self._flights.get(key)
+      leader = flight is None
+      if leader:
+        flight = self._flights[key] = Flight()
+
+    if not leader:
+      self.count(self.collapsed, resource)
+      flight.done.wait()
+      return self.unpack(flight.entry)
+
+    try:
+      ttl = self.ttls[resource]
+      try:
+        flight.entry = (True, fetch())
+      except self.errors as e:
+        flight.entry = (False, self.detached(e))
+        ttl = min(ttl, self.error_ttl)
+      except Exception as e:
+        flight.entry = (False, self.detached(e))
+        raise
+      self.backend.set(key, flight.entry, ttl)
+      return self.unpack(flight.entry)
+    finally:
+      with self._lock:
+        del self._flights[key]
+      flight.done.set()
+
+  async def afetch(self, resource, key, fetch):
+    """ Same as fetch for coroutines.
+    Misses are collapsed per event loop.
+
+    :param Callable[[], Awaitable] fetch: Requests the resource to the provider """
+    found, entry = self.get(resource, key)
+    if found:
+      return self.unpack(entry)
+
+    key = self.key(resource, key)
+    flight = self._aflights.get(key)
+    if flight is not None and flight.get_loop() is asyncio.get_event_loop():
+      self.count(self.collapsed, resource)
+      return self.unpack(await asyncio.shield(flight))
+
+    flight = self._aflights[key] = asyncio.get_event_loop().create_future()
+    entry = None
+    try:
+      ttl = self.ttls[resource]
+      try:
+        entry = (True, await fetch())
+      except self.errors as e:
+        entry = (False, self.detached(e))
+        ttl = min(ttl, self.error_ttl)
+      except Exception as e:
+        entry = (False, self.detached(e))
+        raise
+      self.backend.set(key, entry, ttl)
+      return self.unpack(entry)
+    finally:
+      if self._aflights.get(key) is flight:
+        del self._aflights[key]
+      if entry is None: flight.cancel()
+      else: flight.set_result(entry)
+
+  def key(self, resource, key):
+    return f"textapi:{resource}:{key}"
+
+  def get(self, resource, key):
+    """ Looking up a cached entry without fetching it.
+
+    :param str resource: Kind of resource
+    :param str key: Key identifying the response
+
+    :return tuple: Whether it was found and the entry (see unpack) """
+    found, entry = self.backend.get(self.key(resource, key))
+    self.count(self.hits if found else self.misses, resource)
+    return found, entry
+
+  def set(self, resource, key, value):
+    """ Storing a response fetched elsewhere (e.g. in a batch).
+
+    :param str resource: Kind of resource
+    :param str key: Key identifying the response
+    :param value: Response or a cacheable error """
+    if isinstance(value, self.errors):
+      self.backend.set(self.key(resource, key), (False, self.detached(value)), min(self.ttls[resource], self.error_ttl))
+    else:
+      self.backend.set(self.key(resource, key), (True, value), self.ttls[resource])
+
+  def unpack(self, entry):
+    """ Returning a cached value or raising a copy of a cached error. """
+    ok, value = entry
+    if ok: return value
+    raise self.detached(value)
+
+  def detached(self, error):
+    """ Copy of an error without its traceback. Raising the stored error
+    itself would grow its traceback on every hit (keeping every frame
+    alive) and share it between threads.
+
+    :param Exception error: Error to copy
+
+    :return Exception: Same kind of error with the same attributes """
+    copy = type(error).__new__(type(error), *error.args)
+    copy.args = error.args
+    copy.__dict__.update(error.__dict__)
+    return copy
+
+  def count(self, counter, resource):
+    with self._lock:
+      counter[resource] += 1
+
+  def stats(self):
+    """ Getting hit/miss counters for every resource.
+
+    :return dict: Counters by resource """
+    with self._lock:
+      return {
+        resource: {
+          "hits": self.hits[resource],
+          "misses": self.misses[resource],
+          "collapsed": self.collapsed[resource],
+        } for resource in self.ttls
+      }
+
+  def clear(self):
+    """ Dropping all entries and counters. """
+    self.backend.clear()
+    with self._lock:
+      for counter in (self.hits, self.misses, self.collapsed):
+        counter.clear()
+
+cache = ResponseCache(
+  backend=TEXTAPI_CACHE["BACKEND"],
+  ttls=TEXTAPI_CACHE["TTLS"],
+  **TEXTAPI_CACHE["OPTIONS"],
+)
+
+def cache_key(client, name, *args):
+  """ Key for the result of a provider method.
+
+  :param TextAPI client: Provider client
+  :param str name: Method name
+  :param args: Method arguments
+
+  :return str: Case insensitive cache key """
+  return ":".join(str(arg).lower() for arg in (client.provider, name, *args))
+
+def cached(resource):
+  """ Caching the result of a provider method.
+  The key is made of the provider, the method name and its arguments.
+
+  :param str resource: Kind of resource the method returns """
+  def decorator(fn):
+    @wraps(fn)
+    def cached_decorator(self, *args):
+      key = cache_key(self, fn.__name__, *args)
+      return cache.fetch(resource, key, lambda: fn(self, *args))
+    return cached_decorator
+  return decorator
+
+def acached(resource):
+  """ Same as cached for coroutine methods.
+
+  :param str resource: Kind of resource the method returns """
+  def decorator(fn):
+    @wraps(fn)
+    async def cached_decorator(self, *args):
+      key = cache_key(self, fn.__name__, *args)
+      return await cache.afetch(resource, key, lambda: fn(self, *args))
+    return cached_decorator
+  return decorator
@@ -0,0 +1,34 @@
+from functools import partial
+
+from django.http import QueryDict
+from channels.generic.http import AsyncHttpConsumer
+
+from .textapis import TextAPI, ErrorMessage
+
+class TextAPIConsumer(AsyncHttpConsumer):
+  """ Serves an AsyncTextAPI handler without blocking a thread
+  while the provider responds. """
+  handler = None
+
+  def __init__(self, scope, handler):
+    super().__init__(scope)
+    self.handler = handler
+
+  @classmethod
+  def bind(cls, handler):
+    """ ASGI application serving a handler.
+
+    :param Callable[[params, **kwargs], Awaitable[str]] handler: Text API
+    handler coroutine taking the query params and the url kwargs
+
+    :return Callable[[scope], TextAPIConsumer]: """
+    return partial(cls, handler=handler)
+
+  async def handle(self, body):
+    """ Responding with the text produced by the handler """
+    params = QueryDict(self.scope["query_string"].decode())
+    text = await self.handler(params, **self.scope["url_route"]["kwargs"])
+    headers = [(b"Content-Type", b"text/plain; charset=UTF-8")]
+    if isinstance(text, ErrorMessage):
+      headers.append((TextAPI.error_header.encode(), text.error.encode()))
+    await self.send_response(200, text.encode(), headers=headers)
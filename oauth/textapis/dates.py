@@ -0,0 +1,63 @@
+from functools import lru_cache
+
+from pytz import utc
+from babel.core import Locale, UnknownLocaleError
+from babel.dates import get_datetime_format, get_date_format, get_time_format, parse_pattern
+
+class DateFormatter:
+  """ Same as babel's format_datetime with the locale and
+  patterns resolved once instead of on every call. """
+  named_formats = ("full", "long", "medium", "short")
+
+  def __init__(self, locale, format="full"):
+    """ Constructs a new date formatter
+
+    :param Locale locale: Language the dates are displayed in
+    :param str format: One of short, medium, long, full or a custom pattern """
+    self.locale = locale
+    self.pattern = None
+    if format in self.named_formats:
+      self.datetime_format = get_datetime_format(format, locale=locale).replace("'", "")
+      self.date_pattern = parse_pattern(get_date_format(format, locale=locale))
+      self.time_pattern = parse_pattern(get_time_format(format, locale=locale))
+    else:
+      self.pattern = parse_pattern(format)
+
+  def format(self, date):
+    """ Formatting a date.
+
+    :param datetime date: Date to format, naive dates are assumed to be in UTC
+
+    :return str: Formatted date """
+    if date.tzinfo is None:
+      date = date.replace(tzinfo=utc)
+    if self.pattern is not None:
+      return self.pattern.apply(date, self.locale)
+    return self.datetime_format \
+      .replace("{0}", self.time_pattern.apply(date.timetz(), self.locale)) \
+      .replace("{1}", self.date_pattern.apply(date.date(), self.locale))
+
+@lru_cache(maxsize=256)
+def get_locale(identifier):
+  """ Parsing a locale identifier.
+  Unknown locales are cached too so they only fail once.
+
+  :param str identifier: Locale identifier (e.g. en, es_MX)
+
+  :return Locale: The locale or None if it doesn't exist """
+  try:
+    return Locale.parse(identifier)
+  except (UnknownLocaleError, ValueError):
+    return None
+
+@lru_cache(maxsize=1024)
+def get_date_formatter(locale="en", format="full"):
+  """ Date formatter for a locale and format.
+  Unknown locales fall back to en. An invalid format raises
+  ValueError or KeyError just like format_datetime.
+
+  :param str locale: Locale identifier
+  :param str format: One of short, medium, long, full or a custom pattern
+
+  :return DateFormatter: Cached formatter """
+  return DateFormatter(get_locale(locale) or get_locale("en"), format)
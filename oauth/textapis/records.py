@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+def parse_date(value):
+  """ Decoding a date sent by a provider.
+  Providers send ISO 8601 dates (2018-03-01T12:00:00Z), those are decoded
+  by datetime itself and anything else by dateutil. Dates without a
+  timezone are assumed to be in UTC.
+
+  :param str value: Date to decode
+
+  :return datetime: Aware datetime """
+  try:
+    date = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+  except ValueError:
+    # Slow to import and to parse, only used for unusual dates
+    from dateutil.parser import parse
+    date = parse(value)
+  return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+class Follow(NamedTuple):
+  """ A user following a channel, returned by followage """
+  follower: str
+  channel: str
+  date: datetime
+
+class ChannelDate(NamedTuple):
+  """ A date of a channel, returned by uptime (stream start)
+  and account_creation (account creation) """
+  date: datetime
+  channel: str
+
+class Channel(NamedTuple):
+  """ A channel looked up by name or id """
+  id: int
+  name: str
+  created: datetime
@@ -14,10 +14,10 @@ class CustomAPIsSerializer(serializers.Serializer):
     super().__init__({})
 
   def get_providers(self, obj):
-    return providers
+    return [provider(p) for p in PROVIDERS]
 
   def get_apis(self, obj):
-    return apis
+    return [api(*api_details) for api_details in TEXT_APIS]
 
 PROVIDERS = (
   "twitch",
@@ -95,7 +95,3 @@ def api(name, display_name, params):
     **named_resource(name, display_name),
     "params": [x for p in params for x in PARAM[p]],
   }
-
-providers = [provider(p) for p in PROVIDERS]
-
-apis = [api(*api_details) for api_details in TEXT_APIS]
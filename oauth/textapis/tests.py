@@ -1,16 +1,30 @@
+import json
 from datetime import datetime as dt
 from datetime import timezone as tz
 from datetime import timedelta as td
 from calendar import isleap
+from time import sleep
+from threading import Barrier
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 
-from django.test import TestCase, Client
+from django.test import TestCase, SimpleTestCase, Client
 from django.test.utils import override_settings
 from django.urls import path, include
 
+from babel.core import Locale
 from babel.dates import format_datetime
+from pytz import timezone
+from requests.exceptions import ReadTimeout
 
 from oauth.views import OAuthClient
+from oauth.ratelimit import RateLimited
 from .textapis import TextAPI
+from .cache import ResponseCache
+from .dates import get_date_formatter, get_locale
+from .records import Follow, ChannelDate, parse_date
+from .serializers import PARAM, param
+from .views import render
 
 @override_settings(ROOT_URLCONF=__name__)
 class OAuthClientTestCase(TestCase):
@@ -56,9 +70,192 @@ class OAuthClientTestCase(TestCase):
     self.assertIn("live", response)
     self.assertIn(self.age, response)
 
+  def test_parallel_timezones(self):
+    timezones = {
+      "pst_us": "America/Los_Angeles",
+      "bst_gb": "Europe/London",
+      "ist_ie": "Europe/Dublin",
+      "mexico": "America/Mexico_City",
+      "-5": "Etc/GMT+5",
+      "Europe/Madrid": "Europe/Madrid",
+      "tokyo": "Asia/Tokyo",
+    }
+    dates = {
+      tz: format_datetime(test._date.astimezone(timezone(name)), format="full", locale="en")
+      for tz, name in timezones.items()
+    }
+    def starttime(tz):
+      return tz, Client().get(f"/api/test/someChannel/starttime?tz={tz}").content.decode()
+    with ThreadPoolExecutor(16) as executor:
+      for tz, response in executor.map(starttime, list(timezones)*30):
+        self.assertIn(dates[tz], response, msg=f"Displays the date in {timezones[tz]}.")
+
   def response(self, endpoint):
     return self.request.get(f"/api/test/someChannel/{endpoint}").content.decode()
 
+class ResponseCacheTestCase(SimpleTestCase):
+  def setUp(self):
+    self.cache = ResponseCache(ttls={"streams": 0.05}, max_entries=2)
+    self.calls = 0
+
+  def fetch(self, value="value"):
+    def fetch():
+      self.calls += 1
+      return value
+    return fetch
+
+  def test_hit_and_miss(self):
+    self.assertEqual(self.cache.fetch("users", "a", self.fetch()), "value")
+    self.assertEqual(self.cache.fetch("users", "a", self.fetch()), "value")
+    self.assertEqual(self.calls, 1)
+    self.assertEqual(self.cache.stats()["users"], { "hits": 1, "misses": 1, "collapsed": 0 })
+
+  def test_ttl_per_resource(self):
+    self.cache.fetch("streams", "a", self.fetch())
+    self.cache.fetch("users", "a", self.fetch())
+    sleep(0.1)
+    self.cache.fetch("streams", "a", self.fetch())
+    self.cache.fetch("users", "a", self.fetch())
+    self.assertEqual(self.calls, 3,
+      msg="only the stream expired")
+
+  def test_lru_eviction(self):
+    self.cache.fetch("users", "a", self.fetch())
+    self.cache.fetch("users", "b", self.fetch())
+    self.cache.fetch("users", "a", self.fetch())
+    self.cache.fetch("users", "c", self.fetch())
+    self.assertEqual(self.calls, 3)
+    self.cache.fetch("users", "a", self.fetch())
+    self.assertEqual(self.calls, 3,
+      msg="recently used entry survives")
+    self.cache.fetch("users", "b", self.fetch())
+    self.assertEqual(self.calls, 4,
+      msg="least recently used entry was evicted")
+
+  def test_errors(self):
+    def not_live():
+      self.calls += 1
+      raise TextAPI.NotLive(channel="someChannel")
+    def timeout():
+      self.calls += 1
+      raise ReadTimeout()
+    for _ in range(2):
+      with self.assertRaises(TextAPI.NotLive):
+        self.cache.fetch("streams", "a", not_live)
+      with self.assertRaises(ReadTimeout):
+        self.cache.fetch("streams", "b", timeout)
+    self.assertEqual(self.calls, 3,
+      msg="provider errors are cached but timeouts aren't")
+
+  def test_error_copies(self):
+    def not_live():
+      raise TextAPI.NotLive(channel="someChannel")
+    errors = []
+    for _ in range(200):
+      try:
+        self.cache.fetch("streams", "a", not_live)
+      except TextAPI.NotLive as e:
+        errors.append(e)
+    self.assertEqual(errors[-1].channel, "someChannel")
+    self.assertEqual(len({id(e) for e in errors}), 200, msg="every hit raises its own error")
+    depth = lambda tb: tb and 1 + depth(tb.tb_next) or 0
+    self.assertLess(depth(errors[-1].__traceback__), 5, msg="tracebacks don't pile up")
+    with self.assertRaises(RateLimited) as e:
+      self.cache.unpack((False, RateLimited("twitch", 7)))
+    self.assertEqual(e.exception.reset, 7, msg="errors needing init arguments are copied too")
+
+  def test_single_flight(self):
+    barrier = Barrier(8)
+    def slow():
+      self.calls += 1
+      sleep(0.1)
+      return "value"
+    def fetch(_):
+      barrier.wait()
+      return self.cache.fetch("users", "a", slow)
+    with ThreadPoolExecutor(8) as executor:
+      results = list(executor.map(fetch, range(8)))
+    self.assertEqual(results, ["value"]*8)
+    self.assertEqual(self.calls, 1,
+      msg="concurrent misses make a single upstream request")
+    self.assertEqual(self.cache.stats()["users"]["collapsed"], 7)
+
+  def test_django_backend(self):
+    cache = ResponseCache(backend="django")
+    cache.clear()
+    cache.fetch("users", "a", self.fetch())
+    cache.fetch("users", "a", self.fetch())
+    self.assertEqual(self.calls, 1)
+
+class DateFormatterTestCase(SimpleTestCase):
+  def setUp(self):
+    self.date = dt(2019, 3, 31, 1, 30, 15, tzinfo=tz.utc)
+
+  def test_format_datetime_parity(self):
+    formats = ("short", "medium", "long", "full", "yyyy.MM.dd G 'at' HH:mm:ss zzz")
+    for name in ("UTC", "Europe/Madrid", "America/Sao_Paulo", "Asia/Tokyo"):
+      date = self.date.astimezone(timezone(name))
+      for locale in ("en", "es", "pt_BR", "de", "ja"):
+        for date_format in formats:
+          self.assertEqual(
+            get_date_formatter(locale, date_format).format(date),
+            format_datetime(date, format=date_format, locale=locale),
+          )
+
+  def test_unknown_locale(self):
+    get_locale.cache_clear()
+    with patch("oauth.textapis.dates.Locale.parse", side_effect=Locale.parse) as parse:
+      for _ in range(3):
+        self.assertIsNone(get_locale("pt-BR"))
+        self.assertIsNone(get_locale("xx"))
+    self.assertEqual(parse.call_count, 2, msg="Unknown locales fail only once.")
+    self.assertEqual(
+      get_date_formatter("xx", "full").format(self.date),
+      format_datetime(self.date, format="full", locale="en"),
+    )
+
+  def test_invalid_format(self):
+    with self.assertRaises(KeyError):
+      get_date_formatter("en", "yyyy g").format(self.date)
+
+class ParseDateTestCase(SimpleTestCase):
+  def test_iso(self):
+    self.assertEqual(parse_date("2018-03-01T12:00:00Z"), dt(2018, 3, 1, 12, tzinfo=tz.utc))
+    self.assertEqual(parse_date("2016-07-06T21:53:25.000Z"), dt(2016, 7, 6, 21, 53, 25, tzinfo=tz.utc))
+    self.assertEqual(parse_date("2018-03-01T07:00:00-05:00"), dt(2018, 3, 1, 12, tzinfo=tz.utc))
+
+  def test_fallback(self):
+    self.assertEqual(parse_date("Thu, 01 Mar 2018 12:00:00 GMT"), dt(2018, 3, 1, 12, tzinfo=tz.utc))
+    self.assertEqual(parse_date("March 1 2018 12:00"), dt(2018, 3, 1, 12, tzinfo=tz.utc),
+      msg="dates without a timezone are in UTC")
+    with self.assertRaises(ValueError):
+      parse_date("someday")
+
+class CustomAPIsTestCase(SimpleTestCase):
+  def test_cached(self):
+    response = self.client.get("/api/customapis/")
+    content, etag = render()
+    self.assertEqual(response.content, content)
+    self.assertEqual(response["ETag"], etag)
+    self.assertIn("public", response["Cache-Control"])
+    self.assertIn("max-age=86400", response["Cache-Control"])
+    data = json.loads(response.content)
+    self.assertEqual([provider["name"] for provider in data["providers"]], ["twitch", "mixer"])
+    followage = next(api for api in data["apis"] if api["name"] == "followage")
+    self.assertIn({ "name": "from", "display_name": "From", "required": True }, followage["params"])
+
+    response = self.client.get("/api/customapis/", HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 304)
+    self.assertEqual(response.content, b"")
+    self.assertEqual(response["ETag"], etag)
+
+  def test_changes(self):
+    _, etag = render()
+    with patch.dict(PARAM, general=[*PARAM["general"], param("extra", "Extra")]):
+      content, changed = render()
+    self.assertNotEqual(changed, etag, msg="a new param means a new ETag")
+    self.assertIn(b'"extra"', content)
+
 class TestOAuthClient(OAuthClient, TextAPI):
   provider = "test"
 
@@ -69,24 +266,20 @@ class TestOAuthClient(OAuthClient, TextAPI):
     self.channel = "TestChannel"
     self.follower = "TestFollower"
 
-  @property
-  def date(self):
-    return self._date.isoformat()
-
   def leap(self, number):
     return number+1 if isleap(self.now.year) else number
 
   def account_creation(self, channel):
     """ Fetching channel creation date """
-    return self.date, self.channel
+    return ChannelDate(self._date, self.channel)
 
   def followage(self, follower, channel):
     """ Fetching follow info """
-    return self.follower, self.channel, self.date
+    return Follow(self.follower, self.channel, self._date)
 
   def uptime(self, channel):
     """ Fetching current stream info if any """
-    return self.date, self.channel
+    return ChannelDate(self._date, self.channel)
 
 test = TestOAuthClient()
 
@@ -1,17 +1,31 @@
+import csv
+import json
+from io import StringIO
+from time import perf_counter
 from functools import wraps
 from datetime import datetime
 from contextlib import suppress
 
-from django.http import HttpResponse
-from requests.exceptions import ReadTimeout
-from dateutil.parser import parse
+from django.db import connection
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.functional import cached_property
 
-from babel.core import UnknownLocaleError
-from babel.dates import format_datetime
-from pytz.exceptions import UnknownTimeZoneError
-
-from stuff7.utils.parsers import TimeDeltaParser, TimezoneParser
+from oauth import metrics
+from oauth.ratelimit import RateLimited, background
+from stuff7.utils.metrics import tracking, timed
 from stuff7.utils.collections import safeformat
+from .records import parse_date
+
+# Dates are formatted with pytz and babel and the upstream errors come
+# from requests or httpx which are slow to import, they're only
+# imported by the first Text API using them
+
+class ErrorMessage(str):
+  """ Text of a Text API error answer along with the name of the error """
+  def __new__(cls, text, error):
+    message = super().__new__(cls, text)
+    message.error = error
+    return message
 
 class TextAPI:
   """ Provides generic Text APIs to use with chatbots in live streaming platforms.
@@ -20,14 +34,16 @@ class TextAPI:
   the functions to get the info from the chosen API and return it so the
   generic functions defined in here can use it. """
   provider = None
-  # Parses time difference strings
-  delta = TimeDeltaParser()
-  # Parses timezones
-  tz = TimezoneParser()
+  # Errors are answered with a 200 text message like everything else,
+  # this header names the error so clients can tell them apart
+  error_header = "X-TextAPI-Error"
+  # Most channels answered by a single batch request
+  batch_limit = 100
 
   # Default API responses used when no query params are found
   user_not_found_msg = "No users found with the name or id \"{keyword}\""
   invalid_login_msg = "Invalid username."
+  batch_limit_msg = "You can't specify more than {limit} channels."
   followage_msg = (
     "{follower} has been following {channel} for "
     "<{years} year{years(s)}>, <{months} month{months(s)}>, "
@@ -52,6 +68,8 @@ class TextAPI:
     "<{seconds} second{seconds(s)}> and <{microseconds}μs> old."
   )
   joined_msg = "{channel}'s account was created on {date}"
+  # Columns of every follower in a followers export
+  followers_columns = ("follower", "followed_at", "response")
 
   def _textapi(fn):
     """ Handles common API request exceptions
@@ -68,28 +86,152 @@ class TextAPI:
       :return: Http text/plain response using the string returned from fn
                as content or an error message if there was an exception. """
       response = HttpResponse(content_type="text/plain; charset=UTF-8")
-      write = response.write
       params = request.GET
-      try:
-        write(fn(self, params, **kwargs))
-      except NotImplementedError:
-        write(f"The {self.provider.capitalize()} API does not give access to this information.")
-      except ReadTimeout:
-        write(f"External request to {self.provider.capitalize()} servers timed out. Try again.")
-      except TextAPI.UserDoesNotExist as e:
-        write(safeformat(params.get("not_found", self.user_not_found_msg),
-          keyword=e.keyword))
-      except TextAPI.NotFollowing as e:
-        write(safeformat(params.get("error_msg", self.followage_error),
-          channel=e.channel, follower=e.follower))
-      except TextAPI.NotLive as e:
-        write(safeformat(params.get("error_msg", self.uptime_error),
-          channel=e.channel))
-      except TextAPI.InvalidLogin as e:
-        write(params.get("error_msg", self.invalid_login_msg))
+      resource = fn.__name__.lstrip("_")
+      with tracking() as phases, connection.execute_wrapper(self._db_timer):
+        start = perf_counter()
+        try:
+          response.write(fn(self, params, **kwargs))
+        except self.handled_errors as e:
+          self._count_error(resource, e)
+          response[self.error_header] = type(e).__name__
+          response.write(self._error_msg(params, e))
+        self._observe(resource, phases, perf_counter() - start)
       return response
     return decorator
 
+  def _db_timer(self, execute, sql, params, many, context):
+    """ Recording the time spent in database queries """
+    with timed("db"):
+      return execute(sql, params, many, context)
+
+  def _count_error(self, resource, error):
+    metrics.errors.inc(provider=self.provider, resource=resource, error=type(error).__name__)
+
+  def _observe(self, resource, phases, total):
+    """ Recording how long a request took in total and in each phase.
+
+    :param str resource: Text API name
+    :param dict phases: Seconds spent in each phase
+    :param float total: Seconds spent in total """
+    for phase in ("upstream", "db", "format"):
+      metrics.request_seconds.observe(phases.get(phase, 0), provider=self.provider, resource=resource, phase=phase)
+    metrics.request_seconds.observe(total, provider=self.provider, resource=resource, phase="total")
+
+  def _batch(self, request, resource, prefetch):
+    """ Same Text API for multiple channels at once.
+    Channels are fetched together first so answering each of them
+    only hits the response cache.
+
+    :param request: Current http request
+      :queryparam str channels: Comma separated channel names (required),
+      up to batch_limit of them
+      :queryparam str output: Responds with a JSON list when it's "json"
+    :param str resource: Text API name (uptime, starttime...)
+    :param Callable[[*channels], any] prefetch: Fetches every channel at once
+
+    :return: One line per channel or a list of
+             {"channel": channel, "response": text} """
+    params = request.GET
+    channels = list(dict.fromkeys(c.strip() for c in params.get("channels", "").split(",") if c.strip()))
+    if not channels:
+      return HttpResponse("You need to specify some channels.", content_type="text/plain; charset=UTF-8")
+    if len(channels) > self.batch_limit:
+      return HttpResponseBadRequest(self.batch_limit_msg.format(limit=self.batch_limit), content_type="text/plain; charset=UTF-8")
+
+    with background(), suppress(*self.handled_errors):
+      prefetch(*channels)
+    handler = getattr(self, f"_{resource}")
+    responses = [handler(request, channel=channel).content.decode() for channel in channels]
+
+    if params.get("output") == "json":
+      return JsonResponse([
+        { "channel": channel, "response": response } for channel, response in zip(channels, responses)
+      ], safe=False)
+    return HttpResponse("\n".join(responses), content_type="text/plain; charset=UTF-8")
+
+  def _followers(self, request, channel):
+    """ Every follower of a channel and how long they've been following it.
+    Must define followers which takes the channel name and returns its name
+    and an iterator of Follow lists. Each list is written as soon as it
+    arrives so memory stays bounded whatever the number of followers.
+
+    :param request: Current http request
+      :queryparam str msg: Message for each follower, same as followage
+      :queryparam str output: One JSON object per line when it's "ndjson", CSV otherwise
+    :param str channel: Channel's name
+
+    :return: Streamed follower, followed_at and response of each follower.
+    An error halfway through ends the export with a line holding its message """
+    params = request.GET
+    ndjson = params.get("output") == "ndjson"
+    try:
+      channel_name, pages = self.followers(channel)
+    except self.handled_errors as e:
+      self._count_error("followers", e)
+      response = HttpResponse(self._error_msg(params, e), content_type="text/plain; charset=UTF-8")
+      response[self.error_header] = type(e).__name__
+      return response
+
+    if ndjson:
+      return StreamingHttpResponse(self._follower_lines(params, pages, ndjson), content_type="application/x-ndjson; charset=UTF-8")
+    response = StreamingHttpResponse(self._follower_lines(params, pages, ndjson), content_type="text/csv; charset=UTF-8")
+    response["Content-Disposition"] = f'attachment; filename="{channel_name}-followers.csv"'
+    return response
+
+  def _follower_lines(self, params, pages, ndjson):
+    """ Lines of a followers export, a chunk for each page.
+
+    :param QueryString params: Query parameters from the request
+    :param Iterator[list] pages: Follow records of each page
+    :param bool ndjson: One JSON object per line instead of CSV
+
+    :return Iterator[str]: Lines of every page """
+    if not ndjson:
+      yield self._export_chunk([self.followers_columns], ndjson)
+    try:
+      for page in pages:
+        yield self._export_chunk((
+          (follower, date.isoformat(), self._timespan(self.followage_msg, params, date, follower=follower, channel=channel))
+          for follower, channel, date in page
+        ), ndjson)
+    except self.handled_errors as e:
+      self._count_error("followers", e)
+      error = self._error_msg(params, e)
+      yield json.dumps({ "error": error }) + "\n" if ndjson else self._export_chunk([("", "", error)], ndjson)
+
+  def _export_chunk(self, rows, ndjson):
+    """ Rows of an export as CSV or NDJSON lines """
+    if ndjson:
+      return "".join(json.dumps(dict(zip(self.followers_columns, row))) + "\n" for row in rows)
+    lines = StringIO()
+    csv.writer(lines).writerows(rows)
+    return lines.getvalue()
+
+  def _error_msg(self, params, error):
+    """ Message for the most common API request exceptions
+
+    :param QueryString params: Query parameters from the request
+    :param Exception error: One of the handled_errors
+
+    :return str: Error message to respond with """
+    if isinstance(error, NotImplementedError):
+      return f"The {self.provider.capitalize()} API does not give access to this information."
+    if isinstance(error, self.timeout_errors):
+      return f"External request to {self.provider.capitalize()} servers timed out. Try again."
+    if isinstance(error, RateLimited):
+      return f"Too many requests to {self.provider.capitalize()} servers. Try again in a minute."
+    if isinstance(error, TextAPI.UserDoesNotExist):
+      return safeformat(params.get("not_found", self.user_not_found_msg),
+        keyword=error.keyword)
+    if isinstance(error, TextAPI.NotFollowing):
+      return safeformat(params.get("error_msg", self.followage_error),
+        channel=error.channel, follower=error.follower)
+    if isinstance(error, TextAPI.NotLive):
+      return safeformat(params.get("error_msg", self.uptime_error),
+        channel=error.channel)
+    return params.get("error_msg", self.invalid_login_msg)
+
   def _follow_date(fn):
     @wraps(fn)
     def follow_decorator(self, params, channel):
@@ -98,6 +240,7 @@ class TextAPI:
       "followage" which takes 2 parameters (follower, channel) both are
       arbitrary strings provided by the user which have to be used
       to get the the follower, channel and date of follow from the API
+      as a Follow record
 
       :param QueryString params: Optional query params
         :queryparam str from: The follower's name (required)
@@ -110,8 +253,9 @@ class TextAPI:
       follower_name, channel_name, date = self.followage(follower, channel)
       action, default_msg = fn(self, params, channel)
 
-      return action(default_msg, params, date,
-        follower=follower_name, channel=channel_name)
+      with timed("format"):
+        return action(default_msg, params, date,
+          follower=follower_name, channel=channel_name)
     return follow_decorator
 
   def _channel_date(fn):
@@ -120,12 +264,13 @@ class TextAPI:
       """ Formatting a date belonging to a channel.
       Must define both account_creation and uptime functions. They take 1
       parameter which is the channel name to search. And must also
-      return a tuple consisting of a date and the channel name
+      return a ChannelDate record with the date and the channel name
 
       :param channel: Channel's name """
       action, default_msg, channel_date = fn(self, params, channel)
       date, channel_name = channel_date(channel)
-      return action(default_msg, params, date, channel=channel_name)
+      with timed("format"):
+        return action(default_msg, params, date, channel=channel_name)
     return channel_date_decorator
 
   @_textapi
@@ -164,17 +309,29 @@ class TextAPI:
     """ Calculating the time a user has been live streaming. """
     return self._timespan, self.uptime_msg, self.uptime
 
+  @cached_property
+  def delta(self):
+    """ Parses time difference strings """
+    from stuff7.utils.parsers import TimeDeltaParser
+    return TimeDeltaParser()
+
+  @cached_property
+  def tz(self):
+    """ Parses timezones """
+    from stuff7.utils.parsers import TimezoneParser
+    return TimezoneParser()
+
   def _timespan(self, default_msg, params, date, **options):
     """ Calculating the timespan between a date and now.
 
     :param str default_msg: Message to be used and formatted if there's no msg in the query string
     :param QueryString params: Query parameters from the request
       :queryparam str msg: User provided message to be formatted
-    :param str date: Date from which the timespan will be calculated
+    :param datetime date: Date from which the timespan will be calculated
     :param dict options: Keywords to replace in the string
 
     :return str: Formatted timespan """
-    date = parse(date)
+    if isinstance(date, str): date = parse_date(date)
     msg = params.get("msg", default_msg)
     parsed = self.delta.parse(msg, datetime.now(tz=date.tzinfo), date)
 
@@ -188,20 +345,24 @@ class TextAPI:
       :queryparam str tz: Date will be displayed in this timezone (Default: UTC)
       :queryparam str format: Date format, can be short, medium, long or full (Default: full)
       :queryparam str locale: Date will be displayed using this language (Default: en)
+    :param datetime date: Date to format
     :param str channel: Channel's name """
-    date = parse(date)
+    from pytz.exceptions import UnknownTimeZoneError
+    from stuff7.utils.parsers import resolve_timezone
+    from .dates import get_date_formatter
+    if isinstance(date, str): date = parse_date(date)
 
     with suppress(UnknownTimeZoneError, KeyError):
-      date = date.astimezone(self.tz.parsetz(*params["tz"].split("_")[:2]))
+      date = date.astimezone(resolve_timezone(*params["tz"].split("_")[:2]))
 
     msg = params.get("msg", default_msg)
     date_format = params.get("format", "full")
     date_locale = params.get("locale", "en")
 
     try:
-      date = format_datetime(date, format=date_format, locale=date_locale)
-    except (UnknownLocaleError, ValueError):
-      date = format_datetime(date, format=date_format, locale="en")
+      date = get_date_formatter(date_locale, date_format).format(date)
+    except ValueError:
+      date = get_date_formatter("en", date_format).format(date)
     except KeyError as e:
       return (
         f"There was an error parsing the date: {e}. "
@@ -227,3 +388,101 @@ class TextAPI:
 
   class InvalidLogin(APIError):
     pass
+
+  @cached_property
+  def timeout_errors(self):
+    """ Upstream request timeouts reported to the user """
+    from requests.exceptions import ReadTimeout
+    return (ReadTimeout,)
+
+  @cached_property
+  def handled_errors(self):
+    """ Exceptions turned into a plain text response by _textapi """
+    return (NotImplementedError, *self.timeout_errors, RateLimited, TextAPI.APIError)
+
+
+class AsyncTextAPI(TextAPI):
+  """ Text APIs served by an ASGI server.
+  Same as TextAPI but handlers are coroutines returning the text of the
+  response, so followage, uptime and account_creation must be coroutines. """
+  @cached_property
+  def timeout_errors(self):
+    from requests.exceptions import ReadTimeout
+    from httpx import ConnectTimeout, ReadTimeout as AsyncReadTimeout
+    return (ReadTimeout, ConnectTimeout, AsyncReadTimeout)
+
+  def _textapi(fn):
+    """ Handles common API request exceptions
+
+    :param Callable[[self, params, **kwargs], Awaitable[str]] fn: Handler for the request.
+    :return Callable[[self, params, **kwargs], Awaitable[str]]: Handler returning
+    an error message if there was an exception. """
+    @wraps(fn)
+    async def decorator(self, params, **kwargs):
+      resource = fn.__name__.lstrip("_")
+      with tracking() as phases:
+        start = perf_counter()
+        try:
+          return await fn(self, params, **kwargs)
+        except self.handled_errors as e:
+          self._count_error(resource, e)
+          return ErrorMessage(self._error_msg(params, e), type(e).__name__)
+        finally:
+          self._observe(resource, phases, perf_counter() - start)
+    return decorator
+
+  def _follow_date(fn):
+    @wraps(fn)
+    async def follow_decorator(self, params, channel):
+      """ Same as TextAPI._follow_date awaiting followage """
+      follower = params.get("from")
+      if follower is None:
+        return "You need to specify a follower."
+
+      follower_name, channel_name, date = await self.followage(follower, channel)
+      action, default_msg = fn(self, params, channel)
+
+      with timed("format"):
+        return action(default_msg, params, date,
+          follower=follower_name, channel=channel_name)
+    return follow_decorator
+
+  def _channel_date(fn):
+    @wraps(fn)
+    async def channel_date_decorator(self, params, channel):
+      """ Same as TextAPI._channel_date awaiting the date getter """
+      action, default_msg, channel_date = fn(self, params, channel)
+      date, channel_name = await channel_date(channel)
+      with timed("format"):
+        return action(default_msg, params, date, channel=channel_name)
+    return channel_date_decorator
+
+  @_textapi
+  @_follow_date
+  def _followdate(self, params, channel):
+    return self._formatdate, self.followdate_msg
+
+  @_textapi
+  @_follow_date
+  def _followage(self, params, channel):
+    return self._timespan, self.followage_msg
+
+  @_textapi
+  @_channel_date
+  def _joined(self, params, channel):
+    return self._formatdate, self.joined_msg, self.account_creation
+
+  @_textapi
+  @_channel_date
+  def _accountage(self, params, channel):
+    return self._timespan, self.accountage_msg, self.account_creation
+
+  @_textapi
+  @_channel_date
+  def _starttime(self, params, channel):
+    return self._formatdate, self.starttime_msg, self.uptime
+
+  @_textapi
+  @_channel_date
+  def _uptime(self, params, channel):
+    return self._timespan, self.uptime_msg, self.uptime
@@ -1,12 +1,32 @@
+from hashlib import sha1
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from rest_framework import viewsets, mixins
-from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
 
+from stuff7.settings import CUSTOMAPIS_MAX_AGE
 from .serializers import CustomAPIsSerializer
 
+def render():
+  """ Rendering the custom APIs payload, PROVIDERS, TEXT_APIS and PARAM
+  only change with the code so a new ETag comes with every change.
+
+  :return tuple: JSON bytes and their entity tag (a hash of the content) """
+  content = JSONRenderer().render(CustomAPIsSerializer().data)
+  return content, f'"{sha1(content).hexdigest()}"'
+
 # ViewSets define the view behavior.
 class CustomAPIsViewSet(mixins.ListModelMixin,
                       viewsets.GenericViewSet):
+  # Rendered once at startup
+  content, etag = render()
 
   def list(self, request):
-    serializer = CustomAPIsSerializer()
-    return Response(serializer.data)
+    """ Text APIs and the params they support
+    GET /api/customapis/ """
+    response = (get_conditional_response(request, etag=self.etag) or
+      HttpResponse(self.content, content_type="application/json"))
+    response["ETag"] = self.etag
+    patch_cache_control(response, public=True, max_age=CUSTOMAPIS_MAX_AGE)
+    return response
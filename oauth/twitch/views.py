@@ -1,5 +1,7 @@
-from oauth.views import OAuthClient
-from oauth.textapis import TextAPI
+from oauth.views import OAuthClient, AsyncOAuthClient
+from oauth.ratelimit import background
+from oauth.textapis import TextAPI, AsyncTextAPI, cached, acached, cache, cache_key
+from oauth.textapis import Follow, ChannelDate, parse_date
 
 class TwitchOAuthClient(OAuthClient, TextAPI):
   """ Offers access to multiple resources from the Twitch API
@@ -11,6 +13,11 @@ class TwitchOAuthClient(OAuthClient, TextAPI):
   authorization_url = f"{oauth_url}/authorize"
   token_url = f"{oauth_url}/token"
   scope = ("channel:read:subscriptions",)
+  # Maximum number of users Helix accepts in a single request
+  batch_size = 100
+  batch_methods = { "uptime": "uptimes" }
+  # Helix default for app access tokens
+  rate_limit = 800
   
   def userinfo(self, data):
     """ Packing user info """
@@ -21,53 +28,274 @@ class TwitchOAuthClient(OAuthClient, TextAPI):
       "thumbnail":data["profile_image_url"],
     }
 
-  def fetchjson(self, *args, **kwargs):
-    """ Unpacking API response """
+  def fetchjson(self, *args, first=True, page=False, **kwargs):
+    """ Unpacking API response
+
+    :param bool first: Whether to return only the first item or all of them
+    :param bool page: Whether to return the whole page, pagination included """
+    response = super().fetchjson(*args, **kwargs)
     try:
-      return super().fetchjson(*args, **kwargs)["data"][0]
+      data = response["data"]
     except KeyError:
       raise TextAPI.InvalidLogin()
+    if page: return response
+    return data[0] if first else data
+
+  def login_param(self, login):
+    """ Query param used to look up a user by name or id """
+    return "id" if login.isdigit() else "login"
 
+  @cached("users")
   def get_user(self, login):
     """ Fetching user id and name.
 
     :param str|int login: user's name or id
 
     :return tuple: id and username if found """
-    action = { True: "id", False: "login" }
     try:
-      data = self.usecreds(f"users?{action[login.isdigit()]}={login}")
+      data = self.usecreds(f"users?{self.login_param(login)}={login}")
       return data["id"], data["display_name"]
     except IndexError:
       raise TextAPI.UserDoesNotExist(keyword=login)
 
+  def get_users(self, *logins):
+    """ Fetching multiple users' id and name in as few requests as possible.
+    Shares the cache with get_user and only asks Twitch for the users
+    missing from it, up to batch_size users per request.
+
+    :param str|int logins: users' names or ids
+
+    :return list: id and username for each login in the same order
+    Raises UserDoesNotExist for the first login that wasn't found """
+    return [cache.unpack(entry) for entry in self.user_entries(*logins)]
+
+  def user_entries(self, *logins):
+    """ Same as get_users without raising for the users that weren't found.
+
+    :param str|int logins: users' names or ids
+
+    :return list: Cache entries (see ResponseCache.unpack) for each login """
+    users, missing = self.cached_users(logins)
+    for batch in self.batches(missing):
+      self.cache_users(users, batch, self.usecreds(self.users_query(batch), first=False))
+    return [users[cache_key(self, "get_user", login)] for login in logins]
+
+  def cached_users(self, logins):
+    """ Looking up users in the cache.
+
+    :param list logins: users' names or ids
+
+    :return tuple: Cache entries by key (None for missing ones)
+    and the list of logins missing from the cache """
+    return self.cached_entries("users", "get_user", logins)
+
+  def cached_entries(self, resource, name, items):
+    """ Looking up the results of a cached method for multiple items.
+
+    :param str resource: Kind of resource the method returns
+    :param str name: Method name
+    :param list items: Argument for each call
+
+    :return tuple: Cache entries by key (None for missing ones)
+    and the list of items missing from the cache """
+    entries = {}
+    missing = []
+    for item in items:
+      key = cache_key(self, name, item)
+      found, entry = cache.get(resource, key)
+      if found:
+        entries[key] = entry
+      elif key not in entries:
+        entries[key] = None
+        missing.append(item)
+    return entries, missing
+
+  def cache_users(self, users, batch, data):
+    """ Caching the users returned for a batch, including the missing ones.
+
+    :param dict users: Cache entries by key to be filled
+    :param list batch: Requested users' names or ids
+    :param list data: Users returned by Twitch """
+    for user_data in data:
+      user = user_data["id"], user_data["display_name"]
+      for login in (user_data["id"], user_data["login"]):
+        key = cache_key(self, "get_user", login)
+        cache.set("users", key, user)
+        users[key] = (True, user)
+    for login in batch:
+      key = cache_key(self, "get_user", login)
+      if users[key] is None:
+        error = TextAPI.UserDoesNotExist(keyword=login)
+        cache.set("users", key, error)
+        users[key] = (False, error)
+
+  def batches(self, items):
+    """ Splitting items in chunks of batch_size """
+    return (items[i:i+self.batch_size] for i in range(0, len(items), self.batch_size))
+
+  def users_query(self, logins):
+    """ Helix users endpoint for multiple users """
+    return "users?" + "&".join(f"{self.login_param(login)}={login}" for login in logins)
+
+  def streams_query(self, channels):
+    """ Helix streams endpoint for multiple channels """
+    return f"streams?first={len(channels)}&" + "&".join(f"user_login={channel}" for channel in channels)
+
   def account_creation(self, channel):
     """ Twitch API does not give access to the account creation date """
     raise NotImplementedError
 
+  @cached("follows")
   def followage(self, follower, channel):
     """ Fetching follow info """
-    follower_id, follower_name = self.get_user(follower)
-    channel_id, channel_name = self.get_user(channel)
+    (follower_id, follower_name), (channel_id, channel_name) = self.get_users(follower, channel)
 
     try:
       data = self.usecreds(f"users/follows?from_id={follower_id}&to_id={channel_id}&first=1")
     except IndexError:
       raise TextAPI.NotFollowing(follower=follower_name, channel=channel_name)
     
-    return data["from_name"], data["to_name"], data["followed_at"]
+    return Follow(data["from_name"], data["to_name"], parse_date(data["followed_at"]))
+
+  def followers(self, channel):
+    """ Fetching every follower of a channel.
+
+    :param str channel: Channel's name or id
+
+    :return tuple: Channel's name and an iterator of Follow lists, one for each page """
+    channel_id, channel_name = self.get_user(channel)
+    return channel_name, self.follower_pages(channel_id)
+
+  def follower_pages(self, channel_id):
+    """ Walking the followers of a channel a page at a time.
+    The next page is requested while the current one is being consumed,
+    so no more than two pages are held at once.
+
+    :param str channel_id: Channel's id
+
+    :return Iterator[list]: Follow records of each page """
+    page = self.submit(self.follower_page, channel_id)
+    try:
+      while page is not None:
+        data = page.result()
+        cursor = data.get("pagination", {}).get("cursor")
+        page = self.submit(self.follower_page, channel_id, cursor) if cursor and data["data"] else None
+        yield [Follow(follow["from_name"], follow["to_name"], parse_date(follow["followed_at"])) for follow in data["data"]]
+    finally:
+      if page is not None: page.cancel()
+
+  def follower_page(self, channel_id, cursor=None):
+    """ Page of a channel's followers, exports leave part
+    of the budget to the Text APIs
+
+    :param str channel_id: Channel's id
+    :param str cursor: Pagination cursor of the page, None for the first one
+
+    :return dict: Followers and the cursor of the next page """
+    with background():
+      return self.usecreds(self.followers_query(channel_id, cursor), page=True)
+
+  def followers_query(self, channel_id, cursor=None):
+    """ Helix users/follows endpoint for a page of a channel's followers """
+    return f"users/follows?to_id={channel_id}&first={self.batch_size}" + (f"&after={cursor}" if cursor else "")
 
+  @cached("streams")
   def uptime(self, channel):
     """ Fetching current stream info if any """
     try:
       data = self.usecreds(f"streams?user_login={channel}")
-      return data["started_at"], data["user_name"]
+      return ChannelDate(parse_date(data["started_at"]), data["user_name"])
     except IndexError:
       channel_id, channel_name = self.get_user(channel)
       raise TextAPI.NotLive(channel=channel_name)
 
+  def uptimes(self, *channels):
+    """ Fetching multiple channels' current stream in as few requests as possible.
+    Shares the cache with uptime and only asks Twitch for the channels
+    missing from it, up to batch_size channels per request.
+
+    :param str channels: channels' names
+
+    :return list: Cache entries (see ResponseCache.unpack) for each channel """
+    streams, missing = self.cached_entries("streams", "uptime", channels)
+    for batch in self.batches(missing):
+      data = self.usecreds(self.streams_query(batch), first=False)
+      live = { stream.get("user_login", stream["user_name"]).lower(): stream for stream in data }
+      offline = [channel for channel in batch if channel.lower() not in live]
+      users = dict(zip(offline, self.user_entries(*offline)))
+      for channel in batch:
+        if channel.lower() in live:
+          stream = live[channel.lower()]
+          value = ChannelDate(parse_date(stream["started_at"]), stream["user_name"])
+        else:
+          found, user = users[channel]
+          value = TextAPI.NotLive(channel=user[1]) if found else user
+        cache.set("streams", cache_key(self, "uptime", channel), value)
+        streams[cache_key(self, "uptime", channel)] = (not isinstance(value, Exception), value)
+    return [streams[cache_key(self, "uptime", channel)] for channel in channels]
+
+class AsyncTwitchOAuthClient(AsyncOAuthClient, AsyncTextAPI, TwitchOAuthClient):
+  """ TwitchOAuthClient for coroutines, shares the cache with it. """
+
+  async def fetchjson(self, *args, first=True, page=False, **kwargs):
+    """ Unpacking API response
+
+    :param bool first: Whether to return only the first item or all of them
+    :param bool page: Whether to return the whole page, pagination included """
+    response = await super().fetchjson(*args, **kwargs)
+    try:
+      data = response["data"]
+    except KeyError:
+      raise TextAPI.InvalidLogin()
+    if page: return response
+    return data[0] if first else data
+
+  @acached("users")
+  async def get_user(self, login):
+    """ Fetching user id and name. """
+    try:
+      data = await self.usecreds(f"users?{self.login_param(login)}={login}")
+      return data["id"], data["display_name"]
+    except IndexError:
+      raise TextAPI.UserDoesNotExist(keyword=login)
+
+  async def get_users(self, *logins):
+    """ Fetching multiple users' id and name in as few requests as possible. """
+    users, missing = self.cached_users(logins)
+    batches = list(self.batches(missing))
+    responses = await self.gather(*(self.usecreds(self.users_query(batch), first=False) for batch in batches))
+    for batch, data in zip(batches, responses):
+      self.cache_users(users, batch, data)
+    return [cache.unpack(users[cache_key(self, "get_user", login)]) for login in logins]
+
+  @acached("follows")
+  async def followage(self, follower, channel):
+    """ Fetching follow info """
+    (follower_id, follower_name), (channel_id, channel_name) = await self.get_users(follower, channel)
+
+    try:
+      data = await self.usecreds(f"users/follows?from_id={follower_id}&to_id={channel_id}&first=1")
+    except IndexError:
+      raise TextAPI.NotFollowing(follower=follower_name, channel=channel_name)
+
+    return Follow(data["from_name"], data["to_name"], parse_date(data["followed_at"]))
+
+  @acached("streams")
+  async def uptime(self, channel):
+    """ Fetching current stream info if any """
+    try:
+      data = await self.usecreds(f"streams?user_login={channel}")
+      return ChannelDate(parse_date(data["started_at"]), data["user_name"])
+    except IndexError:
+      channel_id, channel_name = await self.get_user(channel)
+      raise TextAPI.NotLive(channel=channel_name)
+
 twitch = TwitchOAuthClient(
   include_client_id=True,
   include_client_secret=True,
-  include_client_credentials=True,
+)
+
+atwitch = AsyncTwitchOAuthClient(
+  include_client_id=True,
+  include_client_secret=True,
 )
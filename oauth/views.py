@@ -1,20 +1,29 @@
 import json
+import asyncio
+from functools import partial
+from time import sleep
 from collections import namedtuple
-from contextlib import suppress
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor
 
-from django.db import OperationalError
-from django.db.utils import ProgrammingError
 from django.shortcuts import redirect
 from django.contrib.auth import login
 from django.forms.models import model_to_dict
 from django.urls import path
+from django.http import JsonResponse
 
-from requests_oauthlib import OAuth2Session
-from oauthlib.oauth2 import BackendApplicationClient
+from channels.db import database_sync_to_async
 
-from stuff7.settings import host, env
+from stuff7.settings import host, env, OAUTH_CREDENTIALS, OAUTH_RATELIMIT
+from stuff7.utils.metrics import timed
+from oauth import metrics
 from oauth.models import OAuthCredentials
 from oauth.models import OAuthUser
+from oauth.sessions import SessionPool, AsyncSessionPool, Attempts
+from oauth.credentials import CredentialsRefresher
+from oauth.ratelimit import RateLimiter, RateLimited
+from oauth.middleware import fast_path
+from oauth.textapis.consumers import TextAPIConsumer
 
 class OAuthClient:
   """ Base class for all OAuth 2 clients """
@@ -26,14 +35,78 @@ class OAuthClient:
   refresh_url = None
   scope = None
   endpoints = {}
-
-  def __init__(self, include_client_id=None, include_client_secret=None, include_client_credentials=None):
-    """ Constructs a new OAuth 2 Client """
+  # Text API routes and the provider method each of them needs
+  textapis = {
+    "joined": "account_creation",
+    "accountage": "account_creation",
+    "followage": "followage",
+    "followdate": "followage",
+    "uptime": "uptime",
+    "starttime": "uptime",
+  }
+  # Streaming exports and the provider method each of them needs
+  exports = {
+    "followers": "followers",
+  }
+  # Provider methods fetching multiple channels at once, a Text API
+  # using one of these methods is also served for many channels at
+  # /api/{provider}/{resource}?channels=a,b,c (up to TextAPI.batch_limit)
+  batch_methods = {}
+  # Outbound connection settings, can be overridden per provider
+  # with {PROVIDER}_POOL_SIZE, {PROVIDER}_TIMEOUT, {PROVIDER}_RETRIES
+  # and {PROVIDER}_BACKOFF environment variables
+  pool_size = 10
+  timeout = 10
+  retries = 3
+  backoff = 0.3
+  # Requests allowed every rate_period seconds, None for no limit.
+  # Overridden with {PROVIDER}_RATE_LIMIT (0 disables it)
+  rate_limit = None
+  rate_period = 60
+
+  def __init__(self, include_client_id=None, include_client_secret=None):
+    """ Constructs a new OAuth 2 Client.
+    Nothing is requested until the client is used, client
+    credentials are loaded (or fetched) on first use. """
     PROVIDER = self.provider.upper()
     self.client_id = env(f"{PROVIDER}_CLIENT_ID")
     self.client_secret = env(f"{PROVIDER}_CLIENT_SECRET")
     self.redirect_uri = f"{host}/api/oauth/{self.provider}/check/"
     self.state = f"{self.provider}_oauth_state"
+    # Point the client somewhere else (e.g. a local stand-in provider)
+    # with {PROVIDER}_API_URL and {PROVIDER}_TOKEN_URL
+    self.api = env(f"{PROVIDER}_API_URL", default=self.api)
+    self.token_url = env(f"{PROVIDER}_TOKEN_URL", default=self.token_url)
+    # Keeps outbound requests within the provider's rate limit
+    rate_limit = env.int(f"{PROVIDER}_RATE_LIMIT", default=self.rate_limit or 0)
+    self.limiter = rate_limit and RateLimiter(
+      self.provider,
+      rate_limit,
+      period=self.rate_period,
+      reserve=OAUTH_RATELIMIT["RESERVE"],
+      timeout=OAUTH_RATELIMIT["TIMEOUT"],
+      alias=OAUTH_RATELIMIT["ALIAS"],
+    ) or None
+    # Keep-alive sessions shared by every outbound API request,
+    # send() retries rate limited requests itself
+    self.pool = SessionPool(
+      self.client_id,
+      size=env.int(f"{PROVIDER}_POOL_SIZE", default=self.pool_size),
+      timeout=env.float(f"{PROVIDER}_TIMEOUT", default=self.timeout),
+      retries=env.int(f"{PROVIDER}_RETRIES", default=self.retries),
+      backoff=env.float(f"{PROVIDER}_BACKOFF", default=self.backoff),
+      resend=self.limiter is None,
+    )
+    # Runs independent API requests concurrently
+    self.executor = ThreadPoolExecutor(self.pool.size, thread_name_prefix=self.provider)
+    # Renews client credentials before they expire, started on first use
+    self.credentials = None
+    self.refresh_credentials = OAUTH_CREDENTIALS["REFRESH"]
+    self.refresher = CredentialsRefresher(
+      self,
+      margin=OAUTH_CREDENTIALS["MARGIN"],
+      interval=OAUTH_CREDENTIALS["INTERVAL"],
+    )
     
     if self.refresh_url is None: self.refresh_url = self.token_url
 
@@ -42,14 +115,10 @@ class OAuthClient:
       "client_secret": include_client_secret and self.client_secret,
       "scope": self.scope,
     }
-    
-    # Can throw exception on first migration. Nothing to worry about.
-    with suppress(OperationalError, ProgrammingError):
-      if include_client_credentials:
-        self.get_credentials()
 
   def authorize(self, request):
     """ Redirect user to provider for authorization """
+    from requests_oauthlib import OAuth2Session
     client = OAuth2Session(self.client_id, scope=self.scope, redirect_uri=self.redirect_uri)
     authorization, request.session[self.state] = client.authorization_url(self.authorization_url)
     return redirect(authorization)
@@ -61,6 +130,7 @@ class OAuthClient:
     callback URL /api/oauth/{provider}/check/. We'll use the code included
     in the redirect URL to obtain an access token.
     """
+    from requests_oauthlib import OAuth2Session
     client = OAuth2Session(self.client_id, state=request.session[self.state], redirect_uri=self.redirect_uri)
     url = request.build_absolute_uri()
     token = client.fetch_token(self.token_url, **self.options, authorization_response=url)
@@ -123,7 +193,45 @@ class OAuthClient:
     :param str resource: Resource name or raw endpoint
 
     :return dict: JSON response for the API resource if any """
-    return OAuth2Session(self.client_id).get(self.endpoint(resource)).json()
+    return self.send(self.endpoint(resource)).json()
+
+  def send(self, url, **kwargs):
+    """ Sending a GET request within the provider's rate limit.
+    Waits for the budget if it ran out, retrying once if the provider
+    still responds with 429 Too Many Requests. Raises RateLimited if
+    the budget doesn't come back in time. Server errors are retried
+    here rather than by the pool so every attempt takes its token.
+
+    :param str url: Full url to request
+    :param kwargs: Arguments for SessionPool.get
+
+    :return Response: Response for the request """
+    attempts = Attempts(self.pool.retries, self.pool.backoff, self.pool.retry_statuses)
+    for delay in attempts:
+      sleep(delay)
+      if self.limiter: self.limiter.acquire()
+      with timed("upstream"):
+        response = self.pool.get(url, **kwargs)
+      if self.received(response, attempts):
+        return response
+    raise RateLimited(self.provider, self.limiter.window()[1])
+
+  def received(self, response, attempts):
+    """ Keeping track of a provider response.
+
+    :param response: Response from the provider
+    :param Attempts attempts: Attempts left for the request
+
+    :return bool: False if it has to be sent again """
+    metrics.upstream_responses.inc(provider=self.provider, status=response.status_code)
+    if self.limiter is None:
+      return True
+    self.limiter.update(response.headers)
+    return not attempts.retry(response.status_code)
+
+  def ratelimit(self, request):
+    """ Current budget for requests to the provider """
+    return JsonResponse(self.limiter.budget() if self.limiter else {})
 
   def fetchjson(self, resource, token, token_updater=None):
     """ Fetching protected API resource.
@@ -133,12 +241,32 @@ class OAuthClient:
     :param Callable[[token], None] token_updater: What to do
     if the token gets updated
 
-    :return OAuth2Session: """
-    return OAuth2Session(
-      self.client_id,
+    :return dict: JSON response for the API resource if any """
+    return self.send(
+      self.endpoint(resource),
       token=token,
       token_updater=token_updater or self.token_updater,
-    ).get(self.endpoint(resource), headers={"Client-ID": self.client_id}).json()
+      headers={"Client-ID": self.client_id},
+    ).json()
+
+  def gather(self, *calls):
+    """ Running independent calls concurrently.
+
+    :param Callable[[], any] calls: Functions to call
+
+    :return list: Results in the same order as the calls.
+    Raises the exception of the first call that failed if any """
+    futures = [self.submit(call) for call in calls]
+    return [future.result() for future in futures]
+
+  def submit(self, call, *args):
+    """ Running a call in the background.
+
+    :param Callable call: Function to call
+    :param args: Arguments for the call
+
+    :return Future: Result of the call """
+    return self.executor.submit(copy_context().run, call, *args)
 
   def token_updater(self, token):
     pass
@@ -147,32 +275,68 @@ class OAuthClient:
     """ Updating client credentials token.
 
     :param dict token: Updated token """
-    OAuthCredentials.objects.get(pk=self.provider).update(**self.stringify(token))
+    OAuthCredentials.objects.filter(pk=self.provider).update(**self.credentials_fields(token))
     self.credentials = token
 
-  def usecreds(self, resource):
+  def usecreds(self, resource, **kwargs):
     """ Fetching protected API resource using client credentials.
+    The credentials are loaded on first use and renewed in the background,
+    they're only renewed here if that failed and they already expired.
 
     :param str resource: Resource name or raw endpoint
 
     :return dict: JSON response for the API resource if any """
-    return self.fetchjson(resource, self.credentials, self.credentials_updater)
+    # Slow to import, it waits until the first request (see SessionPool)
+    from oauthlib.oauth2 import TokenExpiredError
+    if self.credentials is None:
+      self.get_credentials()
+    if self.refresh_credentials: self.refresher.start()
+    try:
+      return self.fetchjson(resource, self.credentials, self.credentials_updater, **kwargs)
+    except TokenExpiredError:
+      self.refresher.refresh()
+      return self.fetchjson(resource, self.credentials, self.credentials_updater, **kwargs)
 
   def get_credentials(self):
     """ Getting/Creating client credentials in database. """
     try:
       credentials = OAuthCredentials.objects.get(pk=self.provider)
-      self.credentials = model_to_dict(credentials, fields=(
-        "access_token", "expires_in", "scope", "token_type", "expires_at"
-      ))
+      self.credentials = self.credentials_dict(credentials)
     except OAuthCredentials.DoesNotExist:
-      client = OAuth2Session(self.client_id, client=BackendApplicationClient(self.client_id), scope=self.scope)
-      self.credentials = client.fetch_token(self.token_url, **self.options)
-      fields = { "id": self.provider, **self.stringify(self.credentials) }
+      self.credentials = self.fetch_credentials()
+      fields = { "id": self.provider, **self.credentials_fields(self.credentials) }
       credentials = OAuthCredentials(**fields)
       credentials.save()
 
-  def urls(self, url, name, resources, prefix=""):
+  def fetch_credentials(self):
+    """ Requesting a new client credentials token to the provider.
+
+    :return dict: Token object """
+    from requests_oauthlib import OAuth2Session
+    from oauthlib.oauth2 import BackendApplicationClient
+    client = OAuth2Session(self.client_id, client=BackendApplicationClient(self.client_id), scope=self.scope)
+    return client.fetch_token(self.token_url, **self.options)
+
+  def credentials_dict(self, credentials):
+    """ Token object for stored client credentials.
+
+    :param OAuthCredentials credentials: Stored credentials
+
+    :return dict: Token object """
+    return model_to_dict(credentials, fields=(
+      "access_token", "expires_in", "scope", "token_type", "expires_at"
+    ))
+
+  def credentials_fields(self, token):
+    """ OAuthCredentials fields for a token object.
+
+    :param dict token: Token object
+
+    :return dict: Fields to store """
+    fields = ("access_token", "expires_in", "scope", "token_type", "expires_at")
+    return { k: v for k, v in self.stringify(token).items() if k in fields }
+
+  def urls(self, url, name, resources, prefix="", view=None):
     """ Creating local endpoints for current provider.
 
     :param str url: Endpoint format
@@ -180,8 +344,10 @@ class OAuthClient:
     :param tuple|dict resources: Resources to be created for this endpoint
     :param str prefix: Prefix to be used in case function view is named
     differently from resource
+    :param Callable view: Makes the view of each handler, self.view by default
 
     :return list: List of paths """
+    view = view or self.view
     if type(resources) == tuple:
       resource_generator = ((resource, resource) for resource in resources)
     elif type(resources) == dict:
@@ -190,27 +356,41 @@ class OAuthClient:
 
     return [
       path(
-        url.format(provider=self.provider, resource=resource), getattr(self, f"{prefix}{resource}"),
+        url.format(provider=self.provider, resource=resource), view(getattr(self, f"{prefix}{resource}")),
         name=f"{self.provider}-{name}".format(provider=self.provider, resource=resource),
       ) for resource, func in resource_generator if hasattr(self, func)
     ]
 
+  def view(self, handler):
+    """ Routable view for a handler method """
+    return handler
+
+  def textapi_view(self, handler):
+    """ Routable view for a Text API handler, served by FastPathMiddleware """
+    return fast_path(self.view(handler))
+
   @property
   def urlpatterns(self):
     """ Creating urlpatterns for current OAuth 2 client. """
-    oauth = ("authorize", "check")
-    api = {
-      "joined": "account_creation",
-      "accountage": "account_creation",
-      "followage": "followage",
-      "followdate": "followage",
-      "uptime": "uptime",
-      "starttime": "uptime",
-    }
+    oauth = ("authorize", "check", "ratelimit")
 
     return [
       *self.urls(url="oauth/{provider}/{resource}/", name="oauth-{resource}", resources=oauth),
-      *self.urls(url="{provider}/<channel>/{resource}", name="{resource}", resources=api, prefix="_"),
+      *self.urls(url="{provider}/<channel>/{resource}", name="{resource}", resources=self.textapis, prefix="_", view=self.textapi_view),
+      *self.urls(url="{provider}/<channel>/{resource}", name="{resource}", resources=self.exports, prefix="_", view=self.textapi_view),
+      *self.batch_urls(),
+    ]
+
+  def batch_urls(self):
+    """ Creating batch Text API endpoints for current provider.
+
+    :return list: List of paths """
+    return [
+      path(
+        f"{self.provider}/{resource}",
+        fast_path(partial(self._batch, resource=resource, prefetch=getattr(self, self.batch_methods[func]))),
+        name=f"{self.provider}-{resource}-batch",
+      ) for resource, func in self.textapis.items() if func in self.batch_methods and hasattr(self, f"_{resource}")
     ]
 
   def stringify(self, token):
@@ -230,3 +410,91 @@ class OAuthClient:
       "thumbnail": string,
     } """
     raise NotImplementedError()
+
+class AsyncOAuthClient(OAuthClient):
+  """ Base class for OAuth 2 clients used from coroutines.
+  Requests go through a non-blocking connection pool and client
+  credentials are loaded from the database on first use. Text API
+  views are served as ASGI consumers (see oauth.routing). """
+  async_pool_size = 100
+
+  def __init__(self, include_client_id=None, include_client_secret=None):
+    """ Constructs a new async OAuth 2 Client """
+    super().__init__(include_client_id, include_client_secret)
+    PROVIDER = self.provider.upper()
+    self.pool = AsyncSessionPool(
+      self.client_id,
+      size=env.int(f"{PROVIDER}_ASYNC_POOL_SIZE", default=self.async_pool_size),
+      timeout=self.pool.timeout,
+      retries=self.pool.retries,
+      backoff=self.pool.backoff,
+      resend=self.pool.resend,
+    )
+
+  def view(self, handler):
+    """ ASGI consumer for a Text API handler coroutine """
+    return TextAPIConsumer.bind(handler)
+
+  @property
+  def urlpatterns(self):
+    """ Creating Text API urlpatterns for an ASGI URLRouter. """
+    return self.urls(url="{provider}/<channel>/{resource}", name="async-{resource}", resources=self.textapis, prefix="_")
+
+  async def pubfetch(self, resource):
+    """ Fetching public API resource.
+
+    :param str resource: Resource name or raw endpoint
+
+    :return dict: JSON response for the API resource if any """
+    return (await self.send(self.endpoint(resource))).json()
+
+  async def send(self, url, **kwargs):
+    """ Same as OAuthClient.send for coroutines """
+    attempts = Attempts(self.pool.retries, self.pool.backoff, self.pool.retry_statuses)
+    for delay in attempts:
+      await asyncio.sleep(delay)
+      if self.limiter: await self.limiter.aacquire()
+      with timed("upstream"):
+        response = await self.pool.get(url, **kwargs)
+      if self.received(response, attempts):
+        return response
+    raise RateLimited(self.provider, self.limiter.window()[1])
+
+  async def fetchjson(self, resource, token, token_updater=None):
+    """ Fetching protected API resource.
+
+    :param str resource: Resource name or raw endpoint
+    :param dict token: Token object for authentication
+    :param Callable[[token], None] token_updater: Unused, tokens are
+    never refreshed automatically
+
+    :return dict: JSON response for the API resource if any """
+    return (await self.send(
+      self.endpoint(resource),
+      token=token,
+      headers={"Client-ID": self.client_id},
+    )).json()
+
+  async def usecreds(self, resource, **kwargs):
+    """ Fetching protected API resource using client credentials.
+
+    :param str resource: Resource name or raw endpoint
+
+    :return dict: JSON response for the API resource if any """
+    from oauthlib.oauth2 import TokenExpiredError
+    if self.credentials is None:
+      await database_sync_to_async(self.get_credentials)()
+    if self.refresh_credentials: self.refresher.start()
+    try:
+      return await self.fetchjson(resource, self.credentials, **kwargs)
+    except TokenExpiredError:
+      await database_sync_to_async(self.refresher.refresh)()
+      return await self.fetchjson(resource, self.credentials, **kwargs)
+
+  async def gather(self, *calls):
+    """ Awaiting independent coroutines concurrently.
+
+    :param Awaitable calls: Coroutines to await
+
+    :return list: Results in the same order as the calls """
+    return await asyncio.gather(*calls)
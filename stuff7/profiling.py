@@ -0,0 +1,68 @@
+from cProfile import Profile
+
+from django.http import HttpResponse, Http404
+
+from stuff7.settings import PROFILING
+from stuff7.utils.profiling import SamplingProfiler, MemoryTracer, collapse_profile
+
+tracer = MemoryTracer(PROFILING["FRAMES"])
+
+def profiling_mode(request):
+  """ Profiler requested through ?__profile=<mode> or the X-Profile header.
+
+  :return str: "sampling", "cprofile" or None """
+  mode = request.GET.get("__profile") or request.headers.get("X-Profile")
+  if not mode or mode in ("0", "false"):
+    return None
+  return "cprofile" if mode == "cprofile" else "sampling"
+
+def allowed(request):
+  user = getattr(request, "user", None)
+  return user is not None and user.is_superuser
+
+def collapsed_response(stacks):
+  return HttpResponse(stacks, content_type="text/plain; charset=utf-8")
+
+class ProfilerMiddleware:
+  """ Profiles a single request for superusers, the response is replaced
+  by its collapsed stacks (sample counts or microseconds with cProfile).
+  Only installed when PROFILING is enabled, so it costs nothing otherwise.
+
+  GET /api/twitch/someone/uptime?__profile=1
+  GET /api/users/current/?__profile=cprofile """
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    mode = profiling_mode(request)
+    if mode is None or not allowed(request):
+      return self.get_response(request)
+    if mode == "cprofile":
+      profile = Profile()
+      profile.runcall(self.get_response, request)
+      return collapsed_response(collapse_profile(profile))
+    with SamplingProfiler(PROFILING["INTERVAL"]) as profiler:
+      self.get_response(request)
+    return collapsed_response(profiler.collapsed())
+
+def memory(request):
+  """ tracemalloc snapshots of the worker serving the request, for superusers.
+
+  GET /profiling/memory?action=start Starts tracing allocations
+  GET /profiling/memory Allocated bytes per stack
+  GET /profiling/memory?action=diff Growth since the previous snapshot
+  GET /profiling/memory?action=stop Stops tracing """
+  if not allowed(request):
+    raise Http404
+  action = request.GET.get("action", "snapshot")
+  if action == "start":
+    tracer.start()
+    return collapsed_response("Tracing memory allocations.\n")
+  if action == "stop":
+    tracer.stop()
+    return collapsed_response("Stopped tracing memory allocations.\n")
+  if not tracer.tracing:
+    return HttpResponse("Memory tracing isn't running, use ?action=start first.\n",
+      status=409, content_type="text/plain; charset=utf-8")
+  return collapsed_response(tracer.snapshot(diff=action == "diff"))
@@ -1,5 +1,14 @@
-from channels.routing import ProtocolTypeRouter
+from django.urls import path, re_path
+from channels.http import AsgiHandler
+from channels.routing import ProtocolTypeRouter, URLRouter
+
+import oauth.routing
 
 application = ProtocolTypeRouter({
-  # Empty for now (http->django views is added by default)
+  # Text APIs are served natively by async consumers,
+  # everything else goes to the regular django views
+  "http": URLRouter([
+    path("api/", URLRouter(oauth.routing.urlpatterns)),
+    re_path(r"", AsgiHandler),
+  ]),
 })
@@ -10,6 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
+import os
+from tempfile import gettempdir
+
 import environ
 
 root = environ.Path()
@@ -51,6 +54,8 @@ REST_FRAMEWORK = {
 
 MIDDLEWARE = [
   "django.middleware.security.SecurityMiddleware",
+  # Serves the Text APIs without the rest of the stack
+  "oauth.middleware.FastPathMiddleware",
   "django.contrib.sessions.middleware.SessionMiddleware",
   "django.middleware.common.CommonMiddleware",
   "django.middleware.csrf.CsrfViewMiddleware",
@@ -78,6 +83,69 @@ TEMPLATES = [
 ]
 
 AUTH_USER_MODEL = "user.User"
+
+# Text API response cache
+# BACKEND can be "local" (per process) or "django" (uses CACHES[ALIAS])
+TEXTAPI_CACHE = {
+  "BACKEND": env("TEXTAPI_CACHE_BACKEND", default="local"),
+  "OPTIONS": {
+    "max_entries": env.int("TEXTAPI_CACHE_MAX_ENTRIES", default=4096),
+    "alias": env("TEXTAPI_CACHE_ALIAS", default="default"),
+  },
+  # Seconds each kind of resource is cached
+  "TTLS": {
+    "users": env.int("TEXTAPI_CACHE_USERS_TTL", default=6*60*60),
+    "streams": env.int("TEXTAPI_CACHE_STREAMS_TTL", default=30),
+    "follows": env.int("TEXTAPI_CACHE_FOLLOWS_TTL", default=5*60),
+  },
+}
+
+# Seconds browsers may reuse /api/customapis/ before revalidating it,
+# its ETag changes whenever the Text APIs or their params change
+CUSTOMAPIS_MAX_AGE = env.int("CUSTOMAPIS_MAX_AGE", default=24*60*60)
+
+# JSON file keeping the timezone abbreviations between processes,
+# scanned once per process without it
+TZINDEX_PATH = env("TZINDEX_PATH", default=None)
+
+# Client credentials are renewed in the background MARGIN seconds
+# before they expire, checking at least every INTERVAL seconds
+OAUTH_CREDENTIALS = {
+  "REFRESH": env.bool("OAUTH_CREDENTIALS_REFRESH", default=True),
+  "MARGIN": env.int("OAUTH_CREDENTIALS_MARGIN", default=5*60),
+  "INTERVAL": env.int("OAUTH_CREDENTIALS_INTERVAL", default=60),
+}
+
+# Upstream rate limits, the buckets are kept in CACHES[ALIAS] which
+# has to be shared (the database cache or memcached) to be shared by workers,
+# a per process cache is refused with more than one WEB_CONCURRENCY worker.
+# Background requests leave RESERVE of the bucket to interactive ones
+# and nobody waits more than TIMEOUT seconds for it to refill
+OAUTH_RATELIMIT = {
+  "ALIAS": env("OAUTH_RATELIMIT_CACHE_ALIAS", default="default"),
+  "RESERVE": env.float("OAUTH_RATELIMIT_RESERVE", default=0.2),
+  "TIMEOUT": env.float("OAUTH_RATELIMIT_TIMEOUT", default=5),
+}
+
+# Metrics served at /metrics to INTERNAL_IPS. Every worker process keeps
+# its values in DIR, by default a temporary directory shared by the workers
+# of a server (they have the same parent process)
+METRICS = {
+  "DIR": env("METRICS_DIR", default=os.path.join(gettempdir(), f"stuff7-metrics-{os.getppid()}")),
+  "FLUSH_INTERVAL": env.float("METRICS_FLUSH_INTERVAL", default=1),
+}
+INTERNAL_IPS = env.list("INTERNAL_IPS", default=["127.0.0.1"])
+
+# Per request profiling (?__profile=1) and /profiling/memory for superusers,
+# nothing is installed unless enabled
+PROFILING = {
+  "ENABLED": env.bool("PROFILING", default=False),
+  "INTERVAL": env.float("PROFILING_INTERVAL", default=0.001),
+  "FRAMES": env.int("PROFILING_FRAMES", default=25),
+}
+if PROFILING["ENABLED"]:
+  MIDDLEWARE.append("stuff7.profiling.ProfilerMiddleware")
+
 # Channels
 ASGI_APPLICATION = "stuff7.routing.application"
 
@@ -128,3 +196,11 @@ if DEBUG:
   from .dev import *
 else:
   from .prod import *
+
+if (env.int("WEB_CONCURRENCY", default=1) > 1
+  and CACHES[OAUTH_RATELIMIT["ALIAS"]]["BACKEND"].endswith(".LocMemCache")):
+  from django.core.exceptions import ImproperlyConfigured
+  raise ImproperlyConfigured(
+    "Every worker would keep its own rate limit with a per process cache, "
+    "set CACHE_URL to a shared cache (e.g. dbcache://django_cache)"
+  )
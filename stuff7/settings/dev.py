@@ -1,6 +1,6 @@
 import os
 
-from .base import root
+from .base import root, env
 
 host = "http://localhost"
 
@@ -9,11 +9,16 @@ os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
 
 ALLOWED_HOSTS = ["localhost", "192.168.1.91"]
 
-# Database
+# Database, SQLITE_PATH points it somewhere else (e.g. a throwaway copy)
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 DATABASES = {
   "default": {
     "ENGINE": "django.db.backends.sqlite3",
-    "NAME": root("db.sqlite3"),
+    "NAME": env("SQLITE_PATH", default=root("db.sqlite3")),
   }
 }
+
+# Cache, CACHE_URL (e.g. memcache://127.0.0.1:11211) replaces the per process one
+CACHES = {
+  "default": env.cache("CACHE_URL", default="locmemcache://"),
+}
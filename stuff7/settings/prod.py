@@ -17,3 +17,10 @@ DATABASES = {
     "TEST_COLLATION": "utf8_general_ci",
   }
 }
+
+# Cache shared by every worker (rate limits included), the database one
+# is created with createcachetable, CACHE_URL (e.g. memcache://127.0.0.1:11211)
+# replaces it
+CACHES = {
+  "default": env.cache("CACHE_URL", default="dbcache://django_cache"),
+}
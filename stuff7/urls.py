@@ -1,14 +1,30 @@
 from django.urls import include, path
 from django.contrib.auth import logout as logout_user
 from django.shortcuts import redirect
+from django.http import HttpResponse, Http404
+
+from stuff7.settings import INTERNAL_IPS, PROFILING
+from oauth.metrics import registry
 
 def logout(request):
   logout_user(request)
   return redirect("/")
 
+def metrics(request):
+  """ Metrics of every worker in the Prometheus text format,
+  only available to INTERNAL_IPS """
+  if request.META.get("REMOTE_ADDR") not in INTERNAL_IPS:
+    raise Http404
+  return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 urlpatterns = [
   path("api/", include("user.urls")),
   path("logout/", logout, name="logout"),
+  path("metrics", metrics, name="metrics"),
 ]
 
+if PROFILING["ENABLED"]:
+  from stuff7.profiling import memory
+  urlpatterns.append(path("profiling/memory", memory, name="profiling-memory"))
+
 handler404 = "user.views.not_found"
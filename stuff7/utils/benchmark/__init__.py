@@ -0,0 +1,3 @@
+from .benchmark import *
+from .environment import *
+from .imports import *
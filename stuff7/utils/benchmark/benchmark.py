@@ -0,0 +1,78 @@
+from time import perf_counter
+from statistics import median
+
+def measure(fn, repeat=5, duration=0.2):
+  """ Measuring how fast a function runs.
+  The number of calls per round is calibrated so each
+  round takes about the given duration.
+
+  :param Callable[[], any] fn: Function to measure
+  :param int repeat: Number of rounds, the median round is reported
+  :param float duration: Approximate seconds per round
+
+  :return dict: Calls per second and microseconds per call """
+  number = 1
+  while True:
+    start = perf_counter()
+    for _ in range(number): fn()
+    elapsed = perf_counter() - start
+    if elapsed >= duration/10: break
+    number *= 10
+  number = max(1, int(number * duration/elapsed))
+
+  rounds = []
+  for _ in range(repeat):
+    start = perf_counter()
+    for _ in range(number): fn()
+    rounds.append((perf_counter() - start)/number)
+
+  seconds = median(rounds)
+  return {
+    "ops": round(1/seconds, 2),
+    "us": round(seconds*1e6, 3),
+  }
+
+def compare(baseline, candidate, **kwargs):
+  """ Measuring two implementations of the same thing.
+
+  :param Callable[[], any] baseline: Reference implementation
+  :param Callable[[], any] candidate: Implementation to compare
+
+  :return dict: Results for both and the candidate's speedup """
+  results = {
+    "baseline": measure(baseline, **kwargs),
+    "candidate": measure(candidate, **kwargs),
+  }
+  results["speedup"] = round(results["baseline"]["us"]/results["candidate"]["us"], 2)
+  return results
+
+def timing(result):
+  """ Microseconds per call of a benchmark result, the candidate's
+  when the result compares two implementations.
+
+  :param dict result: Result of measure or compare
+
+  :return float: Microseconds per call """
+  return result["candidate"]["us"] if "candidate" in result else result["us"]
+
+def diff(before, after):
+  """ Comparing the results of two runs of the same benchmarks
+  (e.g. on two commits).
+
+  :param dict before: Results by benchmark name of the reference run
+  :param dict after: Results by benchmark name of the new run
+
+  :return dict: Microseconds per call on both runs and the speedup
+  for every benchmark present in both, plus the bytes on both runs
+  for benchmarks counting them """
+  results = {}
+  for name in after:
+    if name not in before: continue
+    results[name] = {
+      "before": timing(before[name]),
+      "after": timing(after[name]),
+      "speedup": round(timing(before[name])/timing(after[name]), 2),
+    }
+    if "bytes" in before[name] and "bytes" in after[name]:
+      results[name]["bytes"] = { "before": before[name]["bytes"], "after": after[name]["bytes"] }
+  return results
@@ -0,0 +1,34 @@
+from contextlib import contextmanager
+
+@contextmanager
+def test_environment():
+  """ Django test environment with throwaway test databases,
+  so benchmarks never touch the real data. """
+  from django.test.utils import setup_databases, teardown_databases
+  from django.test.utils import setup_test_environment, teardown_test_environment
+  setup_test_environment()
+  databases = setup_databases(verbosity=0, interactive=False)
+  try:
+    yield
+  finally:
+    teardown_databases(databases, verbosity=0)
+    teardown_test_environment()
+
+def selected_bytes(queries, using="default"):
+  """ Bytes the database sent back for some queries, the SELECT
+  queries are run again to count the values they return.
+
+  :param list queries: Queries captured by CaptureQueriesContext
+  :param str using: Database alias
+
+  :return int: Bytes in every value returned """
+  from django.db import connections
+  size = lambda value: len(value) if isinstance(value, (bytes, memoryview)) else len(str(value).encode())
+  total = 0
+  with connections[using].cursor() as cursor:
+    for query in queries:
+      if not query["sql"].lstrip().upper().startswith("SELECT"):
+        continue
+      cursor.execute(query["sql"])
+      total += sum(size(value) for row in cursor.fetchall() for value in row if value is not None)
+  return total
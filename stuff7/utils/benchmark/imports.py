@@ -0,0 +1,22 @@
+import sys
+import subprocess
+
+def import_times(code):
+  """ Import times reported by python -X importtime running some code
+  in a new interpreter, the code fails if the interpreter does.
+
+  :param str code: Python code importing the modules to measure
+
+  :return dict: Cumulative microseconds by module name, every module
+  imported by the code (and only those) is included """
+  stderr = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c", code],
+    capture_output=True, text=True, check=True,
+  ).stderr
+  times = {}
+  for line in stderr.splitlines():
+    if not line.startswith("import time:"): continue
+    _, cumulative, name = line[len("import time:"):].split("|")
+    if cumulative.strip().isdigit():
+      times.setdefault(name.strip(), int(cumulative))
+  return times
@@ -0,0 +1,29 @@
+""" Microbenchmarks for the format helpers.
+
+  python manage.py benchmark safeformat pluralformat
+"""
+from stuff7.utils.benchmark import compare
+from .collections import SafeDict, PluralDict, compile_template
+
+message = "{channel} has been live for {years} year{years(s)}, {days} day{days(s)} and {hours} hour{hours(s)}"
+units = { "years": 2, "days": 1, "hours": 15 }
+options = { "channel": "SomeChannel", "follower": "SomeFollower" }
+
+def safeformat():
+  """ str.format_map with a SafeDict vs a compiled template """
+  return compare(
+    lambda: message.format_map(SafeDict(options)),
+    lambda: compile_template(message).format(options),
+  )
+
+def pluralformat():
+  """ str.format_map with a PluralDict vs a compiled template """
+  return compare(
+    lambda: message.format_map(PluralDict(units)),
+    lambda: compile_template(message).format(units, plural=True),
+  )
+
+benchmarks = {
+  "safeformat": safeformat,
+  "pluralformat": pluralformat,
+}
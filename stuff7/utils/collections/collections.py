@@ -1,3 +1,7 @@
+from string import Formatter
+from functools import lru_cache
+from collections import namedtuple
+
 class SafeDict(dict):
   """ For any missing key it will return {key}
   Useful for the str.format_map function when
@@ -21,9 +25,113 @@ class PluralDict(dict):
       return suffix[0].strip() if value == 1 else suffix[1].strip()
     return f"{{{key}}}"
 
+class Template:
+  """ Format string parsed once into literal text and fields.
+  Formatting it gives the same output as str.format_map with a SafeDict
+  (or a PluralDict) without parsing the string or splitting plural keys
+  again. Fields with attributes, indexes or nested format specs are
+  left to str.format_map, as well as strings it can't parse. """
+  Literal = str
+  """ A field to replace.
+
+  :param str key: Key to look up
+  :param str conversion: One of r, s, a or None
+  :param str spec: Format spec
+  :param str missing: Text used when the key is missing
+  :param tuple plural: Key, singular and plural words if the key is a
+  plural selector like key(singular, plural) """
+  Field = namedtuple("Field", "key conversion spec missing plural")
+  """ A single field only str.format_map can handle.
+
+  :param str string: The field as a format string """
+  Raw = namedtuple("Raw", "string")
+  conversions = { "r": repr, "s": str, "a": ascii, None: None }
+
+  def __init__(self, string):
+    """ Constructs a new template
+
+    :param str string: Format string """
+    self.string = string
+    try:
+      self.ops = tuple(self.compile(string))
+    except ValueError:
+      # Let str.format_map raise the same error
+      self.ops = None
+
+  def compile(self, string):
+    """ Parsing a format string into literals and fields.
+
+    :yield str|Field|Raw: Literal text or a field """
+    for literal, name, spec, conversion in Formatter().parse(string):
+      if literal:
+        yield literal
+      if name is None:
+        continue
+      # Key up to the first attribute or index
+      key = name.partition(".")[0].partition("[")[0]
+      if not key or key.isdigit():
+        raise ValueError("Positional fields")
+      field = "{" + name + (f"!{conversion}" if conversion else "") + (f":{spec}" if spec else "") + "}"
+      if key != name or "{" in spec or conversion not in self.conversions:
+        yield self.Raw(field)
+      else:
+        yield self.Field(key, self.conversions[conversion], spec, "{" + key + "}", self.plural(key))
+
+  def plural(self, key):
+    """ Pre-splitting a plural selector the same way PluralDict does.
+
+    :param str key: Field key
+
+    :return tuple: Key, singular and plural words or None """
+    if "(" in key and key.endswith(")"):
+      key, rest = key.split("(", 1)
+      suffix = rest.rstrip(")").split(",")
+      if len(suffix) == 1:
+        suffix.insert(0, "")
+      return key, suffix[0].strip(), suffix[1].strip()
+
+  def format(self, values, plural=False):
+    """ Formatting the template.
+
+    :param dict values: Values for the fields, missing ones are left as is
+    :param bool plural: Whether to handle plural selectors like PluralDict
+
+    :return str: Formatted string """
+    if self.ops is None:
+      return self.format_map(self.string, values, plural)
+    output = []
+    for op in self.ops:
+      if type(op) is str:
+        output.append(op)
+      elif type(op) is self.Raw:
+        output.append(self.format_map(op.string, values, plural))
+      else:
+        if op.key in values:
+          value = values[op.key]
+        elif plural and op.plural:
+          key, singular, plural_word = op.plural
+          value = singular if values.get(key, f"{{{key}}}") == 1 else plural_word
+        else:
+          value = op.missing
+        if op.conversion: value = op.conversion(value)
+        output.append(format(value, op.spec))
+    return "".join(output)
+
+  def format_map(self, string, values, plural):
+    return string.format_map(PluralDict(values) if plural else SafeDict(values))
+
+@lru_cache(maxsize=1024)
+def compile_template(string):
+  """ Cached template for a format string
+
+  :param str string: Format string
+
+  :return Template: Parsed template """
+  return Template(string)
+
 def safeformat(string, **options):
   """ Formatting and ignoring missing keys in strings. """
   try:
-    return string.format_map(SafeDict(options))
+    return compile_template(string).format(options)
   except ValueError as e:
     return f"There was a parsing error: {e}"
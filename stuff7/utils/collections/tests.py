@@ -31,3 +31,73 @@ class DictTest(TestCase):
       "My safe word is pickles "
       "and here's an {unknown_word}"
     ))
+
+class TemplateTest(TestCase):
+  templates = (
+    "",
+    "No fields at all",
+    "{a} and {b} and {a}",
+    "{{escaped}} {a}",
+    "{missing} {a}",
+    "{a!r} {b!s} {c!a}",
+    "{a:>10}|{b:<5}|{n:05d}|{f:.2f}",
+    "{missing:>12}",
+    "{n:{width}}",
+    "{f.real} {a[0]} {items[1]}",
+    "{years} year{years(s)}, {days} {days(día,días)}",
+    "{months(s)} {one(s)} {one(singular, plural)} {unknown(s)}",
+    "{years(a, b, c, d)} {years()} {years(x,)}",
+    "{one(x.y)} {one(x)y}",
+    "{day(d)) }",
+    "{0}",
+    "{}",
+    "{a!x}",
+    "single } brace",
+    "{unclosed",
+    "{n:d} {a:d}",
+  )
+  values = {
+    "a": "alpha",
+    "b": "beta",
+    "c": "ç",
+    "n": 42,
+    "f": 3.14159,
+    "width": 6,
+    "items": ["x", "y"],
+    "years": 2,
+    "days": 1,
+    "months": 0,
+    "one": 1,
+  }
+
+  def expected(self, template, mapping):
+    try:
+      return template.format_map(mapping(self.values))
+    except Exception as e:
+      return type(e), str(e)
+
+  def actual(self, template, plural):
+    try:
+      return collections.compile_template(template).format(self.values, plural)
+    except Exception as e:
+      return type(e), str(e)
+
+  def test_format_map_parity(self):
+    for template in self.templates:
+      self.assertEqual(self.actual(template, False), self.expected(template, collections.SafeDict),
+        msg=f"Same as SafeDict for {template!r}")
+      self.assertEqual(self.actual(template, True), self.expected(template, collections.PluralDict),
+        msg=f"Same as PluralDict for {template!r}")
+
+  def test_compiled_once(self):
+    template = collections.compile_template("{years} year{years(s)}")
+    self.assertIs(collections.compile_template("{years} year{years(s)}"), template)
+    self.assertEqual(template.ops[2].plural, ("years", "", "s"),
+      msg="Plural selectors are split when compiling.")
+    self.assertEqual(template.format({ "years": 1 }, plural=True), "1 year")
+
+  def test_safeformat_errors(self):
+    self.assertEqual(collections.safeformat("{0}"),
+      "There was a parsing error: Format string contains positional fields")
+    self.assertEqual(collections.safeformat("}"),
+      "There was a parsing error: Single '}' encountered in format string")
@@ -0,0 +1,306 @@
+import os
+import json
+import fcntl
+from uuid import uuid4
+from time import monotonic, perf_counter
+from bisect import bisect_left
+from threading import Lock, Timer
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+
+class Metric:
+  """ Base class for metrics with labels """
+  kind = None
+
+  def __init__(self, registry, name, description, labels=()):
+    self.registry = registry
+    self.name = name
+    self.description = description
+    self.labels = tuple(labels)
+
+  def key(self, labels):
+    """ Serialized label values, used to store every series """
+    return json.dumps([str(labels[label]) for label in self.labels])
+
+class Counter(Metric):
+  """ Value that only goes up """
+  kind = "counter"
+
+  def inc(self, amount=1, **labels):
+    """ Increasing the counter.
+
+    :param float amount: How much to increase it
+    :param labels: Value for every label """
+    with self.registry.updating() as values:
+      series = values.setdefault(self.name, {})
+      key = self.key(labels)
+      series[key] = series.get(key, 0) + amount
+
+  def samples(self, series):
+    for key, value in series.items():
+      yield self.name, dict(zip(self.labels, json.loads(key))), value
+
+  def merge(self, total, value):
+    return (total or 0) + value
+
+class Histogram(Metric):
+  """ Distribution of observed values in cumulative buckets """
+  kind = "histogram"
+  buckets = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5, 7.5, 10)
+
+  def __init__(self, registry, name, description, labels=(), buckets=None):
+    super().__init__(registry, name, description, labels)
+    if buckets is not None: self.buckets = tuple(sorted(buckets))
+
+  def observe(self, value, **labels):
+    """ Observing a value.
+
+    :param float value: Observed value
+    :param labels: Value for every label """
+    with self.registry.updating() as values:
+      series = values.setdefault(self.name, {})
+      key = self.key(labels)
+      # Count for every bucket (plus +Inf), sum and count
+      data = series.get(key)
+      if data is None:
+        data = series[key] = [0]*(len(self.buckets) + 3)
+      data[bisect_left(self.buckets, value)] += 1
+      data[-2] += value
+      data[-1] += 1
+
+  def samples(self, series):
+    for key, data in series.items():
+      labels = dict(zip(self.labels, json.loads(key)))
+      cumulative = 0
+      for bound, count in zip((*self.buckets, "+Inf"), data):
+        cumulative += count
+        yield f"{self.name}_bucket", { **labels, "le": str(bound) }, cumulative
+      yield f"{self.name}_sum", labels, data[-2]
+      yield f"{self.name}_count", labels, data[-1]
+
+  def merge(self, total, data):
+    return data[:] if total is None else [a + b for a, b in zip(total, data)]
+
+class Registry:
+  """ Metrics for the current process, aggregated across processes.
+  When a directory is given every process writes its own values to a
+  file in it (at most every flush_interval seconds, a change is never
+  kept longer than that) and collecting adds them all up, so any worker
+  can report the metrics of all of them. Every process holds a lock on
+  its file while alive, files nobody holds (the process exited, even if
+  its PID was reused since) are folded into the dead processes total
+  and removed. """
+  dead = "dead.json"
+
+  def __init__(self, directory=None, flush_interval=1):
+    """ Constructs a new registry
+
+    :param str directory: Where every process keeps its values,
+    None to only report the current process
+    :param float flush_interval: Minimum seconds between writes """
+    self.directory = directory
+    self.flush_interval = flush_interval
+    self.metrics = {}
+    self._lock = Lock()
+    self._reset()
+
+  def _reset(self):
+    self._pid = os.getpid()
+    self._name = f"{self._pid}-{uuid4().hex}"
+    self._values = {}
+    self._flushed = monotonic()
+    self._timer = None
+    # Inherited from the parent after a fork, its lock stays with the parent
+    if getattr(self, "_held", None): self._held.close()
+    self._held = None
+
+  def counter(self, name, description, labels=()):
+    return self.register(Counter(self, name, description, labels))
+
+  def histogram(self, name, description, labels=(), buckets=None):
+    return self.register(Histogram(self, name, description, labels, buckets))
+
+  def register(self, metric):
+    self.metrics[metric.name] = metric
+    return metric
+
+  @contextmanager
+  def updating(self):
+    """ Changing the values of this process.
+
+    :yield dict: Values of every metric by name and labels """
+    with self._lock:
+      if self._pid != os.getpid():
+        # Forked, the values so far belong to the parent
+        self._reset()
+      yield self._values
+      if not self.directory:
+        return
+      wait = self.flush_interval - (monotonic() - self._flushed)
+      if wait <= 0:
+        self._flush()
+      elif self._timer is None:
+        # Written once the interval is over even if nothing else changes
+        self._timer = Timer(wait, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+  def flush(self):
+    """ Writing the values of this process to its file """
+    with self._lock:
+      if self._pid == os.getpid():
+        self._flush()
+
+  def _flush(self):
+    self._flushed = monotonic()
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
+    if not self.directory:
+      return
+    os.makedirs(self.directory, exist_ok=True)
+    path = os.path.join(self.directory, self._name)
+    if self._held is None:
+      self._held = open(f"{path}.lock", "w")
+      fcntl.flock(self._held, fcntl.LOCK_EX)
+    with open(f"{path}.tmp", "w") as f:
+      json.dump(self._values, f)
+    os.replace(f"{path}.tmp", f"{path}.json")
+
+  def _read(self, path):
+    try:
+      with open(path) as f:
+        return json.load(f)
+    except (OSError, ValueError):
+      return None
+
+  def _merge(self, totals, values):
+    for name, series in values.items():
+      metric = self.metrics.get(name)
+      if metric is None: continue
+      merged = totals.setdefault(name, {})
+      for key, value in series.items():
+        merged[key] = metric.merge(merged.get(key), value)
+    return totals
+
+  def _exited(self, name):
+    """ Whether the process owning a file exited, nobody holds its lock
+
+    :param str name: File name without extension """
+    try:
+      with open(os.path.join(self.directory, f"{name}.lock")) as f:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except FileNotFoundError:
+      return True
+    except BlockingIOError:
+      return False
+
+  def _reap(self, current):
+    """ Folding the values of exited processes into the dead total
+
+    :param str current: File name of the current process """
+    names = [
+      filename[:-len(".json")] for filename in os.listdir(self.directory)
+      if filename.endswith(".json") and filename != self.dead
+    ]
+    exited = [name for name in names if name != current and self._exited(name)]
+    if not exited:
+      return
+    path = os.path.join(self.directory, self.dead)
+    dead = self._read(path) or {}
+    for name in exited:
+      self._merge(dead, self._read(os.path.join(self.directory, f"{name}.json")) or {})
+    with open(f"{path}.tmp", "w") as f:
+      json.dump(dead, f)
+    os.replace(f"{path}.tmp", path)
+    for name in exited:
+      for extension in (".json", ".lock"):
+        with suppress(FileNotFoundError):
+          os.remove(os.path.join(self.directory, f"{name}{extension}"))
+
+  def processes(self):
+    """ Values of every process, the exited ones added up.
+
+    :return list: Values of every process """
+    with self._lock:
+      current = json.loads(json.dumps(self._values))
+      name = self._name
+    processes = [current]
+    if not self.directory or not os.path.isdir(self.directory):
+      return processes
+    # Workers reading while another one reaps would count some values twice
+    with open(os.path.join(self.directory, "reap.lock"), "w") as lock:
+      fcntl.flock(lock, fcntl.LOCK_EX)
+      self._reap(name)
+      for filename in os.listdir(self.directory):
+        if filename.endswith(".json") and filename != f"{name}.json":
+          values = self._read(os.path.join(self.directory, filename))
+          if values is not None:
+            processes.append(values)
+    return processes
+
+  def collect(self):
+    """ Adding up the values of every process.
+
+    :return dict: Values of every metric by name and labels """
+    totals = {}
+    for values in self.processes():
+      self._merge(totals, values)
+    return totals
+
+  def render(self):
+    """ Metrics of every process in the Prometheus text format
+
+    :return str: Exposition text """
+    totals = self.collect()
+    lines = []
+    for name, metric in self.metrics.items():
+      lines.append(f"# HELP {name} {metric.description}")
+      lines.append(f"# TYPE {name} {metric.kind}")
+      for sample, labels, value in metric.samples(totals.get(name, {})):
+        lines.append(f"{sample}{self.labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+  def labels(self, labels):
+    if not labels:
+      return ""
+    escape = lambda value: value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+  def clear(self):
+    """ Dropping the values of this process """
+    with self._lock:
+      self._values.clear()
+
+# Time spent in each phase (upstream, db...) of the current request
+phases = ContextVar("phases", default=None)
+
+@contextmanager
+def tracking():
+  """ Tracking the time spent in each phase inside the block.
+
+  :yield dict: Seconds by phase, filled as the block runs """
+  token = phases.set({})
+  try:
+    yield phases.get()
+  finally:
+    phases.reset(token)
+
+def record(phase, seconds):
+  """ Adding time to a phase of the tracked request if any
+
+  :param str phase: Phase name
+  :param float seconds: Time spent """
+  tracked = phases.get()
+  if tracked is not None:
+    tracked[phase] = tracked.get(phase, 0) + seconds
+
+@contextmanager
+def timed(phase):
+  """ Recording the time spent inside the block in a phase """
+  start = perf_counter()
+  try:
+    yield
+  finally:
+    record(phase, perf_counter() - start)
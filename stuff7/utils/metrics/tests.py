@@ -0,0 +1,115 @@
+import os
+import json
+import multiprocessing
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from .metrics import Registry, tracking, timed, record
+
+class RegistryTestCase(TestCase):
+  def setUp(self):
+    self.directory = TemporaryDirectory()
+    self.registry = Registry(self.directory.name, flush_interval=0)
+    self.requests = self.registry.counter("requests_total", "Requests", ("path",))
+    self.latency = self.registry.histogram("latency_seconds", "Latency", ("path",), buckets=(0.1, 1))
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def test_render(self):
+    self.requests.inc(path="/a")
+    self.requests.inc(2, path="/a")
+    self.latency.observe(0.05, path="/a")
+    self.latency.observe(0.5, path="/a")
+    self.latency.observe(5, path="/a")
+    self.assertEqual(self.registry.render(), "\n".join((
+      "# HELP requests_total Requests",
+      "# TYPE requests_total counter",
+      'requests_total{path="/a"} 3',
+      "# HELP latency_seconds Latency",
+      "# TYPE latency_seconds histogram",
+      'latency_seconds_bucket{path="/a",le="0.1"} 1',
+      'latency_seconds_bucket{path="/a",le="1"} 2',
+      'latency_seconds_bucket{path="/a",le="+Inf"} 3',
+      'latency_seconds_sum{path="/a"} 5.55',
+      'latency_seconds_count{path="/a"} 3',
+    )) + "\n")
+
+  def test_label_escaping(self):
+    self.requests.inc(path='say "hi"\n')
+    self.assertIn('requests_total{path="say \\"hi\\"\\n"} 1', self.registry.render())
+
+  def test_processes(self):
+    self.requests.inc(path="/a")
+    self.latency.observe(0.5, path="/a")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=self.work) for _ in range(3)]
+    for worker in workers: worker.start()
+    for worker in workers: worker.join()
+    rendered = self.registry.render()
+    self.assertIn('requests_total{path="/a"} 7', rendered,
+      msg="values of exited workers are added to the current ones")
+    self.assertIn('latency_seconds_count{path="/a"} 4', rendered)
+    self.assertIn('latency_seconds_bucket{path="/a",le="0.1"} 3', rendered)
+    self.assertEqual(
+      sorted(name for name in os.listdir(self.directory.name) if name.endswith(".json")),
+      sorted((f"{self.registry._name}.json", "dead.json")),
+      msg="files of exited workers are folded into the dead total")
+    self.assertEqual(self.registry.render(), rendered, msg="and counted once")
+
+  def work(self):
+    """ Worker process, starts without the values of its parent """
+    self.requests.inc(2, path="/a")
+    self.latency.observe(0.01, path="/a")
+
+  def test_live_processes(self):
+    context = multiprocessing.get_context("fork")
+    counted, done = context.Event(), context.Event()
+    worker = context.Process(target=self.wait, args=(counted, done))
+    worker.start()
+    try:
+      counted.wait(5)
+      self.requests.inc(path="/a")
+      self.assertIn('requests_total{path="/a"} 3', self.registry.render())
+      self.assertNotIn("dead.json", os.listdir(self.directory.name),
+        msg="a live worker keeps its own file")
+    finally:
+      done.set()
+      worker.join()
+    self.assertIn('requests_total{path="/a"} 3', self.registry.render())
+    self.assertIn("dead.json", os.listdir(self.directory.name))
+
+  def wait(self, counted, done):
+    """ Worker process staying alive until the test is done """
+    self.requests.inc(2, path="/a")
+    counted.set()
+    done.wait(5)
+
+  def test_reused_pid(self):
+    # Left by an exited process whose PID now belongs to this one
+    with open(os.path.join(self.directory.name, f"{os.getpid()}-exited.json"), "w") as f:
+      json.dump({ "requests_total": { '["/a"]': 5 } }, f)
+    self.requests.inc(path="/a")
+    self.assertIn('requests_total{path="/a"} 6', self.registry.render())
+    self.assertNotIn(f"{os.getpid()}-exited.json", os.listdir(self.directory.name))
+
+  def test_pending_flush(self):
+    self.registry.flush_interval = 0.1
+    self.registry.flush()
+    self.requests.inc(path="/a")
+    path = os.path.join(self.directory.name, f"{self.registry._name}.json")
+    with open(path) as f:
+      self.assertEqual(json.load(f), {}, msg="flushed at most every interval")
+    self.registry._timer.join(5)
+    with open(path) as f:
+      self.assertEqual(json.load(f), { "requests_total": { '["/a"]': 1 } },
+        msg="without waiting for another change")
+
+  def test_phases(self):
+    record("upstream", 1)
+    with tracking() as phases:
+      record("upstream", 1)
+      record("upstream", 0.5)
+      with timed("format"): pass
+    self.assertEqual(phases["upstream"], 1.5)
+    self.assertIn("format", phases)
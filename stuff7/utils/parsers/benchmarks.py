@@ -0,0 +1,55 @@
+""" Microbenchmarks for the parsers.
+
+  python manage.py benchmark timedelta_default
+"""
+from datetime import datetime, timedelta, timezone
+
+from stuff7.utils.benchmark import measure
+from .timedelta import TimeDeltaParser
+from .timezone import TimezoneParser
+
+now = datetime.now(timezone.utc)
+date = now - timedelta(days=777, hours=15, minutes=24, seconds=33)
+
+# Same shape as the Text API default messages
+default_msg = (
+  "{channel} has been live for <{years} year{years(s)}>, "
+  "<{months} month{months(s)}>, <{days} day{days(s)}>, "
+  "<{hours} hour{hours(s)}>, <{minutes} minute{minutes(s)}> "
+  "and <{seconds} second{seconds(s)}>"
+)
+# Custom message with always shown blocks, escapes and every unit
+long_msg = (" ".join((
+  "{channel} lleva en directo <{years} año{years(s)}>, <{months} mes{months(es)}>,",
+  "<{days} día{days(s)}>, <{hours} hora{hours(s)}>, <{minutes} minuto{minutes(s)}>",
+  "y <{seconds} segundo{seconds(s)}> \\<\\[{channel}\\]\\>",
+  "o sea <{years}y> <{months}mo> <{days}d> [{hours:02d}:{minutes:02d}:{seconds:02d}]",
+)) + ". ") * 4
+
+parser = TimeDeltaParser()
+tzparser = TimezoneParser()
+
+def timedelta_default():
+  """ Parsing the default Text API message """
+  return measure(lambda: parser.parse(default_msg, now, date))
+
+def timedelta_long():
+  """ Parsing a long user provided message """
+  return measure(lambda: parser.parse(long_msg, now, date))
+
+def timezone_benchmark(timezone, country_code=""):
+  """ Resolving a timezone through one of the resolution paths """
+  def benchmark():
+    return measure(lambda: tzparser.parse(timezone, country_code))
+  benchmark.__doc__ = f"Resolving {timezone!r}"
+  return benchmark
+
+benchmarks = {
+  "timedelta_default": timedelta_default,
+  "timedelta_long": timedelta_long,
+  "timezone_exact": timezone_benchmark("america/mexico_city"),
+  "timezone_offset": timezone_benchmark("-5"),
+  "timezone_abbreviation": timezone_benchmark("pst", "US"),
+  "timezone_tzabvs": timezone_benchmark("acwst"),
+  "timezone_similar_name": timezone_benchmark("tokyo"),
+}
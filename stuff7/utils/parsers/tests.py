@@ -1,13 +1,18 @@
+import os
 from datetime import datetime as dt
 from datetime import timezone as tz
 from datetime import timedelta as td
 from calendar import isleap
 
+from tempfile import TemporaryDirectory
 from unittest import TestCase
+from unittest.mock import patch
 
+import pytz
 from pytz import timezone
 
-from . import TimeDeltaParser, TimezoneParser
+from . import TimeDeltaParser, TimezoneParser, resolve_timezone
+from .tzindex import TimezoneIndex
 
 class TimeDeltaParserTestCase(TestCase):
   def setUp(self):
@@ -51,6 +56,34 @@ class TimeDeltaParserTestCase(TestCase):
     parsedresult = self.delta.parse("Closing inexistent blocks isn't allowed..>", self.now, self.date)
     self.assertIn("Single > is not allowed.", parsedresult)
 
+  def test_compile(self):
+    program = self.delta.compile(self.msg)
+    self.assertIs(self.delta.compile(self.msg), program,
+      msg="Compiled messages are memoized.")
+    self.assertEqual(program[0], "{channel} ")
+    self.assertEqual(program[1], self.delta.Step("", "{years} year{years(s)}", False, "years"))
+    self.assertEqual(program[2], self.delta.Step(", ", "{months} month{months(s)}", False, "months"))
+    error = self.delta.compile("[Unclosed block")
+    self.assertIsInstance(error, ValueError,
+      msg="Invalid messages are memoized as their error.")
+    self.assertEqual(str(error), "Expecting ].")
+    self.assertIsNone(error.__traceback__, msg="without the frames that raised it")
+    self.assertIsNone(error.__context__)
+
+  def test_compiled_parity(self):
+    uncached = TimeDeltaParser(cache_size=0)
+    messages = (
+      self.msg,
+      "[{hours:02d}:{minutes:02d}] <{days}d> <no units> [always]",
+      "Escape \\<block\\> identifiers like \\[this\\].",
+      "<{seconds}s> and {unknown}",
+      "Can't use single {",
+      "[Unclosed block",
+    )
+    for msg in messages:
+      for _ in range(2):
+        self.assertEqual(self.delta.parse(msg, self.now, self.date), uncached.parse(msg, self.now, self.date))
+
   def test_timediff(self):
     parsedobj = self.delta.timediff(self.now, self.date)
     self.assertEqual(tuple(parsedobj), self.timeunits)
@@ -133,5 +166,74 @@ class TimezoneParserTestCase(TestCase):
       self.assertEqual(guess_date, date,
         msg="Parses all timezone offsets.")
 
+  def test_resolve_timezone(self):
+    self.assertIs(resolve_timezone("pst", "us"), timezone("America/Los_Angeles"))
+    self.assertIs(resolve_timezone("ist", "ie"), resolve_timezone("ist", "ie"))
+    self.assertIs(resolve_timezone("Not a timezone"), pytz.utc)
+
+  def test_stateless(self):
+    self.tz.timezone = "est"
+    self.assertEqual(self.tz.parse("bst", "gb"), "Europe/London")
+    self.assertEqual(self.tz.timezone, "est",
+      msg="Parsing doesn't change the parser.")
+    self.assertEqual(TimezoneParser(default="Europe/Madrid").parse("???"), "Europe/Madrid")
+
   def tzone(self, tz):
     return self.utc.astimezone(timezone(tz))
+
+class TimezoneIndexTestCase(TestCase):
+  def setUp(self):
+    self.index = TimezoneIndex()
+
+  def test_by_abbreviation(self):
+    scanned = self.index.scan()
+    for abbv in ("CST", "est", "Aest", "IST"):
+      self.assertEqual(self.index.by_abbreviation(abbv), scanned[abbv.upper()])
+    self.assertEqual(self.index.by_abbreviation("NOPE"), set())
+    self.assertEqual(
+      self.index.by_abbreviation("CST", pytz.country_timezones["cn"]),
+      self.index.by_abbreviation("CST") & set(pytz.country_timezones["cn"]),
+      msg="Narrows down by country.")
+    self.assertIn("Asia/Shanghai", self.index.by_abbreviation("CST", pytz.country_timezones["cn"]))
+
+  def test_name(self):
+    with patch.object(self.index, "scan") as scan:
+      self.assertEqual(self.index.name("America/New_York"), "America/New_York")
+      self.assertEqual(self.index.name("america/NEW_york"), "America/New_York")
+      self.assertIsNone(self.index.name("Nowhere"))
+      self.index.similar_name("york")
+    scan.assert_not_called()
+
+  def test_similar_name(self):
+    for name in ("york", "Angeles", "gmt+1", "/", "a"):
+      expected = next(tz for tz in pytz.all_timezones if name.lower() in tz.lower())
+      self.assertEqual(self.index.similar_name(name), expected)
+    self.assertIsNone(self.index.similar_name("nowhere"))
+
+  def test_persistence(self):
+    with TemporaryDirectory() as directory:
+      path = os.path.join(directory, "tzindex.json")
+      abbreviations = TimezoneIndex(path).abbreviations
+      self.assertTrue(os.path.exists(path))
+      index = TimezoneIndex(path)
+      with patch.object(index, "scan") as scan, patch.object(index, "save") as save:
+        self.assertEqual(index.abbreviations, abbreviations)
+      scan.assert_not_called()
+      save.assert_not_called()
+
+  def test_corrupt_file(self):
+    with TemporaryDirectory() as directory:
+      path = os.path.join(directory, "tzindex.json")
+      for corrupt in ("{", "[]", '{"version": "%s"}' % pytz.OLSON_VERSION):
+        with open(path, "w") as f:
+          f.write(corrupt)
+        index = TimezoneIndex(lambda: path)
+        self.assertIn("America/New_York", index.by_abbreviation("EST"))
+        self.assertEqual(index.path, path)
+        self.assertIsNotNone(TimezoneIndex(path).load(), msg="it's rebuilt")
+
+  def test_read_only_path(self):
+    with TemporaryDirectory() as directory:
+      path = os.path.join(directory, "missing", "tzindex.json")
+      self.assertIn("America/New_York", TimezoneIndex(path).by_abbreviation("EST"))
+      self.assertFalse(os.path.exists(path))
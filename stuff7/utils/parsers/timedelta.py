@@ -1,9 +1,10 @@
 import re
+from functools import lru_cache
 from collections import namedtuple
 
 from dateutil.relativedelta import relativedelta
 
-from stuff7.utils.collections import PluralDict
+from stuff7.utils.collections import compile_template
 
 class TimeDeltaParser:
   """ Parses strings containing time units representing
@@ -25,6 +26,17 @@ class TimeDeltaParser:
   # Pattern to search for any time unit
   any_unit = fr"(?<={{)({'|'.join(units)})(?=}}|:)"
 
+  """ A compiled block, same as Block plus the time unit it references.
+
+  :param str unit: Time unit found in var if any """
+  Step = namedtuple("Step", "connector var show unit")
+
+  def __init__(self, cache_size=1024):
+    """ Constructs a new parser
+
+    :param int cache_size: How many compiled messages to keep """
+    self.compile = lru_cache(maxsize=cache_size)(self._compile)
+
   def parse(self, msg, date1, date2, **kwargs):
     """ Parsing time units in string.
 
@@ -34,27 +46,56 @@ class TimeDeltaParser:
 
     :return str: Parsed text """
     diff = self.timediff(date1, date2)
-    """ All the time units supporting custom parsing to handle 
-    plural words in any language. """
-    data = PluralDict(diff)
-    parsed = ""
-    # Whether there's a block already present in the text
-    block_in = False
+    program = self.compile(msg)
+    if isinstance(program, ValueError):
+      return f"Invalid string: {program}"
     try:
-      for block in self.loop(msg):
-        if type(block) is str:
-          parsed+=block
-          continue
-        try: show = block.show or diff.get(re.search(self.any_unit, block.var).group())
-        except AttributeError: show = False
-        if show:
-          if block_in: parsed+=block.connector
-          else: block_in = True
-          parsed+=block.var
-      return parsed.format_map(data)
+      """ All the time units supporting custom parsing to handle
+      plural words in any language. """
+      return compile_template(self.run(program, diff)).format(diff, plural=True)
     except (ValueError) as e:
       return f"Invalid string: {e}"
 
+  def run(self, program, diff):
+    """ Evaluating a compiled message against a time difference.
+
+    :param tuple program: Compiled message
+    :param dict diff: Time units
+
+    :return str: Message with the blocks to show and their connectors """
+    parsed = []
+    # Whether there's a block already present in the text
+    block_in = False
+    for step in program:
+      if type(step) is str:
+        parsed.append(step)
+      elif step.show or (step.unit and diff[step.unit]):
+        if block_in: parsed.append(step.connector)
+        else: block_in = True
+        parsed.append(step.var)
+    return "".join(parsed)
+
+  def _compile(self, msg):
+    """ Compiling a message into literal strings and steps.
+
+    :param str msg: Text to compile
+
+    :return tuple|ValueError: Immutable program or the error
+    that made the message invalid, a copy holding only its message
+    so the cache doesn't keep the frames that raised it alive """
+    try:
+      return tuple(
+        block if type(block) is str else self.Step(*block, self.unit(block.var))
+        for block in self.loop(msg)
+      )
+    except ValueError as e:
+      return ValueError(str(e))
+
+  def unit(self, var):
+    """ Time unit referenced by a block if any """
+    match = re.search(self.any_unit, var)
+    return match and match.group()
+
   def timediff(self, a, b):
     """ Stripping unnecessary attributes from relative delta.
 
@@ -1,13 +1,86 @@
+from functools import lru_cache
 from contextlib import suppress
-from datetime import datetime as DT
 
 import pytz
 from babel.dates import get_timezone_location as tzlocation
 
 from .tzdict import tzabvs
+from .tzindex import tzindex
+
+def normalize_timezone(timezone):
+  """ Timezone names use underscores instead of spaces. """
+  return timezone.replace(" ", "_")
+
+def timezone_name(timezone, country_code="", default="UTC"):
+  """ Guessing a timezone name from arbitrary input.
+
+  :param str timezone: String to parse into an actual timezone
+  :param str country_code: Filter timezones by this country code
+  :param str default: Timezone used when nothing matches
+
+  :return str: Timezone name """
+  timezone = normalize_timezone(timezone)
+
+  # The input is an actual timezone!
+  if timezone.title() in pytz.all_timezones_set:
+    return tzindex.name(timezone)
+
+  # Try to guess the timezone as an offset
+  with suppress(ValueError):
+    return find_by_offset(timezone)
+
+  # Try looking by abbreviation using the country
+  # to narrow down the search if any
+  with suppress(ValueError):
+    country_tzones = pytz.country_timezones.get(country_code)
+    set_zones = find_by_abv(timezone, country_tzones)
+    return max(sorted(set_zones), key=len)
+
+  # Try looking through the most common abbreviations
+  # not included in pytz
+  with suppress(KeyError):
+    return tzabvs[timezone.upper()]
+
+  # Try to find timezones with similar names
+  with suppress(ValueError):
+    return find_by_similar_name(timezone)
+
+  # Could not find timezone
+  return default
+
+@lru_cache(maxsize=4096)
+def resolve_timezone(timezone, country_code="", default="UTC"):
+  """ Same as timezone_name but returning the timezone itself.
+  Results are memoized, it's safe to call from any thread.
+
+  :return tzinfo: pytz timezone """
+  return pytz.timezone(timezone_name(timezone, country_code, default))
+
+def find_by_offset(timezone):
+  """ Try to find a timezone by offset. """
+  offset = int(timezone)*-1
+  if offset < -14 or offset > 12:
+    raise ValueError(f"{offset} is not a valid offset")
+  if offset > 0:
+    offset = "+" + str(offset)
+  else:
+    offset = str(offset)
+  return "Etc/GMT" + offset
+
+def find_by_abv(timezone, timezones=None):
+  """ Try to find a timezone using common timezone abbreviations. """
+  return set(tzindex.by_abbreviation(timezone, timezones))
+
+def find_by_similar_name(timezone):
+  """ Try to find a timezone by similar names. """
+  tzname = tzindex.similar_name(timezone)
+  if tzname is None:
+    raise ValueError("Timezone not found")
+  return tzname
 
 class TimezoneParser:
-  """ Guessing timezone by name, abbreviations or country code. """
+  """ Guessing timezone by name, abbreviations or country code.
+  Parsing doesn't change the instance, see timezone_name. """
   _timezone = _default_timezone = "UTC"
 
   def __init__(self, timezone=None, default=None):
@@ -20,77 +93,30 @@ class TimezoneParser:
 
   @timezone.setter
   def timezone(self, timezone):
-    self._timezone = timezone.replace(" ", "_")
+    self._timezone = normalize_timezone(timezone)
 
   @property
   def default_timezone(self):
     return self._default_timezone
 
-  def parsetz(self, *args, **kwargs):
-    return pytz.timezone(self.parse(*args, **kwargs))
+  def parsetz(self, timezone, country_code=""):
+    return resolve_timezone(timezone, country_code, self.default_timezone)
 
   def parse(self, timezone, country_code=""):
     """ Parsing timezone from arbitrary input string.
 
     :param str timezone: String to parse into an actual timezone
     :param str country_code: Filter timezones by this country code """
-    self.timezone = timezone
-    
-    # The input is an actual timezone!
-    if self.timezone.title() in pytz.all_timezones:
-      return self.timezone
-
-    # Try to guess the timezone as an offset
-    with suppress(ValueError):
-      return self.find_by_offset()
-
-    # Try looking by abbreviation using the country
-    # to narrow down the search if any
-    with suppress(ValueError):
-      country_tzones = pytz.country_timezones.get(country_code)
-      set_zones = self.find_by_abv(country_tzones)
-      return max(set_zones, key=len)
-
-    # Try looking through the most common abbreviations
-    # not included in pytz
-    with suppress(KeyError):
-      return tzabvs[self.timezone.upper()]
-
-    # Try to find timezones with similar names
-    with suppress(ValueError):
-      return self.find_by_similar_name()
-
-    # Could not find timezone
-    return self.default_timezone
+    return timezone_name(timezone, country_code, self.default_timezone)
 
   def find_by_offset(self):
     """ Try to find a timezone by offset. """
-    offset = int(self.timezone)*-1
-    if offset < -14 or offset > 12:
-      raise ValueError(f"{offset} is not a valid offset")
-    if offset > 0:
-      offset = "+" + str(offset)
-    else:
-      offset = str(offset)
-    return "Etc/GMT" + offset
+    return find_by_offset(self.timezone)
 
   def find_by_abv(self, timezones=None):
     """ Try to find a timezone using common timezone abbreviations. """
-    if timezones is None: timezones = pytz.all_timezones
-    abbrev = self.timezone.upper()
-    countries = set()
-    for name in timezones:
-      tzone = pytz.timezone(name)
-      for utcoffset, dstoffset, tzabbrev in getattr(
-        tzone, "_transition_info", [[None, None, DT.now(tzone).tzname()]]):
-        if tzabbrev.upper() == abbrev:
-          countries.add(name)
-    return countries
+    return find_by_abv(self.timezone, timezones)
 
   def find_by_similar_name(self):
     """ Try to find a timezone by similar names. """
-    tz = self.timezone.lower()
-    for tzname in pytz.all_timezones:
-      if tz in tzname.lower():
-        return tzname
-    raise ValueError("Timezone not found")
+    return find_by_similar_name(self.timezone)
@@ -0,0 +1,144 @@
+import os
+import json
+from bisect import bisect_left
+from threading import Lock
+from contextlib import suppress
+from functools import lru_cache, cached_property
+from collections import defaultdict
+from datetime import datetime as DT
+
+import pytz
+
+def settings_path():
+  """ TZINDEX_PATH Django setting if the settings are configured """
+  from django.conf import settings
+  return getattr(settings, "TZINDEX_PATH", None) if settings.configured else None
+
+class TimezoneIndex:
+  """ Lookup tables for timezone names and abbreviations.
+  Built once per process on first use, the abbreviations (the expensive
+  part, every timezone has to be instantiated) can be persisted to disk. """
+
+  def __init__(self, path=None):
+    """ Constructs a new timezone index
+
+    :param str|Callable[[], str] path: JSON file to load/save the
+    abbreviations from/to, or a function giving it on first use """
+    self.path = path
+    self._lock = Lock()
+    self._abbreviations = None
+    self.similar_name = lru_cache(maxsize=1024)(self._similar_name)
+
+  @property
+  def abbreviations(self):
+    """ Timezone names by upper case abbreviation """
+    if self._abbreviations is None:
+      with self._lock:
+        if self._abbreviations is None:
+          self.build()
+    return self._abbreviations
+
+  @cached_property
+  def names(self):
+    """ Timezone names by lower case name """
+    return { name.lower(): name for name in pytz.all_timezones }
+
+  @cached_property
+  def suffixes(self):
+    """ Every suffix of every lower case name along with the name position,
+    sorted so all the names containing a string are next to each other """
+    return sorted(
+      (name[i:].lower(), position)
+      for position, name in enumerate(pytz.all_timezones)
+      for i in range(len(name))
+    )
+
+  def build(self):
+    """ Building the abbreviations table. """
+    if callable(self.path):
+      self.path = self.path()
+    self._abbreviations = self.load()
+    if self._abbreviations is None:
+      self._abbreviations = self.scan()
+      self.save()
+
+  def scan(self):
+    """ Collecting the abbreviations used by every timezone.
+
+    :return dict: Sets of timezone names by abbreviation """
+    abbreviations = defaultdict(set)
+    for name in pytz.all_timezones:
+      tzone = pytz.timezone(name)
+      for utcoffset, dstoffset, tzabbrev in getattr(
+        tzone, "_transition_info", [[None, None, DT.now(tzone).tzname()]]):
+        abbreviations[tzabbrev.upper()].add(name)
+    return dict(abbreviations)
+
+  def load(self):
+    """ Loading the abbreviations from disk if they were saved by
+    the same pytz version. A corrupt file is ignored, it's replaced
+    once the abbreviations are scanned again. """
+    if not self.path or not os.path.exists(self.path):
+      return None
+    try:
+      with open(self.path) as f:
+        data = json.load(f)
+      if data.get("version") != pytz.OLSON_VERSION:
+        return None
+      return { abv: set(names) for abv, names in data["abbreviations"].items() }
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+      return None
+
+  def save(self):
+    """ Persisting the abbreviations to disk.
+    The index works the same without it, a path that can't be
+    written only means every process scans the timezones. """
+    if not self.path:
+      return
+    data = {
+      "version": pytz.OLSON_VERSION,
+      "abbreviations": { abv: sorted(names) for abv, names in self._abbreviations.items() },
+    }
+    tmp = f"{self.path}.{os.getpid()}.tmp"
+    try:
+      with open(tmp, "w") as f:
+        json.dump(data, f)
+      os.replace(tmp, self.path)
+    except OSError:
+      with suppress(OSError):
+        os.remove(tmp)
+
+  def by_abbreviation(self, abbreviation, timezones=None):
+    """ Timezones using an abbreviation.
+
+    :param str abbreviation: Abbreviation (case insensitive)
+    :param list timezones: Only look within these timezones (e.g. a country's)
+
+    :return set: Timezone names """
+    names = self.abbreviations.get(abbreviation.upper(), set())
+    return names if timezones is None else names.intersection(timezones)
+
+  def name(self, timezone):
+    """ Timezone name matching case insensitively.
+
+    :param str timezone: Timezone name
+
+    :return str: Actual timezone name or None """
+    if timezone in pytz.all_timezones_set:
+      return timezone
+    return self.names.get(timezone.lower())
+
+  def _similar_name(self, timezone):
+    """ First timezone (in pytz.all_timezones order) containing a string.
+
+    :param str timezone: Part of the timezone name (case insensitive)
+
+    :return str: Timezone name or None """
+    timezone = timezone.lower()
+    first = None
+    for suffix, position in self.suffixes[bisect_left(self.suffixes, (timezone,)):]:
+      if not suffix.startswith(timezone): break
+      if first is None or position < first: first = position
+    return None if first is None else pytz.all_timezones[first]
+
+tzindex = TimezoneIndex(settings_path)
@@ -0,0 +1,149 @@
+import sys
+import pstats
+import tracemalloc
+from threading import Thread, Event, Lock, get_ident
+from collections import Counter
+
+def collapse(stacks):
+  """ Stacks in the collapsed format used to draw flame graphs,
+  one "outer;inner;innermost value" line per stack.
+
+  :param dict stacks: Values by tuple of frame labels, outermost first
+
+  :return str: Collapsed stacks, biggest values first """
+  lines = sorted(stacks.items(), key=lambda item: item[1], reverse=True)
+  return "".join(f"{';'.join(stack)} {value}\n" for stack, value in lines if value > 0)
+
+def frame_label(frame):
+  code = frame.f_code
+  return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+  """ Statistical profiler for the thread that starts it.
+  A background thread looks at the thread's stack every interval seconds,
+  only the frames below the one that started the profiler are counted. """
+
+  def __init__(self, interval=0.001):
+    """ Constructs a new sampling profiler
+
+    :param float interval: Seconds between samples """
+    self.interval = interval
+    self.stacks = Counter()
+    self._stopped = Event()
+    self._thread = None
+
+  def __enter__(self):
+    self.start(sys._getframe(1))
+    return self
+
+  def __exit__(self, *exc):
+    self.stop()
+
+  def start(self, root=None):
+    """ Sampling the current thread until stopped.
+
+    :param frame root: Frame whose callers are left out, the caller's by default """
+    self.target = get_ident()
+    self.root = root or sys._getframe(1)
+    self._stopped.clear()
+    self._thread = Thread(target=self.run, daemon=True, name="sampling-profiler")
+    self._thread.start()
+
+  def stop(self):
+    self._stopped.set()
+    self._thread.join()
+
+  def run(self):
+    while not self._stopped.wait(self.interval):
+      frame = sys._current_frames().get(self.target)
+      if frame is not None:
+        self.sample(frame)
+
+  def sample(self, frame):
+    """ Counting the stack of a frame up to the root frame """
+    stack = []
+    while frame is not None and frame is not self.root:
+      stack.append(frame_label(frame))
+      frame = frame.f_back
+    if frame is None or not stack:
+      # The root frame already returned
+      return
+    self.stacks[tuple(reversed(stack))] += 1
+
+  def collapsed(self):
+    """ Sample counts per stack in the collapsed format """
+    return collapse(self.stacks)
+
+def function_label(function):
+  filename, line, name = function
+  return name if filename == "~" else f"{name} ({filename}:{line})"
+
+def collapse_profile(profile):
+  """ cProfile results in the collapsed format.
+  cProfile only keeps callers and callees so every function gets its own
+  time (in microseconds) on the chain of its most expensive callers.
+
+  :param cProfile.Profile profile: Finished profile
+
+  :return str: Collapsed stacks """
+  stats = pstats.Stats(profile).stats
+  stacks = Counter()
+  for function, (_, _, own, _, callers) in stats.items():
+    chain = [function]
+    while callers:
+      caller = max(callers, key=lambda caller: callers[caller][3])
+      if caller in chain: break
+      chain.append(caller)
+      callers = stats.get(caller, (None,)*5)[4]
+    stacks[tuple(map(function_label, reversed(chain)))] += round(own*1e6)
+  return collapse(stacks)
+
+class MemoryTracer:
+  """ tracemalloc snapshots of the current process.
+  Tracing stays off (and free) until started, every snapshot is kept
+  so the next one can be diffed against it. """
+
+  def __init__(self, frames=25):
+    """ Constructs a new memory tracer
+
+    :param int frames: Frames kept per allocation """
+    self.frames = frames
+    self.previous = None
+    self._lock = Lock()
+
+  @property
+  def tracing(self):
+    return tracemalloc.is_tracing()
+
+  def start(self):
+    with self._lock:
+      if not self.tracing:
+        tracemalloc.start(self.frames)
+        self.previous = None
+
+  def stop(self):
+    with self._lock:
+      tracemalloc.stop()
+      self.previous = None
+
+  def snapshot(self, diff=False):
+    """ Memory allocated by every stack.
+
+    :param bool diff: Only report the growth since the previous snapshot
+
+    :return str: Allocated bytes per stack in the collapsed format """
+    with self._lock:
+      if not self.tracing:
+        raise RuntimeError("Memory tracing isn't running")
+      snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+      ))
+      previous, self.previous = self.previous, snapshot
+    if diff and previous is not None:
+      stats = ((stat.traceback, stat.size_diff) for stat in snapshot.compare_to(previous, "traceback"))
+    else:
+      stats = ((stat.traceback, stat.size) for stat in snapshot.statistics("traceback"))
+    stacks = Counter()
+    for traceback, size in stats:
+      stacks[tuple(f"{frame.filename}:{frame.lineno}" for frame in traceback)] += size
+    return collapse(stacks)
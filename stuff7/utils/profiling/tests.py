@@ -0,0 +1,95 @@
+import re
+from time import perf_counter
+from cProfile import Profile
+from unittest import TestCase
+
+from django.test import TestCase as DjangoTestCase, RequestFactory, override_settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404
+
+from stuff7.settings import MIDDLEWARE
+from user.models import User
+from .profiling import SamplingProfiler, MemoryTracer, collapse_profile
+
+line = re.compile(r"^\S.* \d+$")
+
+def busy(seconds):
+  end = perf_counter() + seconds
+  while perf_counter() < end: pass
+
+def allocate():
+  return [bytes(1000) for _ in range(1000)]
+
+class ProfilingTestCase(TestCase):
+  def test_sampling(self):
+    with SamplingProfiler(0.001) as profiler:
+      busy(0.2)
+    stacks = profiler.collapsed().splitlines()
+    self.assertTrue(stacks)
+    self.assertTrue(all(line.match(stack) for stack in stacks))
+    top = stacks[0].split(";")
+    self.assertTrue(top[0].startswith("busy "), msg="callers of the profiled block are left out")
+
+  def test_cprofile(self):
+    profile = Profile()
+    profile.runcall(busy, 0.01)
+    stacks = collapse_profile(profile).splitlines()
+    self.assertTrue(all(line.match(stack) for stack in stacks))
+    self.assertTrue(stacks[0].startswith("busy "))
+    self.assertTrue(any(stack.startswith("busy (") and ";" in stack for stack in stacks))
+
+  def test_memory(self):
+    tracer = MemoryTracer(frames=5)
+    with self.assertRaises(RuntimeError):
+      tracer.snapshot()
+    tracer.start()
+    try:
+      tracer.snapshot()
+      kept = allocate()
+      diff = tracer.snapshot(diff=True).splitlines()
+      self.assertIn("tests.py", diff[0])
+      self.assertGreaterEqual(int(diff[0].rsplit(" ", 1)[1]), sum(map(len, kept)),
+        msg="the snapshot holds the allocation still referenced")
+    finally:
+      tracer.stop()
+    self.assertFalse(tracer.tracing)
+
+@override_settings(MIDDLEWARE=[*MIDDLEWARE, "stuff7.profiling.ProfilerMiddleware"])
+class ProfilerMiddlewareTestCase(DjangoTestCase):
+  def setUp(self):
+    self.admin = User.objects.create(current_user="admin", is_superuser=True)
+    self.user = User.objects.create(current_user="user")
+
+  def test_superuser(self):
+    self.client.force_login(self.admin)
+    response = self.client.get("/api/languages/", { "__profile": "cprofile" })
+    self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+    self.assertIn("user/views.py", response.content.decode())
+    response = self.client.get("/api/languages/", HTTP_X_PROFILE="1")
+    self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+
+  def test_not_allowed(self):
+    response = self.client.get("/api/languages/", { "__profile": "1" })
+    self.assertEqual(response["Content-Type"], "application/json")
+    self.client.force_login(self.user)
+    response = self.client.get("/api/languages/", { "__profile": "1" })
+    self.assertEqual(response["Content-Type"], "application/json")
+
+  def test_memory(self):
+    from stuff7.profiling import memory, tracer
+    factory = RequestFactory()
+    def get(user, **params):
+      request = factory.get("/profiling/memory", params)
+      request.user = user
+      return memory(request)
+    with self.assertRaises(Http404):
+      get(AnonymousUser())
+    self.assertEqual(get(self.admin).status_code, 409)
+    try:
+      get(self.admin, action="start")
+      self.assertTrue(tracer.tracing)
+      self.assertEqual(get(self.admin).status_code, 200)
+      self.assertEqual(get(self.admin, action="diff").status_code, 200)
+    finally:
+      get(self.admin, action="stop")
+    self.assertFalse(tracer.tracing)
@@ -0,0 +1,60 @@
+# Generated by Django 3.0.14 on 2026-10-17 18:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Series',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('show_id', models.BigIntegerField(db_index=True)),
+                ('digest', models.CharField(max_length=40, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('last_updated', models.DateTimeField()),
+                ('status', models.CharField(max_length=64)),
+                ('network', models.CharField(max_length=255, null=True)),
+                ('rating', models.FloatField(null=True)),
+                ('next_ep_display', models.CharField(max_length=255)),
+                ('next_ep_date', models.DateTimeField(null=True)),
+                ('prev_ep_display', models.CharField(max_length=255)),
+                ('prev_ep_date', models.DateTimeField(null=True)),
+                ('seasons', models.IntegerField()),
+                ('episodes', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'Series',
+            },
+        ),
+        migrations.CreateModel(
+            name='TrackedSeries',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('show_id', models.BigIntegerField()),
+                ('position', models.PositiveIntegerField()),
+                ('series', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trackers', to='tvsm.Series')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracked_series', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'TrackedSeries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='trackedseries',
+            index=models.Index(fields=['user', 'position'], name='TrackedSeri_user_id_cc58a4_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='trackedseries',
+            unique_together={('user', 'show_id')},
+        ),
+    ]
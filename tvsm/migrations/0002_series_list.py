@@ -0,0 +1,96 @@
+import json
+from hashlib import sha1
+from datetime import datetime, timezone
+
+from django.db import migrations
+from django.utils.dateparse import parse_datetime
+from django.core.serializers.json import DjangoJSONEncoder
+
+# The blob had no limits, longer values are cut to fit the columns
+# and missing (or null) ones are left empty
+def text(value, length):
+  return str(value or "")[:length]
+
+def series_fields(entry):
+  """ Series model fields from a series_list entry """
+  date = lambda value: value and parse_datetime(value) or None
+  next_ep, prev_ep = entry.get("nextEp") or {}, entry.get("prevEp") or {}
+  return {
+    "name": text(entry.get("name"), 255),
+    "last_updated": date(entry.get("lastUpdated")) or datetime(1970, 1, 1, tzinfo=timezone.utc),
+    "status": text(entry.get("status"), 64),
+    "network": entry.get("network") and text(entry["network"], 255),
+    "rating": entry.get("rating"),
+    "next_ep_display": text(next_ep.get("display"), 255),
+    "next_ep_date": date(next_ep.get("date")),
+    "prev_ep_display": text(prev_ep.get("display"), 255),
+    "prev_ep_date": date(prev_ep.get("date")),
+    "seasons": entry.get("seasons") or 0,
+    "episodes": entry.get("episodes") or 0,
+  }
+
+def series_digest(show_id, fields):
+  """ Hash of the info of a show, same as tvsm.models.series_digest """
+  data = {
+    field: value.astimezone(timezone.utc).isoformat() if isinstance(value, datetime) else value
+    for field, value in fields.items()
+  }
+  return sha1(json.dumps([show_id, data], sort_keys=True).encode()).hexdigest()
+
+def forwards(apps, schema_editor):
+  """ Moving every series_list into the series tables, users
+  keep their own info stored once for everyone sharing it. """
+  User = apps.get_model("user", "User")
+  Series = apps.get_model("tvsm", "Series")
+  TrackedSeries = apps.get_model("tvsm", "TrackedSeries")
+  series, tracked = {}, []
+  for user_id, series_list in User.objects.exclude(series_list="[]").values_list("id", "series_list").iterator():
+    seen = set()
+    for entry in json.loads(series_list):
+      if entry["id"] in seen: continue
+      seen.add(entry["id"])
+      fields = series_fields(entry)
+      digest = series_digest(entry["id"], fields)
+      series.setdefault(digest, Series(show_id=entry["id"], digest=digest, **fields))
+      tracked.append((user_id, entry["id"], digest, len(seen)))
+  Series.objects.bulk_create(series.values(), batch_size=500)
+  ids = dict(Series.objects.values_list("digest", "id").iterator())
+  TrackedSeries.objects.bulk_create((
+    TrackedSeries(user_id=user_id, show_id=show_id, series_id=ids[digest], position=position)
+    for user_id, show_id, digest, position in tracked
+  ), batch_size=500)
+
+def backwards(apps, schema_editor):
+  """ Writing the series tables back into every series_list,
+  users without tracked series get an empty list """
+  User = apps.get_model("user", "User")
+  TrackedSeries = apps.get_model("tvsm", "TrackedSeries")
+  lists = {}
+  for item in TrackedSeries.objects.select_related("series").order_by("user_id", "position").iterator():
+    series = item.series
+    lists.setdefault(item.user_id, []).append({
+      "id": item.show_id,
+      "name": series.name,
+      "lastUpdated": series.last_updated,
+      "status": series.status,
+      "network": series.network,
+      "rating": series.rating,
+      "nextEp": { "display": series.next_ep_display, "date": series.next_ep_date },
+      "prevEp": { "display": series.prev_ep_display, "date": series.prev_ep_date },
+      "seasons": series.seasons,
+      "episodes": series.episodes,
+    })
+  User.objects.exclude(pk__in=TrackedSeries.objects.values("user_id")).update(series_list="[]")
+  for user_id, series_list in lists.items():
+    User.objects.filter(pk=user_id).update(series_list=json.dumps(series_list, cls=DjangoJSONEncoder))
+
+class Migration(migrations.Migration):
+
+  dependencies = [
+    ("tvsm", "0001_initial"),
+    ("user", "0003_profile_hash"),
+  ]
+
+  operations = [
+    migrations.RunPython(forwards, backwards),
+  ]
@@ -0,0 +1,79 @@
+import json
+from hashlib import sha1
+from datetime import datetime, timezone
+
+from django.db import models
+
+def series_digest(show_id, fields):
+  """ Hash of the info of a show
+
+  :param int show_id: Id given by the show database
+  :param dict fields: Series model fields but the ids
+
+  :return str: Hex digest """
+  data = {
+    field: value.astimezone(timezone.utc).isoformat() if isinstance(value, datetime) else value
+    for field, value in fields.items()
+  }
+  return sha1(json.dumps([show_id, data], sort_keys=True).encode()).hexdigest()
+
+class Series(models.Model):
+  """ Show info as sent by the clients, the show_id is the one given by
+  the show database. Rows are never changed, different info for a show
+  is stored in another row shared by everyone sending that same info,
+  so nobody can change the info others see. """
+  show_id = models.BigIntegerField(db_index=True)
+  # series_digest of the row, finds the row holding some info
+  digest = models.CharField(max_length=40, unique=True)
+  name = models.CharField(max_length=255)
+  last_updated = models.DateTimeField()
+  status = models.CharField(max_length=64)
+  network = models.CharField(max_length=255, null=True)
+  rating = models.FloatField(null=True)
+  next_ep_display = models.CharField(max_length=255)
+  next_ep_date = models.DateTimeField(null=True)
+  prev_ep_display = models.CharField(max_length=255)
+  prev_ep_date = models.DateTimeField(null=True)
+  seasons = models.IntegerField()
+  episodes = models.IntegerField()
+
+  @property
+  def next_ep(self):
+    return { "display": self.next_ep_display, "date": self.next_ep_date }
+
+  @property
+  def prev_ep(self):
+    return { "display": self.prev_ep_display, "date": self.prev_ep_date }
+
+  def __str__(self):
+    return (
+      f"Series#{self.id}<"
+      f"show_id: {self.show_id}, "
+      f"name: {self.name}, "
+      f"last_updated: {self.last_updated}>"
+    )
+
+  class Meta:
+    db_table = "Series"
+
+class TrackedSeries(models.Model):
+  """ Show in a user's list with the info the user sent for it,
+  position keeps the user's order """
+  user = models.ForeignKey("user.User", on_delete=models.CASCADE, related_name="tracked_series")
+  show_id = models.BigIntegerField()
+  series = models.ForeignKey(Series, on_delete=models.CASCADE, related_name="trackers")
+  position = models.PositiveIntegerField()
+
+  def __str__(self):
+    return (
+      f"TrackedSeries#{self.id}<"
+      f"user: {self.user_id}, "
+      f"show_id: {self.show_id}, "
+      f"series: {self.series_id}, "
+      f"position: {self.position}>"
+    )
+
+  class Meta:
+    db_table = "TrackedSeries"
+    unique_together = (("user", "show_id"),)
+    indexes = [models.Index(fields=("user", "position"))]
@@ -2,21 +2,22 @@ from rest_framework import serializers
 
 # Serializers define the API representation.
 class EpisodeSerializer(serializers.Serializer):
-  display = serializers.CharField()
+  display = serializers.CharField(max_length=255)
   date = serializers.DateTimeField(allow_null=True)
 
   class Meta:
     fields = ("display", "date")
 
 class SeriesSerializer(serializers.Serializer):
-  id = serializers.IntegerField()
-  name = serializers.CharField()
-  lastUpdated = serializers.DateTimeField()
-  status = serializers.CharField()
-  network = serializers.CharField(allow_null=True)
+  """ Series as the clients know them, also reads Series models """
+  id = serializers.IntegerField(source="show_id")
+  name = serializers.CharField(max_length=255)
+  lastUpdated = serializers.DateTimeField(source="last_updated")
+  status = serializers.CharField(max_length=64)
+  network = serializers.CharField(max_length=255, allow_null=True)
   rating = serializers.FloatField(allow_null=True)
-  nextEp = EpisodeSerializer()
-  prevEp = EpisodeSerializer()
+  nextEp = EpisodeSerializer(source="next_ep")
+  prevEp = EpisodeSerializer(source="prev_ep")
   seasons = serializers.IntegerField()
   episodes = serializers.IntegerField()
 
@@ -0,0 +1,176 @@
+import json
+from importlib import import_module
+
+from django.apps import apps
+from django.test import TestCase
+
+from user.models import User
+from .models import Series, TrackedSeries
+
+migration = import_module("tvsm.migrations.0002_series_list")
+
+def series(id, **fields):
+  return {
+    "id": id,
+    "name": f"Series {id}",
+    "lastUpdated": "2020-05-01T12:00:00Z",
+    "status": "Running",
+    "network": "Network",
+    "rating": 8.5,
+    "nextEp": { "display": "S01E02", "date": "2020-05-08T01:00:00Z" },
+    "prevEp": { "display": "S01E01", "date": "2020-05-01T01:00:00Z" },
+    "seasons": 1,
+    "episodes": 10,
+    **fields,
+  }
+
+class SeriesViewSetTestCase(TestCase):
+  def setUp(self):
+    self.user = User.objects.create(current_user="user")
+    self.client.force_login(self.user)
+
+  def request(self, method, path="", data=None, **headers):
+    return getattr(self.client, method)(f"/api/tvsm/{path}", data and json.dumps(data),
+      content_type="application/json", **headers)
+
+  def stored(self):
+    self.user.refresh_from_db()
+    return self.request("get").json(), self.user.series_version
+
+  def test_replace(self):
+    response = self.request("post", data=[series(1), series(2)])
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response["ETag"], '"1"')
+    self.assertEqual([item["id"] for item in self.stored()[0]], [1, 2])
+    response = self.request("get")
+    self.assertEqual(response["ETag"], '"1"')
+    self.assertEqual(len(response.json()), 2)
+
+  def test_not_modified(self):
+    self.request("post", data=[series(1)])
+    with self.assertNumQueries(2, msg="only the session and the user are loaded"):
+      response = self.request("get", HTTP_IF_NONE_MATCH='"1"')
+    self.assertEqual(response.status_code, 304)
+    self.assertEqual(response["ETag"], '"1"')
+    self.request("delete", "1/")
+    response = self.request("get", HTTP_IF_NONE_MATCH='"1"')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.json(), [])
+
+  def test_series_changes(self):
+    self.request("post", data=[series(1), series(2)])
+    response = self.request("put", "3/", series(0, name="Added"))
+    self.assertEqual(response.json()["id"], 3, msg="the id in the url wins")
+    response = self.request("put", "1/", series(1, name="Replaced"))
+    self.assertEqual(response.json()["name"], "Replaced")
+    response = self.request("patch", "2/", { "rating": 9.1, "nextEp": { "date": None } })
+    self.assertEqual(response.json()["rating"], 9.1)
+    self.assertEqual(response.json()["nextEp"], { "display": "S01E02", "date": None },
+      msg="episodes are updated partially")
+    response = self.request("delete", "1/")
+    self.assertEqual(response.status_code, 204)
+    self.assertEqual(response["ETag"], '"5"')
+
+    stored, version = self.stored()
+    self.assertEqual(version, 5)
+    self.assertEqual([(item["id"], item["name"]) for item in stored], [(2, "Series 2"), (3, "Added")])
+    self.assertEqual(stored[0]["rating"], 9.1)
+
+  def test_errors(self):
+    self.request("post", data=[series(1)])
+    self.assertEqual(self.request("patch", "2/", { "rating": 1 }).status_code, 404)
+    self.assertEqual(self.request("delete", "2/").status_code, 404)
+    self.assertEqual(self.request("patch", "1/", { "rating": "high" }).status_code, 400)
+    self.assertEqual(self.request("put", "2/", { "name": "Incomplete" }).status_code, 400)
+    self.assertEqual(self.stored()[1], 1, msg="failed changes don't change the version")
+
+  def test_lengths(self):
+    long = "x"*256
+    self.assertEqual(self.request("put", "1/", series(1, name=long)).status_code, 400)
+    self.assertEqual(self.request("put", "1/", series(1, nextEp={ "display": long, "date": None })).status_code, 400)
+    self.assertFalse(Series.objects.exists())
+
+  def test_if_match(self):
+    self.request("post", data=[series(1)])
+    response = self.request("patch", "1/", { "rating": 1 }, HTTP_IF_MATCH='"0"')
+    self.assertEqual(response.status_code, 412)
+    self.assertEqual(response["ETag"], '"1"')
+    response = self.request("patch", "1/", { "rating": 1 }, HTTP_IF_MATCH='"1"')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response["ETag"], '"2"')
+    self.assertEqual(self.request("delete", "1/", HTTP_IF_MATCH="nope").status_code, 400)
+
+  def test_list_query(self):
+    self.request("post", data=[series(i) for i in range(50)])
+    self.user.refresh_from_db()
+    with self.assertNumQueries(3, msg="session, user and a single query for the series"):
+      response = self.request("get")
+    self.assertEqual([item["id"] for item in response.json()], list(range(50)))
+    self.assertEqual(response.json()[7], series(7))
+
+  def test_shared_series(self):
+    other = User.objects.create(current_user="other")
+    self.request("post", data=[series(1), series(2)])
+    self.client.force_login(other)
+    self.request("post", data=[series(1), series(2, name="Renamed", lastUpdated="2020-05-02T12:00:00Z"), series(3)])
+    self.assertEqual(Series.objects.count(), 4, msg="the same info is stored once")
+    self.request("patch", "1/", { "name": "Mine" })
+    self.assertEqual([item["name"] for item in self.request("get").json()], ["Mine", "Renamed", "Series 3"])
+    self.client.force_login(self.user)
+    response = self.request("get", HTTP_IF_NONE_MATCH='"1"')
+    self.assertEqual(response.status_code, 304, msg="nobody else changes the user's list")
+    self.assertEqual([item["name"] for item in self.request("get").json()], ["Series 1", "Series 2"])
+    self.assertEqual(Series.objects.get(show_id=1, name="Series 1").trackers.count(), 1)
+    self.assertEqual(TrackedSeries.objects.filter(user=other).count(), 3)
+
+  def test_orphans_deleted(self):
+    other = User.objects.create(current_user="other")
+    self.request("post", data=[series(1), series(2)])
+    for day in range(2, 5):
+      self.request("patch", "1/", { "lastUpdated": f"2020-05-0{day}T12:00:00Z" })
+    self.assertEqual(Series.objects.count(), 2, msg="replaced info is deleted")
+    self.client.force_login(other)
+    self.request("post", data=[series(2)])
+    self.client.force_login(self.user)
+    self.request("delete", "2/")
+    self.assertEqual(Series.objects.filter(show_id=2).count(), 1, msg="info someone else tracks is kept")
+    self.client.force_login(other)
+    self.request("post", data=[])
+    self.assertEqual(list(Series.objects.values_list("show_id", flat=True)), [1])
+
+  def test_concurrent_changes(self):
+    self.request("post", data=[series(1)])
+    self.request("put", "2/", series(2))
+    self.request("put", "3/", series(3), HTTP_IF_MATCH='"2"')
+    stored, version = self.stored()
+    self.assertEqual([item["id"] for item in stored], [1, 2, 3],
+      msg="changes without If-Match are all kept")
+    self.assertEqual(version, 3)
+
+class SeriesMigrationTestCase(TestCase):
+  def test_forwards_and_backwards(self):
+    first = User.objects.create(series_list=json.dumps([series(1), series(2, name="Old")]))
+    second = User.objects.create(series_list=json.dumps([
+      series(2, name="New", lastUpdated="2020-05-02T12:00:00Z"), series(3), series(3),
+    ]))
+    User.objects.create()
+    legacy = User.objects.create(series_list=json.dumps([
+      series(4, name="x"*300, status=None, network=None, nextEp={ "display": None, "date": None }, seasons=None),
+    ]))
+    migration.forwards(apps, None)
+    info = legacy.tracked_series.get().series
+    self.assertEqual((len(info.name), info.status, info.network, info.next_ep_display, info.seasons), (255, "", None, "", 0),
+      msg="legacy values are made to fit the columns")
+    legacy.delete()
+    info.delete()
+    self.assertEqual(Series.objects.count(), 4, msg="the same info is stored once")
+    self.assertEqual(list(second.tracked_series.order_by("position").values_list("show_id", "series__name")), [(2, "New"), (3, "Series 3")])
+    self.assertEqual(list(first.tracked_series.order_by("position").values_list("show_id", "series__name")), [(1, "Series 1"), (2, "Old")])
+
+    first.tracked_series.filter(show_id=2).delete()
+    second.tracked_series.all().delete()
+    migration.backwards(apps, None)
+    first.refresh_from_db(fields=["series_list"])
+    second.refresh_from_db(fields=["series_list"])
+    self.assertEqual(second.series_list, "[]", msg="emptied lists stay empty")
+    self.assertEqual(json.loads(first.series_list), [series(1)])
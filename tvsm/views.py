@@ -1,12 +1,36 @@
-import json
-
-from django.http import HttpResponse
-from rest_framework import viewsets, mixins
+from django.db import transaction
+from django.db.models import F, Max
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework import viewsets, mixins, status
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 
+from user.models import User
+from .models import Series, TrackedSeries, series_digest
 from .serializers import SeriesSerializer
 
+def etag(version):
+  """ Entity tag for a version of the series list """
+  return f'"{version}"'
+
+def parse_etag(header):
+  """ Version in an If-Match header.
+
+  :param str header: Header value, e.g. "3" or W/"3"
+
+  :return int: Version or None for any version """
+  value = header.strip()
+  if value in ("", "*"):
+    return None
+  if value.startswith("W/"):
+    value = value[2:]
+  try:
+    return int(value.strip('"'))
+  except ValueError:
+    raise ValidationError({"If-Match": f"Invalid series list version {header}."})
+
 # ViewSets define the view behavior.
 class SeriesViewSet(mixins.ListModelMixin,
                     mixins.CreateModelMixin,
@@ -14,18 +38,151 @@ class SeriesViewSet(mixins.ListModelMixin,
   serializer_class = SeriesSerializer
   permission_classes = [IsAuthenticated]
 
+  def get_queryset(self):
+    """ Series tracked by the current user in their order """
+    return Series.objects.filter(trackers__user=self.request.user).order_by("trackers__position")
+
   def list(self, request):
     """ Retrieving user's series list
     GET /api/tvsm/ """
-    return HttpResponse(request.user.series_list, content_type="application/json")
+    version = etag(request.user.series_version)
+    response = (get_conditional_response(request, etag=version) or
+      Response(self.get_serializer(self.get_queryset(), many=True).data))
+    response["ETag"] = version
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
   def create(self, request):
-    """ Updating user's series list
+    """ Replacing user's series list
     POST /api/tvsm/ """
-    user = request.user
     serializer = self.get_serializer(data=request.data, many=True)
     serializer.is_valid(raise_exception=True)
-    user.series_list = json.dumps(serializer.data)
-    user.save()
-    headers = self.get_success_headers(serializer.data)
-    return Response(serializer.data, headers=headers)
+    def replace():
+      series = self.store(serializer.validated_data)
+      TrackedSeries.objects.filter(user=request.user).delete()
+      TrackedSeries.objects.bulk_create(
+        TrackedSeries(user=request.user, show_id=show_id, series_id=series_id, position=position)
+        for position, (show_id, series_id) in enumerate(series.items(), 1)
+      )
+      return self.get_serializer(self.get_queryset(), many=True).data
+    return self.change(request, replace)
+
+  def update(self, request, pk=None):
+    """ Adding or replacing a series
+    PUT /api/tvsm/{id}/ """
+    show_id = self.show_id(pk)
+    serializer = self.get_serializer(data={ **request.data, "id": show_id })
+    serializer.is_valid(raise_exception=True)
+    def put():
+      series_id = self.store([serializer.validated_data])[show_id]
+      self.track(request.user, show_id, series_id)
+      return self.get_serializer(Series.objects.get(pk=series_id)).data
+    return self.change(request, put)
+
+  def partial_update(self, request, pk=None):
+    """ Updating some fields of a series
+    PATCH /api/tvsm/{id}/ """
+    show_id = self.show_id(pk)
+    def patch():
+      series = self.get_queryset().filter(show_id=show_id).first()
+      if series is None: raise Http404
+      serializer = self.get_serializer(data=self.merge(self.get_serializer(series).data, request.data))
+      serializer.is_valid(raise_exception=True)
+      series_id = self.store([serializer.validated_data])[show_id]
+      self.track(request.user, show_id, series_id)
+      return self.get_serializer(Series.objects.get(pk=series_id)).data
+    return self.change(request, patch)
+
+  def destroy(self, request, pk=None):
+    """ Removing a series
+    DELETE /api/tvsm/{id}/ """
+    show_id = self.show_id(pk)
+    def remove():
+      deleted, _ = TrackedSeries.objects.filter(user=request.user, show_id=show_id).delete()
+      if not deleted: raise Http404
+    return self.change(request, remove, status_code=status.HTTP_204_NO_CONTENT)
+
+  def change(self, request, apply, status_code=status.HTTP_200_OK):
+    """ Changing user's series list.
+    The version is increased before applying the change, which keeps the
+    user row locked until it's done so the user's changes never overlap.
+    With an If-Match header the change is rejected when the version
+    isn't the given one. Series info nobody tracks anymore after the
+    change is deleted along with it.
+
+    :param Callable[[], any] apply: Changes the list and returns the response data
+
+    :return Response: Response with the new version as ETag """
+    expected = parse_etag(request.headers.get("If-Match", "*"))
+    users = User.objects.filter(pk=request.user.pk)
+    with transaction.atomic():
+      current = users if expected is None else users.filter(series_version=expected)
+      changed = current.update(series_version=F("series_version") + 1)
+      tracked = list(TrackedSeries.objects.filter(user=request.user).values_list("series_id", flat=True))
+      data = apply() if changed else None
+      Series.objects.filter(pk__in=tracked, trackers__isnull=True).delete()
+      version = users.values_list("series_version", flat=True).get()
+    if not changed:
+      return Response({
+        "status_code": 412,
+        "error": "Precondition Failed",
+        "message": "The series list changed, get the latest version and try again.",
+      }, status=412, headers={ "ETag": etag(version) })
+    request.user.series_version = version
+    return Response(data, status=status_code, headers={ "ETag": etag(version) })
+
+  def store(self, items):
+    """ Saving series info. Stored rows are never changed so nobody
+    changes the info others see, info that isn't stored yet gets a new
+    row shared with everyone sending the same info later.
+
+    :param list items: Validated series
+
+    :return dict: Series row by show id in the given order,
+    the last info given for a show wins """
+    digests = {}
+    for data in items:
+      fields = self.series_fields(data)
+      digests[data["show_id"]] = series_digest(data["show_id"], fields), fields
+    ids = dict(Series.objects.filter(digest__in=[digest for digest, _ in digests.values()]).values_list("digest", "id"))
+    missing = { digest: (show_id, fields) for show_id, (digest, fields) in digests.items() if digest not in ids }
+    if missing:
+      Series.objects.bulk_create(
+        [Series(show_id=show_id, digest=digest, **fields) for digest, (show_id, fields) in missing.items()],
+        ignore_conflicts=True,
+      )
+      ids.update(Series.objects.filter(digest__in=list(missing)).values_list("digest", "id"))
+    return { show_id: ids[digest] for show_id, (digest, _) in digests.items() }
+
+  def series_fields(self, data):
+    """ Series model fields from a validated series """
+    values = { field: value for field, value in data.items() if field not in ("show_id", "next_ep", "prev_ep") }
+    for episode in ("next_ep", "prev_ep"):
+      values[f"{episode}_display"] = data[episode]["display"]
+      values[f"{episode}_date"] = data[episode]["date"]
+    return values
+
+  def track(self, user, show_id, series_id):
+    """ Pointing a show in the user's list to some series info,
+    the show is added at the end of the list if it isn't there """
+    tracked = TrackedSeries.objects.filter(user=user)
+    if not tracked.filter(show_id=show_id).update(series_id=series_id):
+      position = tracked.aggregate(last=Max("position"))["last"] or 0
+      TrackedSeries.objects.create(user=user, show_id=show_id, series_id=series_id, position=position + 1)
+
+  def merge(self, series, fields):
+    """ Series with some fields updated, episodes can be updated partially too """
+    return {
+      **series,
+      **{
+        field: { **series.get(field, {}), **value } if isinstance(value, dict) and isinstance(series.get(field), dict) else value
+        for field, value in fields.items()
+      },
+      "id": series["id"],
+    }
+
+  def show_id(self, pk):
+    try:
+      return int(pk)
+    except ValueError:
+      raise Http404
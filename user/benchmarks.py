@@ -0,0 +1,56 @@
+""" Benchmarks for the user endpoints.
+
+  python manage.py benchmark user_request
+"""
+import json
+from types import ModuleType
+
+from django.db import connection
+from django.urls import path, include
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import routers
+
+from stuff7.utils.benchmark import measure, test_environment, selected_bytes
+
+# Legacy series list the size of a user tracking a few hundred shows
+series_list = json.dumps([{
+  "id": i,
+  "name": f"Series {i}",
+  "lastUpdated": "2020-05-01T12:00:00Z",
+  "status": "Running",
+  "network": "Network",
+  "rating": 8.5,
+  "nextEp": { "display": "S01E02", "date": "2020-05-08T01:00:00Z" },
+  "prevEp": { "display": "S01E01", "date": "2020-05-01T01:00:00Z" },
+  "seasons": 1,
+  "episodes": 10,
+} for i in range(300)])
+
+def user_request():
+  """ GET /api/users/current/ for a user with a long legacy series list,
+  bytes is what the database sends back during the whole request """
+  from .models import User
+  from .views import UserViewSet
+  # Only the user endpoints, the provider clients aren't needed
+  router = routers.DefaultRouter()
+  router.register("users", UserViewSet)
+  urls = ModuleType("urls")
+  urls.urlpatterns = [path("api/", include(router.urls))]
+  with test_environment(), override_settings(ROOT_URLCONF=urls):
+    user = User.objects.create(current_user="someone", series_list=series_list)
+    client = Client()
+    client.force_login(user)
+    with CaptureQueriesContext(connection) as queries:
+      client.get("/api/users/current/")
+    # Every request clears the query log, so it's read before measuring
+    captured = queries.captured_queries
+    return {
+      **measure(lambda: client.get("/api/users/current/")),
+      "queries": len(captured),
+      "bytes": selected_bytes(captured),
+    }
+
+benchmarks = {
+  "user_request": user_request,
+}
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-17 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='series_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-17 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0002_series_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='profile_hash',
+            field=models.CharField(default='', max_length=40),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.0.14 on 2026-10-17 18:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_profile_hash'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='user',
+            options={'base_manager_name': 'objects'},
+        ),
+    ]
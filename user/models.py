@@ -1,7 +1,17 @@
+import json
+from hashlib import sha1
+
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.db import models
 from stuff7.settings import LANGUAGES
 
+class UserManager(models.Manager):
+  """ Users are loaded on every authenticated request (and through every
+  OAuth user) without series_list, it's only read when accessed.
+  refresh_from_db() needs fields=["series_list"] to reload it. """
+  def get_queryset(self):
+    return super().get_queryset().defer("series_list")
+
 class User(AbstractBaseUser, PermissionsMixin):
   USERNAME_FIELD = "id"
 
@@ -9,15 +19,49 @@ class User(AbstractBaseUser, PermissionsMixin):
   language = models.CharField(max_length=8, choices=LANGUAGES, default="en-US")
   palette = models.CharField(default="dark:#3f51b5:#f50057",max_length=32)
 
-  """ This will store the list of series the user has saved
-  in a JSON string.
-  There's no need to add columns to the database since it's
-  only gonna be read/written and never queried.
-  Validation of this data will be done in the view using DRF. """
+  """ Legacy list of series the user has saved in a JSON string.
+  The series now live in the tvsm Series and TrackedSeries tables,
+  this is only kept to be able to roll back their migration. """
   series_list = models.TextField(default="[]")
+  # Increased on every change to the user's series, clients send it
+  # back in If-Match so concurrent changes don't overwrite each other
+  series_version = models.PositiveIntegerField(default=0)
+  # Hash of everything shown in the user profile (see profile_fields),
+  # used as the ETag of /api/users/current/
+  profile_hash = models.CharField(max_length=40, default="")
 
   password = None
 
+  objects = UserManager()
+
+  # Fields shown in the user profile along with its linked OAuth users
+  profile_fields = ("id", "current_user", "language", "palette")
+  profile_oauth_fields = ("id", "login_id", "provider", "login", "display_name", "thumbnail")
+
+  def save(self, *args, **kwargs):
+    """ Saving user keeping the profile hash up to date """
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None and not set(update_fields) & set(self.profile_fields):
+      return super().save(*args, **kwargs)
+    if self.pk is None:
+      super().save(*args, **kwargs)
+      return self.update_profile_hash()
+    self.profile_hash = self.profile_digest()
+    if update_fields is not None:
+      kwargs["update_fields"] = {*update_fields, "profile_hash"}
+    super().save(*args, **kwargs)
+
+  def profile_digest(self):
+    """ Hash of the current profile, linked OAuth users are read from the database """
+    profiles = self.oauthuser_set.order_by("id").values_list(*self.profile_oauth_fields)
+    data = [[getattr(self, field) for field in self.profile_fields], list(profiles)]
+    return sha1(json.dumps(data, default=str).encode()).hexdigest()
+
+  def update_profile_hash(self):
+    """ Storing the hash of the current profile (e.g. after linking an OAuth user) """
+    self.profile_hash = self.profile_digest()
+    User.objects.filter(pk=self.pk).update(profile_hash=self.profile_hash)
+
   def __str__(self):
     return (
       f"User#{self.id}<"
@@ -28,3 +72,4 @@ class User(AbstractBaseUser, PermissionsMixin):
 
   class Meta:
     db_table = "User"
+    base_manager_name = "objects"
@@ -1,3 +1,78 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from oauth.models import OAuthUser
+from .models import User
+
+class UserETagTestCase(TestCase):
+  def setUp(self):
+    self.oauth = OAuthUser(id="twitch:1", login_id=1, provider="twitch", token="{}",
+      login="someone", display_name="Someone", thumbnail="someone.png")
+    self.oauth.save()
+    self.user = User.objects.get(pk=self.oauth.user_id)
+    self.client.force_login(self.user)
+
+  def get(self, **headers):
+    return self.client.get("/api/users/current/", **headers)
+
+  def test_not_modified(self):
+    response = self.get()
+    etag = response["ETag"]
+    self.assertEqual(etag, f'"{self.user.profile_hash}"')
+    self.assertEqual(response.json()["profiles"][0]["display_name"], "Someone")
+    with self.assertNumQueries(2, msg="only the session and the user are loaded"):
+      response = self.get(HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 304)
+    self.assertEqual(response["ETag"], etag)
+    self.assertEqual(response.content, b"")
+
+  def test_changes(self):
+    etags = { self.get()["ETag"] }
+    self.client.patch("/api/users/current/", { "palette": "light:#000:#fff" }, content_type="application/json")
+    etags.add(self.get()["ETag"])
+    self.oauth.display_name = "SomeoneElse"
+    self.oauth.save()
+    response = self.get(HTTP_IF_NONE_MATCH=",".join(etags))
+    self.assertEqual(response.status_code, 200, msg="linked OAuth users are part of the profile")
+    self.assertEqual(response.json()["profiles"][0]["display_name"], "SomeoneElse")
+    self.assertNotIn(response["ETag"], etags)
+    self.user.last_login = None
+    self.user.save(update_fields=["last_login"])
+    self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+  def test_missing_hash(self):
+    User.objects.filter(pk=self.user.pk).update(profile_hash="")
+    etag = self.get()["ETag"]
+    self.assertNotEqual(etag, '""', msg="users saved before the hash existed get one")
+    self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+  def test_anonymous(self):
+    self.client.logout()
+    response = self.get()
+    self.assertFalse(response.has_header("ETag"))
+    self.assertFalse(response.json()["is_authenticated"])
+
+class SeriesListTestCase(TestCase):
+  def setUp(self):
+    self.oauth = OAuthUser(id="twitch:1", login_id=1, provider="twitch", token="{}",
+      login="someone", display_name="Someone", thumbnail="someone.png")
+    self.oauth.save()
+    User.objects.filter(pk=self.oauth.user_id).update(series_list='[{"id": 1}]')
+    self.client.force_login(self.oauth.user)
+
+  def test_not_loaded(self):
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get("/api/users/current/")
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(queries.captured_queries)
+    for query in queries.captured_queries:
+      self.assertNotIn("series_list", query["sql"])
+
+  def test_kept_on_save(self):
+    user = OAuthUser.objects.get(pk=self.oauth.pk).user
+    user.current_user = "twitch:2"
+    with CaptureQueriesContext(connection) as queries:
+      user.save()
+    self.assertFalse(any("series_list" in query["sql"] for query in queries.captured_queries))
+    self.assertEqual(user.series_list, '[{"id": 1}]', msg="still loaded when accessed")
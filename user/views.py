@@ -1,4 +1,5 @@
 from django.http import JsonResponse, Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
 from rest_framework import viewsets, mixins
 from rest_framework.response import Response
 from django.utils.translation import get_language_from_request
@@ -18,6 +19,16 @@ class UserViewSet(mixins.RetrieveModelMixin,
     """ Retrieving current logged in user
     GET /api/users/current/ """
     if pk != "current": raise Http404
+    user = request.user
+    if user.is_authenticated:
+      # Answering with the stored profile hash, nothing is rendered when unchanged
+      if not user.profile_hash: user.update_profile_hash()
+      etag = f'"{user.profile_hash}"'
+      response = (get_conditional_response(request, etag=etag) or
+        Response(self.get_serializer(self.get_object()).data))
+      response["ETag"] = etag
+      patch_cache_control(response, private=True, no_cache=True)
+      return response
     serializer = self.get_serializer(self.get_object())
     return Response(serializer.data)
 